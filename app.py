@@ -1,5 +1,7 @@
 # --- MODIFIED FILE: app.py ---
 import os
+import json
+import hashlib
 import signal
 import threading
 import time # Yuuka: Thêm time để tạo version cho cache
@@ -10,6 +12,8 @@ from flask_sock import Sock # Yuuka: PvP game feature v1.0 - Thư viện cho Web
 
 from core.plugin_manager import PluginManager
 from core.data_manager import DataManager
+from core.compression import CompressionMiddleware
+from core.startup_profiler import startup_profiler # Yuuka: startup profiler v1.0
 
 # --- Flask App Initialization ---
 app = Flask(__name__)
@@ -20,8 +24,37 @@ app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 0
 # --- Core Services Initialization ---
 data_manager = DataManager('data_cache')
 plugin_manager = PluginManager('plugins', app, data_manager)
+
+# Yuuka: response compression v1.0 - Cấu hình đọc từ data_cache/server_config.json
+server_config = data_manager.read_json('server_config.json', default_value={})
+if not isinstance(server_config, dict):
+    server_config = {}
+_compression_cfg = server_config.get('compression') if isinstance(server_config.get('compression'), dict) else {}
+compression_middleware = None
+if _compression_cfg.get('enabled', True):
+    compression_middleware = CompressionMiddleware(
+        app.wsgi_app,
+        min_size=_compression_cfg.get('min_size', 1024),
+        level=_compression_cfg.get('level', 6),
+        cache_entries=_compression_cfg.get('cache_entries', 32),
+        enable_brotli=_compression_cfg.get('brotli', True),
+    )
+    app.wsgi_app = compression_middleware
 atexit.register(lambda: _perform_graceful_shutdown('atexit'))
 
+# Yuuka: startup profiler v1.0 - "startup_profile": {"track_imports": true} bật đo import theo từng plugin
+_startup_profile_cfg = server_config.get('startup_profile') if isinstance(server_config.get('startup_profile'), dict) else {}
+if _startup_profile_cfg.get('track_imports'):
+    startup_profiler.track_imports = True
+
+# Yuuka: production server v1.0 - Server đang chạy ở chế độ production (nếu có) để drain khi nhận signal
+_active_server = None
+
+def register_active_server(server):
+    """Called by the production runner so termination signals drain instead of killing mid-request."""
+    global _active_server
+    _active_server = server
+
 def _handle_termination_signal(signum, frame):
     label_map = {}
     if hasattr(signal, 'SIGINT'):
@@ -32,6 +65,18 @@ def _handle_termination_signal(signum, frame):
         label_map[signal.SIGBREAK] = 'SIGBREAK'
 
     label = label_map.get(signum, f'signal {signum}')
+    server = _active_server
+    if server is not None and not server.is_draining:
+        # Production mode: stop accepting, let in-flight requests finish, the runner then shuts down.
+        # A second signal falls through to the hard path below.
+        print(f"[Server] {label} received, draining in-flight requests...")
+        server.begin_drain()
+        try:
+            # Event stream là kết nối sống lâu, đóng ngay để drain không phải chờ hết timeout
+            plugin_manager.core_api.generation_service.event_bus.close_all()
+        except Exception:
+            pass
+        return
     _perform_graceful_shutdown(label)
     try:
         signal.signal(signum, signal.SIG_DFL)
@@ -160,10 +205,54 @@ def handle_auth_logout():
     """Xử lý đăng xuất.""" # Yuuka: auth rework v1.0 - Logic server-side không còn cần thiết
     return plugin_manager.core_api.logout()
 
+# Yuuka: response compression v1.0 - Cache body JSON cho các payload bất biến (tags, characters)
+_immutable_json_cache = {}
+_immutable_json_lock = threading.Lock()
+
+def _immutable_json_response(cache_key, source, build_payload):
+    """
+    Serialize một payload lớn chỉ một lần cho mỗi object nguồn và gắn ETag cố định,
+    để middleware nén có thể tái sử dụng body đã nén và client nhận 304 khi không đổi.
+    """
+    with _immutable_json_lock:
+        cached = _immutable_json_cache.get(cache_key)
+        if not cached or cached[0] is not source:
+            body = json.dumps(build_payload(source), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            etag = hashlib.md5(body).hexdigest()
+            cached = (source, body, etag)
+            _immutable_json_cache[cache_key] = cached
+    _, body, etag = cached
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
 @app.route('/api/characters')
 def get_characters():
     """API lấy danh sách tất cả nhân vật đã được xử lý."""
-    return jsonify({ "characters": plugin_manager.core_api.get_all_characters_list() })
+    return _immutable_json_response(
+        'characters',
+        plugin_manager.core_api.get_all_characters_list(),
+        lambda chars: {"characters": chars},
+    )
+
+@app.route('/api/characters/search')
+def search_characters():
+    """API tìm kiếm nhân vật (exact/prefix/series/gần đúng) có phân trang."""
+    query = request.args.get('q', '')
+    try:
+        page = max(1, int(request.args.get('page', 1)))
+        page_size = max(1, min(200, int(request.args.get('page_size', 50))))
+    except (TypeError, ValueError):
+        abort(400, "Invalid input: 'page' and 'page_size' must be integers.")
+    total, results = plugin_manager.core_api.search_characters(query, (page - 1) * page_size, page_size)
+    return jsonify({
+        "query": query,
+        "page": page,
+        "page_size": page_size,
+        "total": total,
+        "characters": results,
+    })
 
 @app.route('/api/characters/by_hashes', methods=['POST'])
 def get_characters_by_hashes():
@@ -206,7 +295,18 @@ def get_user_preview_image(filename):
 @app.route('/api/tags')
 def get_tags():
     """API lấy danh sách các tag đã được sắp xếp để dùng cho tiên đoán."""
-    return jsonify(plugin_manager.core_api.get_tag_predictions())
+    return _immutable_json_response('tags', plugin_manager.core_api.get_tag_predictions(), lambda tags: tags)
+
+@app.route('/api/tags/suggest')
+def suggest_tags():
+    """API gợi ý tag theo prefix/infix, sắp theo độ phổ biến (thay cho việc tải toàn bộ /api/tags)."""
+    query = request.args.get('q', '')
+    try:
+        limit = max(1, min(100, int(request.args.get('limit', 20))))
+    except (TypeError, ValueError):
+        limit = 20
+    exclude = [part for part in request.args.get('exclude', '').split(',') if part.strip()]
+    return jsonify(plugin_manager.core_api.suggest_tags(query, limit, exclude=exclude))
 
 @app.route('/api/comfyui/status', methods=['GET'])
 def comfyui_status():
@@ -318,6 +418,160 @@ def get_generation_status():
     except Exception as e:
         return jsonify({"error": str(e)}), 401
 
+# Yuuka: batch generation v1.0 - Seed sweep / prompt matrix trong một lần gửi
+@app.route('/api/core/generate/batch', methods=['POST'])
+def start_generation_batch():
+    """
+    Body: {character_hash, generation_config, context?, variants?: [{...}], seeds?: N | [seed, ...],
+    matrix?: {field: [values]}}. Trả về batch job (batch_id, task_ids, total_images, ...).
+    """
+    try:
+        user_hash = plugin_manager.core_api.verify_token_and_get_user_hash()
+    except Exception as auth_error:
+        return jsonify({"error": str(auth_error)}), 401
+
+    data = request.json or {}
+    character_hash = data.get('character_hash')
+    gen_config = data.get('generation_config')
+    if not character_hash or not isinstance(gen_config, dict):
+        abort(400, "Missing character_hash or generation_config.")
+    if not any(data.get(key) for key in ('variants', 'seeds', 'matrix')):
+        abort(400, "Provide at least one of variants, seeds or matrix.")
+    try:
+        batch, message = plugin_manager.core_api.generation_service.start_batch(
+            user_hash, character_hash, gen_config, data.get('context', {}),
+            variants=data.get('variants'), seeds=data.get('seeds'), matrix=data.get('matrix'),
+        )
+    except ValueError as e:
+        abort(400, str(e))
+    if not batch:
+        return jsonify({"error": message}), 429
+    return jsonify({"status": "started", "message": message, **batch})
+
+@app.route('/api/core/generate/batch/<batch_id>', methods=['GET'])
+def get_generation_batch(batch_id):
+    """Tiến độ tổng của một batch job."""
+    try:
+        user_hash = plugin_manager.core_api.verify_token_and_get_user_hash()
+    except Exception as auth_error:
+        return jsonify({"error": str(auth_error)}), 401
+    batch = plugin_manager.core_api.generation_service.get_batch_status(user_hash, batch_id)
+    if not batch:
+        abort(404, "Batch not found.")
+    return jsonify(batch)
+
+# Yuuka: generation metrics v1.0 - p50/p95 theo pha và theo node
+@app.route('/api/core/generate/metrics', methods=['GET'])
+def get_generation_metrics():
+    """
+    Query: group_by=workflow,checkpoint,resolution,steps,server (mặc định tất cả), since=<giây>,
+    và lọc theo workflow / checkpoint / resolution / steps / server.
+    """
+    try:
+        plugin_manager.core_api.verify_token_and_get_user_hash()
+    except Exception as auth_error:
+        return jsonify({"error": str(auth_error)}), 401
+
+    group_by = [g.strip() for g in (request.args.get('group_by') or '').split(',') if g.strip()] or None
+    since = request.args.get('since', type=float)
+    filters = {key: request.args.get(key) for key in ('workflow', 'checkpoint', 'resolution', 'steps', 'server') if request.args.get(key)}
+    return jsonify(plugin_manager.core_api.generation_service.get_metrics(group_by=group_by, since=since, filters=filters))
+
+@app.route('/api/core/generate/batch/<batch_id>/cancel', methods=['POST'])
+def cancel_generation_batch(batch_id):
+    try:
+        user_hash = plugin_manager.core_api.verify_token_and_get_user_hash()
+    except Exception as auth_error:
+        return jsonify({"error": str(auth_error)}), 401
+    if plugin_manager.core_api.generation_service.cancel_batch(user_hash, batch_id):
+        return jsonify({"status": "success", "message": "Đã yêu cầu hủy batch."})
+    return jsonify({"error": "Không tìm thấy batch đang chạy để hủy."}), 404
+
+# Yuuka: generation event stream v1.0 - Server-Sent Events thay cho poll /status
+GENERATION_STREAM_KEEPALIVE = 15.0
+
+def _format_sse(event_type, data, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event_type}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False, separators=(',', ':'))}")
+    return "\n".join(lines) + "\n\n"
+
+@app.route('/api/core/generate/stream/ticket', methods=['POST'])
+def issue_generation_stream_ticket():
+    """Vé dùng một lần cho ?ticket= của /api/core/generate/stream (EventSource không gửi được header)."""
+    try:
+        user_hash = plugin_manager.core_api.verify_token_and_get_user_hash()
+    except Exception as e:
+        return jsonify({"error": str(e)}), 401
+    ticket = plugin_manager.core_api.issue_stream_ticket(user_hash)
+    return jsonify({"ticket": ticket, "expires_in": plugin_manager.core_api.STREAM_TICKET_TTL})
+
+@app.route('/api/core/generate/stream', methods=['GET'])
+def stream_generation_events():
+    """
+    Luồng sự kiện tạo ảnh của user (text/event-stream).
+    Xác thực bằng header Authorization hoặc `?ticket=` lấy từ /api/core/generate/stream/ticket
+    (không nhận token trong URL vì sẽ lọt vào access log / lịch sử trình duyệt).
+    Mở đầu bằng `snapshot` (toàn bộ task) hoặc, khi có Last-Event-ID / ?since= hợp lệ, chỉ các sự kiện bị lỡ.
+    Sau đó: `task` / `batch` (chỉ trường thay đổi), `task_removed`, IMAGE_SAVED, VIDEO_SAVED...
+    Không xoá event/task như /status nên nhiều tab/client dùng chung được.
+    """
+    try:
+        ticket = request.args.get('ticket')
+        if ticket:
+            user_hash = plugin_manager.core_api.redeem_stream_ticket(ticket)
+        else:
+            user_hash = plugin_manager.core_api.verify_token_and_get_user_hash()
+    except Exception as auth_error:
+        abort(401, description=str(auth_error))
+
+    since_raw = request.headers.get('Last-Event-ID') or request.args.get('since')
+    try:
+        since = int(since_raw) if since_raw else None
+    except (TypeError, ValueError):
+        since = None
+
+    service = plugin_manager.core_api.generation_service
+
+    def _generate():
+        # Đăng ký trước khi chụp snapshot để không lỡ sự kiện ở giữa; trùng lặp được lọc bằng seq
+        subscription = service.subscribe_events(user_hash)
+        try:
+            backlog = service.event_bus.events_since(user_hash, since) if since is not None else None
+            if backlog is None:
+                sent_seq, tasks, batches = service.get_stream_snapshot(user_hash)
+                yield _format_sse("snapshot", {"seq": sent_seq, "tasks": tasks, "batches": batches}, sent_seq)
+            else:
+                sent_seq = since
+                for event in backlog:
+                    sent_seq = event["seq"]
+                    yield _format_sse(event["type"], event["data"], sent_seq)
+            while True:
+                event = subscription.get(timeout=GENERATION_STREAM_KEEPALIVE)
+                if subscription.reset_overflow():
+                    # Client đọc quá chậm, hàng đợi đã tràn: gửi lại trạng thái đầy đủ
+                    sent_seq, tasks, batches = service.get_stream_snapshot(user_hash)
+                    yield _format_sse("snapshot", {"seq": sent_seq, "tasks": tasks, "batches": batches}, sent_seq)
+                    continue
+                if event is None:
+                    if subscription.closed:
+                        return
+                    yield ": keepalive\n\n"
+                    continue
+                if event["seq"] <= sent_seq:
+                    continue
+                sent_seq = event["seq"]
+                yield _format_sse(event["type"], event["data"], sent_seq)
+        finally:
+            subscription.close()
+
+    response = Response(_generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 @app.route('/api/core/generate/cancel', methods=['POST'])
 def cancel_generation():
     """Hủy một tác vụ đang chạy."""
@@ -487,6 +741,17 @@ def _perform_graceful_shutdown(reason: str = None):
     except Exception as plugin_err:
         print(f"[Server] Warning while shutting down plugins: {plugin_err}")
 
+    try:
+        plugin_manager.core_api.generation_service.shutdown()
+    except Exception as sched_err:
+        print(f"[Server] Warning while stopping generation scheduler: {sched_err}")
+
+    try:
+        plugin_manager.core_api.comfy_event_hub.shutdown()
+        plugin_manager.core_api.generation_service.event_bus.close_all()
+    except Exception as hub_err:
+        print(f"[Server] Warning while closing ComfyUI event hub: {hub_err}")
+
 @app.route('/api/server/background_tasks', methods=['GET'])
 def get_background_task_status_endpoint():
     """Return background task status for debugging (requires authentication)."""
@@ -497,10 +762,79 @@ def get_background_task_status_endpoint():
 
     plugin_id = request.args.get('plugin_id')
     return jsonify(plugin_manager.get_background_task_status(plugin_id))
+
+@app.route('/api/server/generation_stats', methods=['GET'])
+def get_generation_scheduler_stats_endpoint():
+    """Return generation scheduler queue/wait metrics (requires authentication)."""
+    try:
+        plugin_manager.core_api.verify_token_and_get_user_hash()
+    except Exception as auth_error:
+        abort(401, description=str(auth_error))
+
+    return jsonify(plugin_manager.core_api.generation_service.get_scheduler_stats())
+
+@app.route('/api/server/comfy_events', methods=['GET'])
+def get_comfy_event_hub_stats_endpoint():
+    """Return shared ComfyUI websocket connection stats (requires authentication)."""
+    try:
+        plugin_manager.core_api.verify_token_and_get_user_hash()
+    except Exception as auth_error:
+        abort(401, description=str(auth_error))
+
+    return jsonify(plugin_manager.core_api.comfy_event_hub.get_stats())
+
+@app.route('/api/server/comfy_catalog', methods=['GET'])
+def get_comfy_catalog_stats_endpoint():
+    """Return cached ComfyUI object_info catalog stats (requires authentication)."""
+    try:
+        plugin_manager.core_api.verify_token_and_get_user_hash()
+    except Exception as auth_error:
+        abort(401, description=str(auth_error))
+
+    return jsonify(plugin_manager.core_api.comfy_api_client.get_object_info_cache_stats())
+
+@app.route('/api/server/http_stats', methods=['GET'])
+def get_http_server_stats_endpoint():
+    """Return production HTTP server pool metrics (requires authentication)."""
+    try:
+        plugin_manager.core_api.verify_token_and_get_user_hash()
+    except Exception as auth_error:
+        abort(401, description=str(auth_error))
+
+    if _active_server is None:
+        return jsonify({"mode": "development"})
+    return jsonify({"mode": "production", **_active_server.get_stats()})
+
+@app.route('/api/server/compression_stats', methods=['GET'])
+def get_compression_stats_endpoint():
+    """Return response compression metrics (requires authentication)."""
+    try:
+        plugin_manager.core_api.verify_token_and_get_user_hash()
+    except Exception as auth_error:
+        abort(401, description=str(auth_error))
+
+    if compression_middleware is None:
+        return jsonify({"enabled": False})
+    return jsonify({"enabled": True, **compression_middleware.get_stats()})
+
+@app.route('/api/server/startup_profile', methods=['GET'])
+def get_startup_profile_endpoint():
+    """Return boot phase timings and per-plugin load costs (requires authentication)."""
+    try:
+        plugin_manager.core_api.verify_token_and_get_user_hash()
+    except Exception as auth_error:
+        abort(401, description=str(auth_error))
+
+    report = startup_profiler.get_report()
+    report["lazy_plugins"] = plugin_manager.get_lazy_plugin_stats() # Yuuka: lazy activation v1.0
+    return jsonify(report)
 # === Server Control ===
 def _shutdown_server():
     print('Yuuka: Nhan duoc lenh tat server. Tam biet senpai!')
     _perform_graceful_shutdown('timer')
+    if _active_server is not None:
+        _active_server.begin_drain()
+        return
     os.kill(os.getpid(), signal.SIGINT)
 
 @app.route('/api/server/shutdown', methods=['POST'])
@@ -519,8 +853,13 @@ def server_shutdown():
 # === YUUKA: NEW SERVER INITIALIZATION FUNCTION v1.0 ===
 def initialize_server():
     """Tải dữ liệu lõi và các plugin."""
-    plugin_manager.core_api.load_core_data()
-    plugin_manager.load_plugins()
+    with startup_profiler.phase("load_core_data"):
+        plugin_manager.core_api.load_core_data()
+    with startup_profiler.phase("load_plugins"):
+        plugin_manager.load_plugins()
+    # Yuuka: task journal v1.0 - Chỉ nhận lại prompt của lần chạy trước khi core + plugin đã sẵn sàng
+    plugin_manager.core_api.generation_service.resume_journal()
+    plugin_manager.core_api.start_startup_maintenance() # Yuuka: startup maintenance v2.0
     
     # Yuuka: uptime tracking v1.0 - Khởi động luồng theo dõi
     uptime_thread = threading.Thread(target=_uptime_tracking_thread, daemon=True)
@@ -532,9 +871,19 @@ def initialize_server():
     print("   - To access from other devices on the same network, use this machine's IP address.")
 
 
+def report_startup_profile():
+    """
+    Yuuka: startup profiler v1.0 - In tóm tắt thời gian khởi động (chi tiết ở /api/server/startup_profile).
+    Gọi sau khi mọi phase bao ngoài (vd. "initialize_server" trong main.py) đã đóng.
+    """
+    startup_profiler.mark_ready()
+    startup_profiler.print_summary()
+
+
 # === Run Server ===
 if __name__ == '__main__':
     initialize_server() # Yuuka: main.py compatibility v1.0
+    report_startup_profile()
     # Yuuka: Chú ý - app.run() sẽ không hoạt động tốt với WebSocket trong production.
     # Senpai nên cân nhắc dùng một server WSGI như Gunicorn với gevent.
     # Ví dụ: gunicorn --worker-class geventwebsocket.gunicorn.workers.GeventWebSocketWorker -w 1 app:app
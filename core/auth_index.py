@@ -0,0 +1,87 @@
+import hashlib
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+ROLE_ADMIN = 1      # whitelist.json
+ROLE_USER = 2       # user_data.json["users"]
+ROLE_PENDING = 4    # waitlist.json
+
+
+def normalize_token_collection(data, reg_time: Optional[int] = None) -> Dict[str, dict]:
+    """Đưa whitelist/waitlist/users về định dạng mới {token: {"reg_time": ...}} (hỗ trợ list cũ)."""
+    if isinstance(data, dict):
+        return data
+    if isinstance(data, list):
+        reg_time = int(time.time()) if reg_time is None else reg_time
+        return {token: {"reg_time": reg_time} for token in data if isinstance(token, str) and token}
+    return {}
+
+
+class AuthIndex:
+    """
+    Yuuka: auth index v1.0 - Chỉ mục token -> (roles, user_hash) dùng chung cho mọi request.
+
+    Index được dựng lại khi:
+    - `invalidate()` được gọi (CoreAPI/plugin vừa sửa danh sách token),
+    - fingerprint rẻ (id + len của 3 danh sách) thay đổi, phòng khi plugin sửa trực tiếp mà quên invalidate,
+    - quá `ttl` giây (chặn trường hợp thay token mà độ dài không đổi).
+    Giữa các lần dựng lại, mỗi request chỉ tốn một lần tra dict.
+    """
+
+    def __init__(self, sources: Callable[[], Tuple[object, object, object]], ttl: float = 30.0):
+        self._sources = sources
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._index: Dict[str, Tuple[int, str]] = {}
+        self._fingerprint = None
+        self._built_at = 0.0
+        self._dirty = True
+        self.has_admin = False
+        self.rebuild_count = 0
+
+    @staticmethod
+    def _fingerprint_of(whitelist, waitlist, users) -> tuple:
+        return (
+            id(whitelist), len(whitelist or ()),
+            id(waitlist), len(waitlist or ()),
+            id(users), len(users or ()),
+        )
+
+    def invalidate(self) -> None:
+        self._dirty = True
+
+    def _rebuild(self, whitelist, waitlist, users, fingerprint) -> None:
+        index: Dict[str, Tuple[int, str]] = {}
+        for role, tokens in ((ROLE_ADMIN, whitelist), (ROLE_USER, users), (ROLE_PENDING, waitlist)):
+            for token in tokens or ():
+                if not isinstance(token, str):
+                    continue
+                entry = index.get(token)
+                if entry is None:
+                    index[token] = (role, hashlib.sha256(token.encode('utf-8')).hexdigest())
+                else:
+                    index[token] = (entry[0] | role, entry[1])
+        self._index = index
+        self.has_admin = bool(whitelist)
+        self._fingerprint = fingerprint
+        self._built_at = time.monotonic()
+        self._dirty = False
+        self.rebuild_count += 1
+
+    def lookup(self, token: str) -> Optional[Tuple[int, str]]:
+        whitelist, waitlist, users = self._sources()
+        fingerprint = self._fingerprint_of(whitelist, waitlist, users)
+        if self._dirty or fingerprint != self._fingerprint or (time.monotonic() - self._built_at) > self.ttl:
+            with self._lock:
+                if self._dirty or fingerprint != self._fingerprint or (time.monotonic() - self._built_at) > self.ttl:
+                    self._rebuild(whitelist, waitlist, users, fingerprint)
+        return self._index.get(token)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "tokens": len(self._index),
+            "rebuild_count": self.rebuild_count,
+            "age_seconds": round(time.monotonic() - self._built_at, 3) if self._built_at else None,
+            "ttl": self.ttl,
+        }
@@ -0,0 +1,175 @@
+import bisect
+import re
+import threading
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+_SERIES_PATTERN = re.compile(r"^(?P<base>.*?)\s*\((?P<series>[^()]*)\)\s*$")
+_TOKEN_SPLIT = re.compile(r"[\s_\-:,.()/\\!?']+")
+
+
+def character_lookup_key(value: object) -> str:
+    """Khoá so khớp tên nhân vật: chữ thường, bỏ ':', gộp khoảng trắng."""
+    return " ".join(str(value or "").replace(":", "").replace("_", " ").lower().split())
+
+
+def split_character_name(name: str) -> Tuple[str, str]:
+    """'hatsune miku (vocaloid)' -> ('hatsune miku', 'vocaloid')."""
+    text = str(name or "").replace("\\(", "(").replace("\\)", ")").strip()
+    match = _SERIES_PATTERN.match(text)
+    if match and match.group("base").strip():
+        return match.group("base").strip(), match.group("series").strip()
+    return text, ""
+
+
+class CharacterSearchIndex:
+    """
+    Yuuka: character search v1.0 - Chỉ mục tìm kiếm nhân vật, dựng trong CoreAPI lúc load dữ liệu.
+
+    - exact: lookup key -> nhân vật (thay cho các vòng lặp tuyến tính trong plugin).
+    - token: các từ của tên + series (định dạng `name (series)`), tra prefix bằng bisect.
+    - trigram: cho tìm kiếm gần đúng / substring; dựng lazy ở lần search đầu tiên cần tới.
+    """
+
+    MIN_FUZZY_SCORE = 0.55
+
+    def __init__(self, characters: List[Dict[str, Any]]):
+        self._characters: List[Dict[str, Any]] = list(characters or [])
+        self._keys: List[str] = []
+        self._series: List[str] = []
+        self._exact: Dict[str, int] = {}
+        token_map: Dict[str, List[int]] = {}
+        base_aliases: Dict[str, List[int]] = {}
+
+        for idx, char_data in enumerate(self._characters):
+            name = str(char_data.get("name") or "")
+            key = character_lookup_key(name)
+            base, series = split_character_name(name)
+            self._keys.append(key)
+            self._series.append(character_lookup_key(series))
+            self._exact.setdefault(key, idx)
+            base_key = character_lookup_key(base)
+            if base_key and base_key != key:
+                base_aliases.setdefault(base_key, []).append(idx)
+            for token in set(_TOKEN_SPLIT.split(key)):
+                if token:
+                    token_map.setdefault(token, []).append(idx)
+
+        # Cho phép tra cả tên không kèm series, trừ khi nhiều nhân vật cùng tên gốc (vd. "saber")
+        for base_key, indices in base_aliases.items():
+            if len(indices) == 1:
+                self._exact[f"\0{base_key}"] = indices[0]
+
+        self._tokens: List[str] = sorted(token_map)
+        self._token_postings: List[List[int]] = [token_map[t] for t in self._tokens]
+        self._trigrams: Optional[Dict[str, List[int]]] = None
+        self._gram_counts: List[int] = []
+        self._trigram_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._characters)
+
+    # ------------------------------------------------------------------ #
+    # Helpers
+    # ------------------------------------------------------------------ #
+
+    @staticmethod
+    def _grams(key: str) -> Set[str]:
+        padded = f"  {key} "
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+    def _ensure_trigrams(self) -> Dict[str, List[int]]:
+        if self._trigrams is not None:
+            return self._trigrams
+        with self._trigram_lock:
+            if self._trigrams is None:
+                index: Dict[str, List[int]] = {}
+                gram_counts: List[int] = []
+                for idx, key in enumerate(self._keys):
+                    grams = self._grams(key)
+                    gram_counts.append(len(grams))
+                    for gram in grams:
+                        index.setdefault(gram, []).append(idx)
+                self._gram_counts = gram_counts
+                self._trigrams = index
+        return self._trigrams
+
+    def _token_prefix_matches(self, token: str) -> Set[int]:
+        matches: Set[int] = set()
+        pos = bisect.bisect_left(self._tokens, token)
+        while pos < len(self._tokens) and self._tokens[pos].startswith(token):
+            matches.update(self._token_postings[pos])
+            pos += 1
+        return matches
+
+    # ------------------------------------------------------------------ #
+    # Public API
+    # ------------------------------------------------------------------ #
+
+    def warm_up(self) -> None:
+        """Dựng trước chỉ mục trigram (gọi từ thread nền) để lần search đầu không phải chờ."""
+        self._ensure_trigrams()
+
+    def find_exact(self, name: object) -> Optional[Dict[str, Any]]:
+        key = character_lookup_key(name)
+        if not key:
+            return None
+        idx = self._exact.get(key)
+        if idx is None:
+            idx = self._exact.get(f"\0{key}")
+        return self._characters[idx] if idx is not None else None
+
+    def search(self, query: object, offset: int = 0, limit: int = 50) -> Tuple[int, List[Dict[str, Any]]]:
+        """Trả về (tổng số kết quả, trang kết quả) đã xếp hạng: exact > prefix > token > substring > fuzzy."""
+        key = character_lookup_key(query)
+        offset = max(0, int(offset))
+        limit = max(0, int(limit))
+        if not key:
+            return len(self._characters), self._characters[offset:offset + limit]
+
+        scores: Dict[int, float] = {}
+
+        def _bump(idx: int, score: float):
+            if score > scores.get(idx, 0.0):
+                scores[idx] = score
+
+        query_tokens = [t for t in _TOKEN_SPLIT.split(key) if t]
+        if query_tokens:
+            token_hits = None
+            for token in query_tokens:
+                hits = self._token_prefix_matches(token)
+                token_hits = hits if token_hits is None else token_hits & hits
+                if not token_hits:
+                    break
+            for idx in token_hits or ():
+                name_key = self._keys[idx]
+                if name_key == key:
+                    _bump(idx, 4.0)
+                elif name_key.startswith(key):
+                    _bump(idx, 3.0)
+                elif self._series[idx] and self._series[idx].startswith(key):
+                    _bump(idx, 2.5)
+                else:
+                    _bump(idx, 2.0)
+
+        if len(key) >= 3:
+            query_grams = self._grams(key)
+            overlap: Dict[int, int] = {}
+            index = self._ensure_trigrams()
+            for gram in query_grams:
+                for idx in index.get(gram, ()):
+                    overlap[idx] = overlap.get(idx, 0) + 1
+            for idx, shared in overlap.items():
+                name_key = self._keys[idx]
+                if key in name_key:
+                    _bump(idx, 1.5)
+                    continue
+                # Tỉ lệ trigram của query có trong tên (tên dài kèm series không bị phạt như Jaccard),
+                # trừ nhẹ theo độ dài để tên ngắn hơn đứng trước khi bằng điểm.
+                containment = shared / len(query_grams)
+                if containment >= self.MIN_FUZZY_SCORE:
+                    _bump(idx, containment - self._gram_counts[idx] * 0.001)
+
+        # Danh sách gốc đã sắp theo tên nên chỉ số nhỏ hơn = thứ tự chữ cái
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        page = [self._characters[idx] for idx, _ in ranked[offset:offset + limit]]
+        return len(ranked), page
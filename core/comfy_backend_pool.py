@@ -0,0 +1,250 @@
+import json
+import threading
+import time
+import urllib.request
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+from integrations import comfy_api_client
+
+# Địa chỉ ảo dùng làm khoá trong GenerationScheduler cho các task được định tuyến qua pool
+POOL_ADDRESS = "pool"
+
+
+def is_connection_error(error: Exception) -> bool:
+    """Lỗi không kết nối được tới ComfyUI (đáng để failover sang backend khác)."""
+    message = str(error)
+    return isinstance(error, ConnectionError) and (
+        message.startswith("COMFY_CONN_REFUSED:") or message.startswith("COMFY_CONN_ERROR:")
+    )
+
+
+class ComfyBackend:
+    def __init__(self, address: str, weight: float = 1.0, max_in_flight: int = 2):
+        self.address = address
+        self.weight = max(0.1, float(weight))
+        self.max_in_flight = max(1, int(max_in_flight))
+        self.healthy = True
+        self.last_probe = 0.0
+        self.last_error: Optional[str] = None
+        self.queue_depth = 0
+        self.submitted_since_probe = 0
+        self.in_flight = 0
+        self.checkpoints: Optional[Set[str]] = None
+        self.loras: Optional[Set[str]] = None
+        self.capabilities_at = 0.0
+        # Thống kê
+        self.completed = 0
+        self.failed = 0
+        self.failovers = 0
+        self.busy_seconds = 0.0
+
+    def supports(self, checkpoint: Optional[str], loras: Iterable[str]) -> bool:
+        """Chưa biết capabilities (chưa probe được object_info) thì coi như hỗ trợ."""
+        if checkpoint and self.checkpoints is not None and checkpoint not in self.checkpoints:
+            return False
+        if self.loras is not None:
+            for name in loras:
+                if name not in self.loras:
+                    return False
+        return True
+
+    def to_dict(self) -> Dict[str, Any]:
+        completed_total = self.completed + self.failed
+        return {
+            "address": self.address,
+            "healthy": self.healthy,
+            "weight": self.weight,
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "checkpoints": len(self.checkpoints) if self.checkpoints is not None else None,
+            "loras": len(self.loras) if self.loras is not None else None,
+            "completed": self.completed,
+            "failed": self.failed,
+            "failovers": self.failovers,
+            "avg_task_seconds": round(self.busy_seconds / completed_total, 3) if completed_total else None,
+            "throughput_per_min": round(self.completed / (self.busy_seconds / 60.0), 3) if self.busy_seconds else None,
+            "last_error": self.last_error,
+            "last_probe_age_s": round(time.monotonic() - self.last_probe, 1) if self.last_probe else None,
+        }
+
+
+class ComfyBackendPool:
+    """
+    Yuuka: comfy backend pool v1.0 - Coi nhiều ComfyUI như một pool.
+
+    Cấu hình trong server_config.json:
+        "comfy_backends": {
+            "servers": [{"address": "10.0.0.2:8188", "weight": 1, "max_in_flight": 2}, ...],
+            "probe_interval": 15, "capabilities_interval": 300
+        }
+    Task có `server_address` trống, "pool" hoặc trùng một backend trong pool sẽ được định tuyến tới
+    backend khoẻ, có đủ checkpoint/LoRA và ít tải nhất; lỗi kết nối thì failover sang backend khác.
+    """
+
+    def __init__(self, config: Optional[dict] = None,
+                 queue_depth_provider: Optional[Callable[[str], Optional[int]]] = None):
+        config = config if isinstance(config, dict) else {}
+        self.probe_interval = max(2.0, float(config.get("probe_interval", 15)))
+        self.capabilities_interval = max(self.probe_interval, float(config.get("capabilities_interval", 300)))
+        self._queue_depth_provider = queue_depth_provider
+        self._lock = threading.Lock()
+        self._backends: Dict[str, ComfyBackend] = {}
+        for entry in config.get("servers") or []:
+            if isinstance(entry, str):
+                entry = {"address": entry}
+            if not isinstance(entry, dict) or not entry.get("address"):
+                continue
+            address = str(entry["address"]).strip()
+            self._backends[address] = ComfyBackend(
+                address, entry.get("weight", 1.0), entry.get("max_in_flight", 2)
+            )
+        self._stop_event = threading.Event()
+        self._probe_thread: Optional[threading.Thread] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self._backends)
+
+    @property
+    def backend_count(self) -> int:
+        return len(self._backends)
+
+    @property
+    def total_capacity(self) -> int:
+        return sum(b.max_in_flight for b in self._backends.values())
+
+    def handles(self, server_address: Optional[str]) -> bool:
+        if not self.enabled:
+            return False
+        address = (server_address or "").strip()
+        return not address or address == POOL_ADDRESS or address in self._backends
+
+    # ------------------------------------------------------------------ #
+    # Routing
+    # ------------------------------------------------------------------ #
+
+    def _load_of(self, backend: ComfyBackend) -> float:
+        depth = None
+        if self._queue_depth_provider:
+            try:
+                depth = self._queue_depth_provider(backend.address)
+            except Exception:
+                depth = None
+        if depth is None:
+            depth = backend.queue_depth + backend.submitted_since_probe
+        return max(depth, backend.in_flight) / backend.weight
+
+    def acquire(self, checkpoint: Optional[str] = None, loras: Iterable[str] = (),
+                exclude: Iterable[str] = ()) -> Optional[ComfyBackend]:
+        """Chọn backend ít tải nhất còn slot và có đủ model; đánh dấu đang dùng. None nếu hết lựa chọn."""
+        loras = [name for name in loras if name]
+        excluded = set(exclude)
+        with self._lock:
+            candidates = [b for b in self._backends.values() if b.address not in excluded]
+            if not candidates:
+                return None
+            healthy = [b for b in candidates if b.healthy]
+            # Tất cả đều bị đánh dấu lỗi: thử lại cái lỗi lâu nhất, có thể đã hồi phục
+            pool = healthy or sorted(candidates, key=lambda b: b.last_probe)[:1]
+            # Không backend nào có model -> vẫn gửi đi để ComfyUI báo lỗi cụ thể
+            pool = [b for b in pool if b.supports(checkpoint, loras)] or pool
+            choices = [b for b in pool if b.in_flight < b.max_in_flight] or pool
+            backend = min(choices, key=lambda b: (self._load_of(b), b.in_flight, b.address))
+            backend.in_flight += 1
+            backend.submitted_since_probe += 1
+            return backend
+
+    def release(self, backend: ComfyBackend, success: bool, duration: float) -> None:
+        with self._lock:
+            backend.in_flight = max(0, backend.in_flight - 1)
+            backend.busy_seconds += max(0.0, duration)
+            if success:
+                backend.completed += 1
+            else:
+                backend.failed += 1
+
+    def report_connection_failure(self, backend: ComfyBackend, error: Exception) -> None:
+        with self._lock:
+            backend.in_flight = max(0, backend.in_flight - 1)
+            backend.submitted_since_probe = max(0, backend.submitted_since_probe - 1)
+            backend.healthy = False
+            backend.failovers += 1
+            backend.last_error = str(error)
+        print(f"[BackendPool] {backend.address} unreachable, failing over: {error}")
+
+    # ------------------------------------------------------------------ #
+    # Probing
+    # ------------------------------------------------------------------ #
+
+    @staticmethod
+    def _fetch_queue_depth(address: str) -> int:
+        with urllib.request.urlopen(f"http://{address}/queue", timeout=3) as response:
+            data = json.loads(response.read())
+        return len(data.get("queue_running", [])) + len(data.get("queue_pending", []))
+
+    def probe_backend(self, backend: ComfyBackend, refresh_capabilities: bool = False) -> None:
+        try:
+            depth = self._fetch_queue_depth(backend.address)
+            error = None
+        except Exception as e:
+            depth, error = None, str(e)
+
+        info = None
+        if error is None and refresh_capabilities:
+            info = comfy_api_client.get_full_object_info(backend.address, force_refresh=True)
+
+        with self._lock:
+            was_healthy = backend.healthy
+            backend.last_probe = time.monotonic()
+            backend.submitted_since_probe = 0
+            if error is None:
+                backend.healthy = True
+                backend.queue_depth = depth
+                backend.last_error = None
+                if info and (info.get("checkpoints") or info.get("loras")):
+                    backend.checkpoints = set(info.get("checkpoints") or [])
+                    backend.loras = set(info.get("loras") or [])
+                    backend.capabilities_at = backend.last_probe
+            else:
+                backend.healthy = False
+                backend.last_error = error
+        if was_healthy != backend.healthy:
+            state = "healthy" if backend.healthy else f"unhealthy ({error})"
+            print(f"[BackendPool] {backend.address} is now {state}.")
+
+    def probe_all(self) -> None:
+        now = time.monotonic()
+        for backend in list(self._backends.values()):
+            refresh = backend.capabilities_at == 0.0 or (now - backend.capabilities_at) >= self.capabilities_interval
+            self.probe_backend(backend, refresh_capabilities=refresh)
+
+    def start(self) -> None:
+        if not self.enabled or (self._probe_thread and self._probe_thread.is_alive()):
+            return
+        self._stop_event.clear()
+
+        def _loop():
+            while not self._stop_event.is_set():
+                try:
+                    self.probe_all()
+                except Exception as e:
+                    print(f"[BackendPool] Probe error: {e}")
+                self._stop_event.wait(self.probe_interval)
+
+        self._probe_thread = threading.Thread(target=_loop, name="ComfyBackendProbe", daemon=True)
+        self._probe_thread.start()
+        print(f"[BackendPool] Probing {len(self._backends)} ComfyUI backends every {self.probe_interval:.0f}s.")
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            backends: List[Dict[str, Any]] = [b.to_dict() for b in self._backends.values()]
+        return {
+            "enabled": self.enabled,
+            "probe_interval": self.probe_interval,
+            "capacity": self.total_capacity,
+            "backends": backends,
+        }
@@ -0,0 +1,249 @@
+import gzip
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+try:
+    import brotli as _brotli
+except ImportError:
+    _brotli = None
+
+
+DEFAULT_COMPRESSIBLE_TYPES = (
+    "application/json",
+    "text/html",
+    "text/css",
+    "text/plain",
+    "text/javascript",
+    "application/javascript",
+)
+
+
+class CompressionMiddleware:
+    """
+    WSGI middleware that compresses large buffered responses (gzip, or brotli when installed).
+
+    Only responses that declare a Content-Length are considered. Compressible file
+    responses (static CSS/JS served by send_file) are buffered and compressed too;
+    bodies without a length (event streams, generators, WebSocket upgrades) pass
+    through untouched.
+    Responses carrying an ETag are treated as immutable: their compressed body is kept
+    in a small LRU cache keyed by (ETag, encoding) so repeated downloads of the same
+    tag list / character list skip the compression step entirely. The ETag sent with a
+    compressed body is made weak, since the bytes differ from the identity response
+    but the representation is equivalent (If-None-Match uses weak comparison).
+    """
+
+    def __init__(
+        self,
+        wsgi_app: Callable,
+        *,
+        min_size: int = 1024,
+        level: int = 6,
+        cache_entries: int = 32,
+        compressible_types: Iterable[str] = DEFAULT_COMPRESSIBLE_TYPES,
+        enable_brotli: bool = True,
+    ):
+        self.wsgi_app = wsgi_app
+        self.min_size = max(0, int(min_size))
+        self.level = max(1, min(9, int(level)))
+        self.cache_entries = max(0, int(cache_entries))
+        self.compressible_types = tuple(t.lower() for t in compressible_types)
+        self.brotli_available = bool(enable_brotli and _brotli is not None)
+
+        self._cache: "OrderedDict[Tuple[str, str], bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {
+            "responses_compressed": 0,
+            "responses_skipped": 0,
+            "bytes_in": 0,
+            "bytes_out": 0,
+            "cache_hits": 0,
+            "cache_misses": 0,
+            "by_encoding": {},
+        }
+
+    # ------------------------------------------------------------------ #
+    # Negotiation helpers
+    # ------------------------------------------------------------------ #
+
+    def _choose_encoding(self, accept_encoding: str) -> Optional[str]:
+        if not accept_encoding:
+            return None
+        accepted: Dict[str, float] = {}
+        for part in accept_encoding.split(","):
+            token, _, params = part.strip().partition(";")
+            token = token.strip().lower()
+            if not token:
+                continue
+            quality = 1.0
+            params = params.strip()
+            if params.startswith("q="):
+                try:
+                    quality = float(params[2:])
+                except ValueError:
+                    quality = 0.0
+            accepted[token] = quality
+        wildcard = accepted.get("*", 0.0)
+        if self.brotli_available and accepted.get("br", wildcard) > 0:
+            return "br"
+        if accepted.get("gzip", wildcard) > 0:
+            return "gzip"
+        return None
+
+    def _is_compressible(self, headers: List[Tuple[str, str]]) -> bool:
+        content_type = ""
+        for name, value in headers:
+            lname = name.lower()
+            if lname == "content-encoding":
+                return False
+            if lname == "content-type":
+                content_type = value.split(";", 1)[0].strip().lower()
+        return content_type in self.compressible_types
+
+    @staticmethod
+    def _weak_etag(etag: str) -> str:
+        etag = etag.strip()
+        return etag if etag.startswith("W/") else f"W/{etag}"
+
+    def _compress(self, body: bytes, encoding: str) -> bytes:
+        if encoding == "br":
+            # Brotli quality 0-11; map the gzip-style level onto the lower half which is fast enough for per-request use.
+            return _brotli.compress(body, quality=min(11, self.level // 2 + 1))
+        return gzip.compress(body, compresslevel=self.level, mtime=0)
+
+    # ------------------------------------------------------------------ #
+    # Cache & metrics
+    # ------------------------------------------------------------------ #
+
+    def _cache_get(self, key: Tuple[str, str]) -> Optional[bytes]:
+        with self._lock:
+            data = self._cache.get(key)
+            if data is None:
+                self._stats["cache_misses"] += 1
+                return None
+            self._cache.move_to_end(key)
+            self._stats["cache_hits"] += 1
+            return data
+
+    def _cache_put(self, key: Tuple[str, str], data: bytes) -> None:
+        if not self.cache_entries:
+            return
+        with self._lock:
+            self._cache[key] = data
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_entries:
+                self._cache.popitem(last=False)
+
+    def _record(self, encoding: str, size_in: int, size_out: int) -> None:
+        with self._lock:
+            self._stats["responses_compressed"] += 1
+            self._stats["bytes_in"] += size_in
+            self._stats["bytes_out"] += size_out
+            per_encoding = self._stats["by_encoding"].setdefault(encoding, {"responses": 0, "bytes_in": 0, "bytes_out": 0})
+            per_encoding["responses"] += 1
+            per_encoding["bytes_in"] += size_in
+            per_encoding["bytes_out"] += size_out
+
+    def _record_skip(self) -> None:
+        with self._lock:
+            self._stats["responses_skipped"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = {
+                key: (dict((enc, dict(v)) for enc, v in value.items()) if key == "by_encoding" else value)
+                for key, value in self._stats.items()
+            }
+            stats["cached_bodies"] = len(self._cache)
+        bytes_in = stats["bytes_in"]
+        stats["compression_ratio"] = round(stats["bytes_out"] / bytes_in, 4) if bytes_in else None
+        stats["bytes_saved"] = bytes_in - stats["bytes_out"]
+        stats["min_size"] = self.min_size
+        stats["level"] = self.level
+        stats["brotli_available"] = self.brotli_available
+        return stats
+
+    # ------------------------------------------------------------------ #
+    # WSGI entry point
+    # ------------------------------------------------------------------ #
+
+    def __call__(self, environ, start_response):
+        encoding = None
+        if environ.get("REQUEST_METHOD", "GET") in ("GET", "POST", "PUT"):
+            encoding = self._choose_encoding(environ.get("HTTP_ACCEPT_ENCODING", ""))
+        if encoding is None:
+            return self.wsgi_app(environ, start_response)
+
+        captured: Dict[str, Any] = {}
+
+        def _capture_start_response(status, headers, exc_info=None):
+            if captured.get("passthrough"):
+                return start_response(status, headers, exc_info)
+            captured["status"] = status
+            captured["headers"] = headers
+            captured["exc_info"] = exc_info
+            # The body is buffered below; writes through the legacy write() callable are not supported here.
+            return lambda _data: None
+
+        app_iter = self.wsgi_app(environ, _capture_start_response)
+        if "status" not in captured:
+            # Lazy apps call start_response while iterating; let those stream through untouched.
+            captured["passthrough"] = True
+            self._record_skip()
+            return app_iter
+        status = captured["status"]
+        headers = list(captured.get("headers") or [])
+
+        content_length = None
+        etag = None
+        for name, value in headers:
+            lname = name.lower()
+            if lname == "content-length":
+                try:
+                    content_length = int(value)
+                except ValueError:
+                    content_length = None
+            elif lname == "etag":
+                etag = value
+
+        eligible = (
+            status.startswith("200")
+            and content_length is not None
+            and content_length >= self.min_size
+            and self._is_compressible(headers)
+        )
+        if not eligible:
+            self._record_skip()
+            start_response(status, headers, captured.get("exc_info"))
+            return app_iter
+
+        cache_key = (etag, encoding) if etag else None
+        compressed = self._cache_get(cache_key) if cache_key else None
+        try:
+            if compressed is None:
+                body = b"".join(app_iter)
+                compressed = self._compress(body, encoding)
+                if cache_key:
+                    self._cache_put(cache_key, compressed)
+        finally:
+            close = getattr(app_iter, "close", None)
+            if callable(close):
+                close()
+
+        self._record(encoding, content_length, len(compressed))
+        new_headers = [
+            (name, value) for name, value in headers
+            if name.lower() not in ("content-length", "vary", "etag")
+        ]
+        if etag:
+            new_headers.append(("ETag", self._weak_etag(etag)))
+        vary_values = [value for name, value in headers if name.lower() == "vary"]
+        vary_tokens = [v.strip() for value in vary_values for v in value.split(",") if v.strip()]
+        if "accept-encoding" not in {v.lower() for v in vary_tokens}:
+            vary_tokens.append("Accept-Encoding")
+        new_headers.append(("Vary", ", ".join(vary_tokens)))
+        new_headers.append(("Content-Encoding", encoding))
+        new_headers.append(("Content-Length", str(len(compressed))))
+        start_response(status, new_headers, captured.get("exc_info"))
+        return [compressed]
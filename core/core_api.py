@@ -9,17 +9,25 @@ import gzip
 import requests
 import io
 import csv
-from PIL import Image
+import pickle
+import secrets
+import threading
 from flask import request, jsonify
 
 # Yuuka: Import các thư viện tích hợp và service
 from integrations import comfy_api_client
+from integrations.comfy_event_hub import ComfyEventHub
 from integrations.workflow_builder_service import WorkflowBuilderService
 from .image_service import ImageService
 from .generation_service import GenerationService
 from .game_service import GameService # Yuuka: PvP game feature v1.0
 from .task_service import BackgroundTaskService
 from .ai_service import AIService
+from .maintenance_service import StartupMaintenanceJob
+from .tag_suggest import TagSuggestionEngine
+from .character_index import CharacterSearchIndex
+from .auth_index import AuthIndex, ROLE_ADMIN, ROLE_USER, ROLE_PENDING, normalize_token_collection
+from .startup_profiler import startup_profiler
 
 
 class CoreAPI:
@@ -34,29 +42,63 @@ class CoreAPI:
         # Yuuka: Cache dữ liệu nhân vật và thumbnail để tăng tốc độ
         self._all_characters_list = []
         self._all_characters_dict = {}
+        self._character_index = CharacterSearchIndex([])
         self._thumbnails_data_dict = {}
+        self._thumbnails_loaded = False
+        self._thumbnails_lock = threading.Lock()
         self._user_data = {}
         self._tag_predictions = [] # Yuuka: Thêm cache cho tags
+        self._tag_suggester = None
+        self._tag_suggester_source = None
+        self._tag_suggester_lock = threading.Lock()
         # Yuuka: auth rework v1.0 - Thêm cache cho whitelist và waitlist
         self._whitelist_users = []
         self._waitlist_users = []
+        self._auth_index = AuthIndex(lambda: (self._whitelist_users, self._waitlist_users, self._user_data.get("users", {})))
+        # Yuuka: generation event stream v1.0 - Vé ngắn hạn cho EventSource (không gửi được header),
+        # để token thật không nằm trong URL. ticket -> (user_hash, hết hạn lúc)
+        self._stream_tickets = {}
+        self._stream_tickets_lock = threading.Lock()
 
         # Yuuka: Khởi tạo các dịch vụ tích hợp
-        self.workflow_builder = WorkflowBuilderService()
+        with startup_profiler.phase("workflow_templates"):
+            self.workflow_builder = WorkflowBuilderService()
         self.comfy_api_client = comfy_api_client
+        self._configure_object_info_cache()
+        self.comfy_event_hub = ComfyEventHub() # Yuuka: comfy event hub v1.0 - Một websocket cho mỗi ComfyUI server
         # Yuuka: Hệ thống dịch vụ mới để các plugin giao tiếp
         self._services = {}
+        self._lazy_services = {}  # service_name -> (plugin_id, activator) của plugin lazy chưa kích hoạt
         # YUUKA: KHỞI TẠO CÁC SERVICE LÕI MỚI
         self.image_service = ImageService(self)
         self.generation_service = GenerationService(self)
         self.game_service = GameService(self) # Yuuka: PvP game feature v1.0
         self.task_service = BackgroundTaskService()
         self.ai_service = AIService(self)
+        self._maintenance_job = None
         
         # Yuuka: Thêm các hằng số URL từ phiên bản cũ
         self.CSV_CHARACTERS_URL = "https://raw.githubusercontent.com/mirabarukaso/character_select_stand_alone_app/refs/heads/main/data/wai_characters.csv"
         self.JSON_THUMBNAILS_URL = None  # URL đã hết hạn, tạm thời bỏ qua
         self.CACHE_TTL_SECONDS = 30 * 24 * 60 * 60  # 30 ngày
+        self.DERIVED_CACHE_FILENAME = "core_derived_cache.pkl"
+        self.DERIVED_CACHE_VERSION = 1
+
+    def _configure_object_info_cache(self):
+        """Yuuka: object_info catalog v1.0 - server_config.json -> "comfy_catalog": {"ttl", "max_stale", "error_ttl"}."""
+        server_config = self.data_manager.read_json('server_config.json', default_value={}) or {}
+        catalog_cfg = server_config.get('comfy_catalog') if isinstance(server_config, dict) else None
+        if not isinstance(catalog_cfg, dict):
+            return
+        cache = self.comfy_api_client.object_info_cache
+        try:
+            cache.configure(
+                ttl=catalog_cfg.get('ttl', cache.ttl),
+                max_stale=catalog_cfg.get('max_stale', cache.max_stale),
+                error_ttl=catalog_cfg.get('error_ttl', cache.error_ttl),
+            )
+        except (TypeError, ValueError):
+            print(f"[CoreAPI] Invalid 'comfy_catalog' config ignored: {catalog_cfg}")
 
     # --- 1. Dịch vụ Dữ liệu (Data Services) ---
     def read_data(self, filename, default_value={}, obfuscated=False):
@@ -83,42 +125,58 @@ class CoreAPI:
         
         if not token:
             auth_header = request.headers.get('Authorization')
-            if not auth_header or not auth_header.startswith('Bearer '):
+            if auth_header and auth_header.startswith('Bearer '):
+                token = auth_header.split(' ')[1]
+            else:
                 raise Exception("Authorization header is missing or invalid.")
-            token = auth_header.split(' ')[1]
         
         is_localhost = client_ip == '127.0.0.1'
 
-        is_valid = False
-        # Yuuka: Sửa lại logic một chút để localhost có thể dùng bất kỳ token nào trong whitelist
-        # và cả waitlist (để bước setup ban đầu có thể vượt qua verify_token).
-        # Remote user dùng bất kỳ token nào trong user_data.
-        # Hỗ trợ cả định dạng cũ (list) và mới (dict).
-        if isinstance(self._whitelist_users, list):
-            if token in self._whitelist_users: is_valid = True
-        elif isinstance(self._whitelist_users, dict):
-            if token in self._whitelist_users: is_valid = True
+        # Yuuka: auth index v1.0 - Một lần tra dict thay cho duyệt list + SHA-256 mỗi request.
+        # Localhost dùng token whitelist (và waitlist khi chưa có admin - bước setup đầu tiên),
+        # remote user dùng token whitelist hoặc user_data.
+        entry = self._auth_index.lookup(token)
+        if entry is not None:
+            roles, user_hash = entry
+            if roles & ROLE_ADMIN:
+                return user_hash
+            if is_localhost:
+                if roles & ROLE_PENDING and not self._whitelist_users:
+                    return user_hash
+            elif roles & ROLE_USER:
+                return user_hash
 
-        if not is_valid and is_localhost:
-            # Chỉ cho phép waitlist nếu chưa có bất kỳ admin nào (bước setup đầu tiên)
-            if not self._whitelist_users:
-                if isinstance(self._waitlist_users, list):
-                    if token in self._waitlist_users: is_valid = True
-                elif isinstance(self._waitlist_users, dict):
-                    if token in self._waitlist_users: is_valid = True
-
-        if not is_valid and not is_localhost:
-            users_list = self._user_data.get("users", [])
-            if isinstance(users_list, list):
-                if token in users_list: is_valid = True
-            elif isinstance(users_list, dict):
-                if token in users_list: is_valid = True
-
-        if is_valid:
-            return hashlib.sha256(token.encode('utf-8')).hexdigest()
-        
         raise Exception("Invalid token.")
 
+    STREAM_TICKET_TTL = 30.0
+
+    def issue_stream_ticket(self, user_hash):
+        """Vé dùng một lần, hết hạn sau STREAM_TICKET_TTL giây, để mở /api/core/generate/stream?ticket=."""
+        ticket = secrets.token_urlsafe(24)
+        now = time.time()
+        with self._stream_tickets_lock:
+            for expired in [t for t, (_, expires_at) in self._stream_tickets.items() if expires_at <= now]:
+                del self._stream_tickets[expired]
+            self._stream_tickets[ticket] = (user_hash, now + self.STREAM_TICKET_TTL)
+        return ticket
+
+    def redeem_stream_ticket(self, ticket):
+        """user_hash của vé còn hạn (vé bị xoá ngay khi dùng), hoặc raise Exception."""
+        with self._stream_tickets_lock:
+            entry = self._stream_tickets.pop(ticket, None) if ticket else None
+        if entry is None or entry[1] <= time.time():
+            raise Exception("Invalid or expired stream ticket.")
+        return entry[0]
+
+    def invalidate_auth_index(self):
+        """Gọi sau khi sửa trực tiếp _whitelist_users/_waitlist_users/_user_data["users"]."""
+        self._auth_index.invalidate()
+
+    def get_token_roles(self, token: str) -> int:
+        """Bitmask ROLE_ADMIN/ROLE_USER/ROLE_PENDING của token (0 nếu không tồn tại)."""
+        entry = self._auth_index.lookup(token) if token else None
+        return entry[0] if entry else 0
+
     # Yuuka: auth rework v1.0 - Logic tạo token mới
     def generate_token(self):
         """
@@ -138,6 +196,7 @@ class CoreAPI:
             
             self._waitlist_users[new_token] = {"reg_time": reg_time}
             self.save_data(self._waitlist_users, "waitlist.json", obfuscated=True)
+            self.invalidate_auth_index()
             print(f"[CoreAPI] New token added to waitlist (Waiting for approval).")
             
         return jsonify({"status": "created", "token": new_token})
@@ -163,6 +222,7 @@ class CoreAPI:
             # Xóa khỏi waitlist
             del self._waitlist_users[token_to_approve]
             self.save_data(self._waitlist_users, "waitlist.json", obfuscated=True)
+            self.invalidate_auth_index()
             
             print(f"[CoreAPI] Token {token_to_approve[:8]}... approved as regular user.")
             return True, "Người dùng đã được phê duyệt."
@@ -202,6 +262,7 @@ class CoreAPI:
 
             self._whitelist_users[token_to_add] = {"reg_time": reg_time}
             self.save_data(self._whitelist_users, "whitelist.json", obfuscated=True)
+            self.invalidate_auth_index()
             print(f"[CoreAPI] Token added to whitelist.")
 
             if token_to_add in self._waitlist_users:
@@ -223,10 +284,35 @@ class CoreAPI:
     def get_character_by_hash(self, char_hash: str):
         return self._all_characters_dict.get(char_hash)
 
+    # Yuuka: character search v1.0 - Tra cứu qua chỉ mục thay vì duyệt toàn bộ danh sách
+    def find_character_by_name(self, name: str):
+        """Tìm nhân vật theo tên (không phân biệt hoa thường, bỏ ':'; chấp nhận tên không kèm series)."""
+        return self._character_index.find_exact(name)
+
+    def search_characters(self, query: str, offset: int = 0, limit: int = 50):
+        """Tìm kiếm gần đúng; trả về (total, danh sách nhân vật của trang)."""
+        return self._character_index.search(query, offset, limit)
+
     def get_tag_predictions(self):
         return self._tag_predictions
 
+    # Yuuka: tag suggest v1.0 - Engine dựng lazy từ _tag_predictions, dựng lại khi danh sách tag đổi
+    def get_tag_suggestion_engine(self) -> TagSuggestionEngine:
+        tags = self._tag_predictions
+        engine = self._tag_suggester
+        if engine is not None and self._tag_suggester_source is tags:
+            return engine
+        with self._tag_suggester_lock:
+            if self._tag_suggester is None or self._tag_suggester_source is not tags:
+                self._tag_suggester = TagSuggestionEngine(tags)
+                self._tag_suggester_source = tags
+            return self._tag_suggester
+
+    def suggest_tags(self, query: str, limit: int = 20, exclude=()):
+        return self.get_tag_suggestion_engine().suggest(query, limit, exclude=exclude)
+
     def get_thumbnail_image_data(self, md5_hash: str):
+        self._ensure_thumbnails_loaded()
         base64_gzipped_webp = self._thumbnails_data_dict.get(md5_hash)
         if not base64_gzipped_webp: return None, None
         try:
@@ -299,225 +385,121 @@ class CoreAPI:
         except Exception as e:
             print(f"⚠️ [CoreAPI] Warning: Could not load or process tags.csv. Error: {e}")
     
-    # Yuuka: data migration v1.0 - Logic di chuyển ảnh cũ
-    def _migrate_old_images(self):
-        print("[CoreAPI Migration] Checking for old image paths...")
-        img_data_path = "img_data.json"
-        all_images = self.read_data(img_data_path, obfuscated=True)
-        if not all_images or not isinstance(all_images, dict):
-            print("[CoreAPI Migration] No image data found. Skipping.")
-            return
-
-        data_was_migrated = False
-        user_images_dir = self.data_manager.get_path('user_images')
-        new_imgs_dir = os.path.join(user_images_dir, 'imgs')
-
-        for user_hash, characters in all_images.items():
-            for char_hash, images in characters.items():
-                for img_meta in images:
-                    if 'url' in img_meta and not img_meta['url'].startswith('/user_image/imgs/'):
-                        filename = os.path.basename(img_meta['url'])
-                        old_path = os.path.join(user_images_dir, filename)
-                        new_path = os.path.join(new_imgs_dir, filename)
-
-                        if os.path.exists(old_path):
-                            try:
-                                os.rename(old_path, new_path)
-                                print(f"  - Migrated: {filename}")
-                                img_meta['url'] = f'/user_image/imgs/{filename}'
-                                # Fallback pv_url cho dữ liệu cũ
-                                if 'pv_url' not in img_meta:
-                                    img_meta['pv_url'] = img_meta['url']
-                                data_was_migrated = True
-                            except OSError as e:
-                                print(f"  - ⚠️ Failed to migrate {filename}: {e}")
-                        elif os.path.exists(new_path):
-                             # File đã ở đúng vị trí, chỉ cần cập nhật URL
-                             img_meta['url'] = f'/user_image/imgs/{filename}'
-                             if 'pv_url' not in img_meta:
-                                img_meta['pv_url'] = img_meta['url']
-                             data_was_migrated = True
-
-        if data_was_migrated:
-            self.save_data(all_images, img_data_path, obfuscated=True)
-            print("[CoreAPI Migration] Image path migration complete and data saved.")
-        else:
-            print("[CoreAPI Migration] All image paths are up-to-date.")
-
-    # Yuuka: preview generation v1.1 - Logic tạo preview cho ảnh cũ, có kiểm tra file
-    def _generate_missing_previews(self):
-        print("[CoreAPI Previews] Checking for missing preview images...")
-        all_images = self.read_data("img_data.json", obfuscated=True)
-        if not all_images or not isinstance(all_images, dict):
-            print("[CoreAPI Previews] No image data to process. Skipping.")
-            return
-
-        data_was_modified = False
-        for user_hash, characters in all_images.items():
-            for char_hash, images in characters.items():
-                for img_meta in images:
-                    should_regenerate = False
-                    pv_url = img_meta.get('pv_url')
-
-                    # Điều kiện 1: Metadata thiếu hoặc là fallback
-                    if not pv_url or pv_url == img_meta.get('url'):
-                        should_regenerate = True
-                    # Điều kiện 2: Metadata có nhưng file vật lý không tồn tại
-                    else:
-                        try:
-                            # Yuuka: preview check fix v1.0
-                            url_parts = pv_url.strip('/').split('/')
-                            if len(url_parts) > 1 and url_parts[0] == 'user_image':
-                                relative_path = os.path.join('user_images', *url_parts[1:])
-                                physical_path = self.data_manager.get_path(relative_path)
-                                if not os.path.exists(physical_path):
-                                    #print(f"  - Detected missing preview file for: {os.path.basename(pv_url)}")
-                                    should_regenerate = True
-                        except Exception:
-                            # Bỏ qua nếu URL không hợp lệ
-                            pass
-                    
-                    if should_regenerate:
-                        main_url = img_meta.get('url')
-                        if not main_url: continue
-                        
-                        filename = os.path.basename(main_url)
-                        main_image_relative_path = os.path.join('user_images', 'imgs', filename)
-                        
-                        try:
-                            obfuscated_data = self.data_manager.read_binary(main_image_relative_path)
-                            if not obfuscated_data:
-                                print(f"  - ⚠️ Source not found for {filename}, skipping preview generation.")
-                                continue
-                            
-                            image_data = self.data_manager.deobfuscate_binary(obfuscated_data)
-                            
-                            img = Image.open(io.BytesIO(image_data))
-                            img.thumbnail((self.image_service.PREVIEW_MAX_DIMENSION, self.image_service.PREVIEW_MAX_DIMENSION))
-                            
-                            buffer = io.BytesIO()
-                            img.save(buffer, format="PNG")
-                            preview_data = buffer.getvalue()
-                            
-                            obfuscated_preview_data = self.data_manager.obfuscate_binary(preview_data)
-                            preview_relative_path = os.path.join('user_images', 'pv_imgs', filename)
-                            self.data_manager.save_binary(obfuscated_preview_data, preview_relative_path)
-                            
-                            img_meta['pv_url'] = f'/user_image/pv_imgs/{filename}'
-                            data_was_modified = True
-                            print(f"  - Generated preview for: {filename}")
-
-                        except Exception as e:
-                            print(f"  - 💥 Error generating preview for {filename}: {e}")
-
-        if data_was_modified:
-            self.save_data(all_images, "img_data.json", obfuscated=True)
-            print("[CoreAPI Previews] Finished generating previews and saved updates.")
-        else:
-            print("[CoreAPI Previews] All images already have previews.")
-
-
-    # Yuuka: data cleanup v1.0 - Logic dọn dẹp dữ liệu chết
-    def _cleanup_dead_data(self):
-        print("[CoreAPI Cleanup] Checking for dead user data...")
-        # Yuuka: auth rework v1.0 - User hợp lệ là user trong user_data HOẶC whitelist
-        def get_tokens(data):
-            if isinstance(data, list): return set(data)
-            if isinstance(data, dict): return set(data.keys())
-            return set()
-
-        valid_public_tokens = get_tokens(self._user_data.get("users", []))
-        valid_whitelist_tokens = get_tokens(self._whitelist_users)
-        valid_tokens = valid_public_tokens.union(valid_whitelist_tokens)
+    def _load_characters_data(self) -> bool:
+        try:
+            # Tải thumbnails JSON nếu URL còn hợp lệ, ngược lại dùng cache hoặc dict rỗng
+            if self.JSON_THUMBNAILS_URL:
+                thumbs_content = self._fetch_or_read_from_cache("Thumbnails JSON", self.JSON_THUMBNAILS_URL, "wai_character_thumbs.json")
+                self._thumbnails_data_dict = json.loads(thumbs_content)
+            else:
+                local_thumbs_path = self.data_manager.get_path("wai_character_thumbs.json")
+                if os.path.exists(local_thumbs_path):
+                    with open(local_thumbs_path, 'r', encoding='utf-8') as f:
+                        self._thumbnails_data_dict = json.load(f)
+                    print(f"[CoreAPI] Thumbnails URL disabled, loaded from existing cache.")
+                else:
+                    self._thumbnails_data_dict = {}
+                    print(f"[CoreAPI] Thumbnails URL disabled and no cache found, skipping thumbnails.")
+            chars_content = self._fetch_or_read_from_cache("Characters CSV", self.CSV_CHARACTERS_URL, "wai_characters.csv")
+            reader = csv.reader(io.StringIO(chars_content))
+            next(reader, None)
+            temp_list = []
+            for row in reader:
+                # YUUKA'S FIX: Xử lý `row` như một list, kiểm tra phần tử `row[1]`
+                if len(row) >= 2 and row[1] and row[1].strip():
+                    name = row[1].strip()
+                    md5 = hashlib.md5(name.replace('(', '\\(').replace(')', '\\)').encode('utf-8')).hexdigest()
+                    if md5 in self._thumbnails_data_dict:
+                        char_data = {"name": name, "hash": md5}
+                        temp_list.append(char_data)
+                        self._all_characters_dict[md5] = char_data
+            self._all_characters_list = sorted(temp_list, key=lambda x: x['name'].lower())
+            self._thumbnails_loaded = True
+            print(f"[CoreAPI] Loaded {len(self._all_characters_list)} characters successfully.")
+            return True
+        except Exception as e:
+            print(f"💥 CRITICAL ERROR during core data fetching/processing: {e}")
+            return False
+
+    # Yuuka: derived data cache v1.0 - Snapshot nhị phân của danh sách nhân vật + tags
+    def _derived_cache_signature(self):
+        """(mtime_ns, size) của các file nguồn; None nếu CSV nhân vật chưa có hoặc đã quá TTL."""
+        chars_path = self.data_manager.get_path("wai_characters.csv")
+        if not os.path.exists(chars_path) or (time.time() - os.path.getmtime(chars_path)) > self.CACHE_TTL_SECONDS:
+            return None
+        signature = [self.DERIVED_CACHE_VERSION, self.CSV_CHARACTERS_URL, self.JSON_THUMBNAILS_URL]
+        for filename in ("wai_characters.csv", "wai_character_thumbs.json", "tags.csv"):
+            try:
+                stat = os.stat(self.data_manager.get_path(filename))
+                signature.append((filename, stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                signature.append((filename, None, None))
+        return tuple(signature)
+
+    def _load_derived_cache(self) -> bool:
+        signature = self._derived_cache_signature()
+        cache_path = self.data_manager.get_path(self.DERIVED_CACHE_FILENAME)
+        if signature is None or not os.path.exists(cache_path):
+            return False
+        started = time.perf_counter()
+        try:
+            with open(cache_path, 'rb') as f:
+                snapshot = pickle.load(f)
+        except Exception as e:
+            print(f"⚠️ [CoreAPI Cache] Derived data cache unreadable, rebuilding: {e}")
+            return False
+        if not isinstance(snapshot, dict) or snapshot.get("signature") != signature:
+            print("[CoreAPI Cache] Source data changed. Rebuilding derived data cache.")
+            return False
+
+        self._all_characters_list = [{"name": name, "hash": md5} for name, md5 in zip(snapshot["names"], snapshot["hashes"])]
+        self._all_characters_dict = {char_data["hash"]: char_data for char_data in self._all_characters_list}
+        self._tag_predictions = snapshot["tags"]
+        # Thumbnails JSON chỉ cần cho việc trả ảnh, tải nền thay vì chặn khởi động
+        self._thumbnails_loaded = False
+        threading.Thread(target=self._ensure_thumbnails_loaded, name="yuuka-thumbs-loader", daemon=True).start()
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        print(
+            f"[CoreAPI Cache] Loaded {len(self._all_characters_list)} characters and "
+            f"{len(self._tag_predictions)} tags from derived cache in {elapsed_ms:.1f} ms."
+        )
+        return True
 
-        if not valid_tokens:
-            print("[CoreAPI Cleanup] No valid users found. Skipping cleanup.")
+    def _save_derived_cache(self):
+        signature = self._derived_cache_signature()
+        if signature is None:
             return
-        
-        valid_hashes = {hashlib.sha256(t.encode('utf-8')).hexdigest() for t in valid_tokens}
-        
-        # Danh sách các file dữ liệu theo user_hash cần dọn dẹp
-        # Format: (filename, is_image_data)
-        per_user_data_files = [
-            ("img_data.json", True),
-            ("core_lists.json", False),
-            ("scenes.json", False), # Giả định plugin `scene` có file này
-            ("tag_groups.json", False) # Giả định plugin `tagger` có file này
-        ]
-
-        for filename, is_image_data in per_user_data_files:
-            if not os.path.exists(self.data_manager.get_path(filename)):
-                continue
-
-            data = self.read_data(filename, obfuscated=True)
-            if not isinstance(data, dict): continue
-
-            dead_user_hashes = [h for h in data if h not in valid_hashes]
-            
-            if not dead_user_hashes:
-                print(f"  - '{filename}' is clean.")
-                continue
-
-            print(f"  - Found {len(dead_user_hashes)} dead user(s) in '{filename}'. Cleaning...")
-            
-            for user_hash in dead_user_hashes:
-                if is_image_data:
-                    # Xử lý xóa file ảnh vật lý
-                    user_images_by_char = data.get(user_hash, {})
-                    for char_hash, images in user_images_by_char.items():
-                        for img_meta in images:
-                            for url_key in ['url', 'pv_url']:
-                                if (url := img_meta.get(url_key)) and url.startswith('/user_image/'):
-                                    try:
-                                        # URL: /user_image/imgs/filename.png -> Path: user_images/imgs/filename.png
-                                        relative_path = os.path.join(*url.strip('/').split('/'))
-                                        filepath = self.data_manager.get_path(relative_path)
-                                        if os.path.exists(filepath): os.remove(filepath)
-                                    except Exception as e:
-                                        print(f"    - ⚠️ Could not delete image file {url}: {e}")
-                
-                del data[user_hash]
-            
-            self.save_data(data, filename, obfuscated=True)
-            print(f"  - Cleanup for '{filename}' complete.")
-            
-    # Yuuka: orphan file cleanup v1.0 - Logic dọn dẹp file mồ côi
-    def _cleanup_orphan_files(self):
-        print("[CoreAPI Cleanup] Checking for orphan image files...")
-        all_images = self.read_data("img_data.json", obfuscated=True)
-        valid_filenames = set()
-        
-        if all_images and isinstance(all_images, dict):
-            for user_hash, characters in all_images.items():
-                for char_hash, images in characters.items():
-                    for img_meta in images:
-                        if url := img_meta.get('url'):
-                            valid_filenames.add(os.path.basename(url))
-                        if pv_url := img_meta.get('pv_url'):
-                            valid_filenames.add(os.path.basename(pv_url))
-        
-        user_images_dir = self.data_manager.get_path('user_images')
-        deleted_count = 0
+        snapshot = {
+            "signature": signature,
+            "names": [c["name"] for c in self._all_characters_list],
+            "hashes": [c["hash"] for c in self._all_characters_list],
+            "tags": list(self._tag_predictions),
+        }
+        cache_path = self.data_manager.get_path(self.DERIVED_CACHE_FILENAME)
+        tmp_path = f"{cache_path}.tmp"
         try:
-            for filename in os.listdir(user_images_dir):
-                file_path = os.path.join(user_images_dir, filename)
-                # Chỉ xử lý file, bỏ qua các thư mục con như 'imgs', 'pv_imgs'
-                if os.path.isfile(file_path):
-                    if filename not in valid_filenames:
-                        try:
-                            os.remove(file_path)
-                            print(f"  - Deleted orphan file: {filename}")
-                            deleted_count += 1
-                        except OSError as e:
-                            print(f"  - ⚠️ Failed to delete orphan file {filename}: {e}")
-            
-            if deleted_count > 0:
-                print(f"[CoreAPI Cleanup] Deleted {deleted_count} orphan files.")
-            else:
-                print("[CoreAPI Cleanup] No orphan files found in root user_images directory.")
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, cache_path)
         except Exception as e:
-            print(f"💥 [CoreAPI Cleanup] An error occurred during orphan file cleanup: {e}")
+            print(f"⚠️ [CoreAPI Cache] Could not write derived data cache: {e}")
 
+    def _ensure_thumbnails_loaded(self):
+        if self._thumbnails_loaded:
+            return
+        with self._thumbnails_lock:
+            if self._thumbnails_loaded:
+                return
+            thumbs = {}
+            local_thumbs_path = self.data_manager.get_path("wai_character_thumbs.json")
+            try:
+                if os.path.exists(local_thumbs_path):
+                    with open(local_thumbs_path, 'r', encoding='utf-8') as f:
+                        thumbs = json.load(f)
+            except Exception as e:
+                print(f"⚠️ [CoreAPI] Could not load thumbnails cache: {e}")
+            self._thumbnails_data_dict = thumbs if isinstance(thumbs, dict) else {}
+            self._thumbnails_loaded = True
 
     def load_core_data(self):
         print("[CoreAPI] Loading core data (Users, Characters, Thumbnails, Tags)...")
@@ -545,46 +527,49 @@ class CoreAPI:
             self._user_data = {"users": list(set(old_tokens_dict.values()))}
             self.save_data(self._user_data, "user_data.json", obfuscated=True)
             print("... ✅ Migration complete. New user data format saved.")
+
+        # Yuuka: auth index v1.0 - Chuẩn hoá list cũ sang dict một lần lúc load
+        for attr_name, filename in (("_whitelist_users", "whitelist.json"), ("_waitlist_users", "waitlist.json")):
+            current = getattr(self, attr_name)
+            if not isinstance(current, dict):
+                setattr(self, attr_name, normalize_token_collection(current))
+                self.save_data(getattr(self, attr_name), filename, obfuscated=True)
+                print(f"[CoreAPI] Normalized {filename} to the token dict format.")
+        if not isinstance(self._user_data.get("users"), dict):
+            self._user_data["users"] = normalize_token_collection(self._user_data.get("users"))
+            self.save_data(self._user_data, "user_data.json", obfuscated=True)
+            print("[CoreAPI] Normalized user_data.json users to the token dict format.")
+        self.invalidate_auth_index()
         
-        # Yuuka: Chạy các quy trình dọn dẹp và di chuyển theo thứ tự hợp lý
-        self._migrate_old_images()
-        self._generate_missing_previews() # Yuuka: preview generation v1.0
-        self._cleanup_dead_data()
-        self._cleanup_orphan_files() 
+        # Yuuka: startup maintenance v2.0 - Migrate/preview/cleanup chạy nền qua start_startup_maintenance()
         
-        self._load_tags_data()
-        try:
-            # Tải thumbnails JSON nếu URL còn hợp lệ, ngược lại dùng cache hoặc dict rỗng
-            if self.JSON_THUMBNAILS_URL:
-                thumbs_content = self._fetch_or_read_from_cache("Thumbnails JSON", self.JSON_THUMBNAILS_URL, "wai_character_thumbs.json")
-                self._thumbnails_data_dict = json.loads(thumbs_content)
-            else:
-                local_thumbs_path = self.data_manager.get_path("wai_character_thumbs.json")
-                if os.path.exists(local_thumbs_path):
-                    with open(local_thumbs_path, 'r', encoding='utf-8') as f:
-                        self._thumbnails_data_dict = json.load(f)
-                    print(f"[CoreAPI] Thumbnails URL disabled, loaded from existing cache.")
-                else:
-                    self._thumbnails_data_dict = {}
-                    print(f"[CoreAPI] Thumbnails URL disabled and no cache found, skipping thumbnails.")
-            chars_content = self._fetch_or_read_from_cache("Characters CSV", self.CSV_CHARACTERS_URL, "wai_characters.csv")
-            reader = csv.reader(io.StringIO(chars_content))
-            next(reader, None)
-            temp_list = []
-            for row in reader:
-                # YUUKA'S FIX: Xử lý `row` như một list, kiểm tra phần tử `row[1]`
-                if len(row) >= 2 and row[1] and row[1].strip():
-                    name = row[1].strip()
-                    md5 = hashlib.md5(name.replace('(', '\\(').replace(')', '\\)').encode('utf-8')).hexdigest()
-                    if md5 in self._thumbnails_data_dict:
-                        char_data = {"name": name, "hash": md5}
-                        temp_list.append(char_data)
-                        self._all_characters_dict[md5] = char_data
-            self._all_characters_list = sorted(temp_list, key=lambda x: x['name'].lower())
-            print(f"[CoreAPI] Loaded {len(self._all_characters_list)} characters successfully.")
-        except Exception as e:
-            print(f"💥 CRITICAL ERROR during core data fetching/processing: {e}")
-    
+        # Yuuka: derived data cache v1.0 - Chỉ parse CSV/JSON khi file nguồn thay đổi
+        if not self._load_derived_cache():
+            self._load_tags_data()
+            if self._load_characters_data():
+                self._save_derived_cache()
+        self._character_index = CharacterSearchIndex(self._all_characters_list)
+        threading.Thread(target=self._character_index.warm_up, name="yuuka-character-index", daemon=True).start()
+
+    def start_startup_maintenance(self):
+        """Chạy job bảo trì ảnh (migrate, preview, dọn dẹp) trong background task sau khi server khởi động."""
+        if self._maintenance_job is not None:
+            return self._maintenance_job
+        server_config = self.data_manager.read_json('server_config.json', default_value={}) or {}
+        maintenance_cfg = server_config.get('maintenance') if isinstance(server_config, dict) else None
+        if not isinstance(maintenance_cfg, dict):
+            maintenance_cfg = {}
+        self._maintenance_job = StartupMaintenanceJob(
+            self, delete_dead_user_files=bool(maintenance_cfg.get('delete_dead_user_files', False))
+        )
+        self.task_service.register_thread_task(
+            "core",
+            "startup_maintenance",
+            self._maintenance_job.run,
+            progress_provider=self._maintenance_job.get_progress,
+        )
+        return self._maintenance_job
+
     # --- 5. Yuuka: Hệ thống Dịch vụ (Service System) ---
     def register_service(self, service_name: str, service_callable):
         if service_name in self._services:
@@ -592,8 +577,20 @@ class CoreAPI:
         self._services[service_name] = service_callable
         print(f"[CoreAPI] Service '{service_name}' registered successfully.")
 
+    def register_lazy_service(self, service_name: str, plugin_id: str, activator):
+        """Giữ chỗ cho service của plugin lazy: lần gọi đầu sẽ kích hoạt plugin rồi gọi service thật."""
+        self._lazy_services[service_name] = (plugin_id, activator)
+
+    def unregister_lazy_services(self, plugin_id: str):
+        for name in [n for n, (owner, _) in self._lazy_services.items() if owner == plugin_id]:
+            self._lazy_services.pop(name, None)
+
     def call_service(self, service_name: str, *args, **kwargs):
         service_callable = self._services.get(service_name)
+        if service_callable is None and service_name in self._lazy_services:
+            _, activator = self._lazy_services[service_name]
+            activator()
+            service_callable = self._services.get(service_name)
         if callable(service_callable):
             try: return service_callable(*args, **kwargs)
             except Exception as e:
@@ -616,6 +613,7 @@ class CoreAPI:
         auto_restart: bool = False,
         restart_delay: float = 5.0,
         daemon: bool = True,
+        progress_provider=None,
     ):
         """Convenience wrapper so plugins can register managed background tasks."""
         return self.task_service.register_thread_task(
@@ -630,6 +628,7 @@ class CoreAPI:
             auto_restart=auto_restart,
             restart_delay=restart_delay,
             daemon=daemon,
+            progress_provider=progress_provider,
         )
 
     def stop_background_tasks_for_plugin(self, plugin_id: str, timeout: float = 10.0):
@@ -3,34 +3,83 @@ import subprocess
 import os
 import json
 import sys
+import time
+import site
+import hashlib
+from importlib import metadata as importlib_metadata
 from packaging.requirements import Requirement
 from packaging.utils import canonicalize_name
 from packaging.version import parse as parse_version
 
+# Yuuka: fast dependency check v1.0 - Lưu fingerprint của lần kiểm tra thành công gần nhất
+DEPENDENCY_FINGERPRINT_FILE = os.path.join('data_cache', 'dependency_check.json')
+
 def get_installed_packages():
     """
-    Lấy danh sách các package đã được cài đặt bằng pip freeze.
+    Lấy danh sách các package đã được cài đặt (đọc metadata trực tiếp, không gọi pip).
     Trả về một dictionary: {'package-name': 'version'}.
     """
     try:
-        # Đảm bảo dùng đúng pip của môi trường python hiện tại
-        result = subprocess.run(
-            [sys.executable, '-m', 'pip', 'freeze'],
-            capture_output=True,
-            text=True,
-            check=True,
-            encoding='utf-8'
-        )
         installed = {}
-        for line in result.stdout.strip().split('\n'):
-            if '==' in line:
-                name, version = line.split('==', 1)
-                installed[canonicalize_name(name)] = version
+        for dist in importlib_metadata.distributions():
+            name = dist.metadata['Name'] if dist.metadata else None
+            if not name:
+                continue
+            # Giống thứ tự của sys.path: bản xuất hiện trước là bản được import
+            installed.setdefault(canonicalize_name(name), dist.version)
         return installed
     except Exception as e:
-        print(f"Yuuka: Không thể chạy 'pip freeze': {e}")
+        print(f"Yuuka: Không thể đọc danh sách thư viện đã cài: {e}")
         return {}
 
+def _site_packages_dirs():
+    dirs = set()
+    try:
+        dirs.update(site.getsitepackages())
+    except Exception:
+        pass
+    try:
+        dirs.add(site.getusersitepackages())
+    except Exception:
+        pass
+    for entry in sys.path:
+        if entry and os.path.basename(entry) in ('site-packages', 'dist-packages'):
+            dirs.add(entry)
+    return sorted(d for d in dirs if os.path.isdir(d))
+
+def compute_environment_fingerprint(required_deps):
+    """
+    Hash của danh sách dependency (requirements.txt + plugin.json), interpreter và mtime các thư mục
+    site-packages. Cài/gỡ/nâng cấp package đều thêm hoặc xoá thư mục *.dist-info nên mtime sẽ đổi.
+    """
+    hasher = hashlib.sha256()
+    hasher.update(sys.executable.encode('utf-8'))
+    hasher.update(sys.version.encode('utf-8'))
+    for dep in sorted(required_deps):
+        hasher.update(b'\0' + dep.encode('utf-8'))
+    for directory in _site_packages_dirs():
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+        except OSError:
+            continue
+        hasher.update(f"\0{directory}:{mtime}".encode('utf-8'))
+    return hasher.hexdigest()
+
+def _read_saved_fingerprint():
+    try:
+        with open(DEPENDENCY_FINGERPRINT_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f).get('fingerprint')
+    except Exception:
+        return None
+
+def _save_fingerprint(fingerprint):
+    try:
+        os.makedirs(os.path.dirname(DEPENDENCY_FINGERPRINT_FILE), exist_ok=True)
+        with open(DEPENDENCY_FINGERPRINT_FILE, 'w', encoding='utf-8') as f:
+            json.dump({'fingerprint': fingerprint, 'checked_at': int(time.time())}, f)
+    except Exception as e:
+        print(f"Yuuka: Không thể lưu fingerprint thư viện: {e}")
+
 def get_required_dependencies(plugins_dir='plugins'):
     """
     Lấy tất cả các dependency từ requirements.txt và tất cả các plugin.json.
@@ -65,18 +114,27 @@ def get_required_dependencies(plugins_dir='plugins'):
     return list(dependencies)
 
 
-def check_dependencies():
+def check_dependencies(force=False):
     """
     Kiểm tra xem tất cả các dependency cần thiết đã được cài đặt chưa.
     Trả về một danh sách các gói bị thiếu. Trả về list rỗng nếu đã đủ.
+    Yuuka: fast dependency check v1.0 - Bỏ qua hoàn toàn nếu fingerprint môi trường không đổi
+    so với lần kiểm tra thành công gần nhất (trừ khi force=True).
     """
     print("Yuuka: Đang kiểm tra các thư viện Python cần thiết...")
+    started = time.perf_counter()
     
     required_deps_str = get_required_dependencies()
     if not required_deps_str:
         print("Yuuka: Không tìm thấy file requirements.txt hoặc định nghĩa dependency.")
         return []
 
+    fingerprint = compute_environment_fingerprint(required_deps_str)
+    if not force and fingerprint == _read_saved_fingerprint():
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        print(f"Yuuka: Môi trường không thay đổi, bỏ qua kiểm tra thư viện ({elapsed_ms:.1f} ms).")
+        return []
+
     installed_packages = get_installed_packages()
     if not installed_packages:
         print("Yuuka: Không thể lấy danh sách thư viện đã cài. Bỏ qua kiểm tra.")
@@ -102,12 +160,15 @@ def check_dependencies():
         except Exception as e:
             print(f"Yuuka: Cảnh báo - không thể phân tích dependency '{req_str}': {e}")
 
+    elapsed_ms = (time.perf_counter() - started) * 1000
     if missing_packages:
-        print("Yuuka: Phát hiện các thư viện Python bị thiếu hoặc sai phiên bản:")
+        print(f"Yuuka: Phát hiện các thư viện Python bị thiếu hoặc sai phiên bản ({elapsed_ms:.1f} ms):")
         for pkg in missing_packages:
             print(f"       - {pkg}")
     else:
-        print("Yuuka: Tất cả thư viện cần thiết đã được cài đặt.")
+        # Chỉ lưu fingerprint khi đã đủ, để lần sau vẫn kiểm tra lại nếu còn thiếu
+        _save_fingerprint(fingerprint)
+        print(f"Yuuka: Tất cả thư viện cần thiết đã được cài đặt ({elapsed_ms:.1f} ms).")
         
     return missing_packages
 
@@ -0,0 +1,327 @@
+import ctypes
+import ctypes.util
+import os
+from abc import ABC, abstractmethod
+import select
+import struct
+import sys
+import threading
+from typing import Callable, Dict, Optional, Set, Tuple
+
+try:
+    from watchdog.observers import Observer as _WatchdogObserver
+    from watchdog.events import FileSystemEventHandler as _WatchdogHandler
+except ImportError:
+    _WatchdogObserver = None
+    _WatchdogHandler = object
+
+# Thư mục không bao giờ chứa code backend của plugin -> không theo dõi
+IGNORED_DIR_NAMES = {"__pycache__", "node_modules", ".git", "static"}
+
+WatchCallback = Callable[[str, bool], None]  # (path, is_dir)
+
+
+def _is_ignored_dir(name: str) -> bool:
+    return name in IGNORED_DIR_NAMES or name.startswith(".")
+
+
+class FileWatcherBackend(ABC):
+    """Giao diện chung: gọi `callback(path, is_dir)` mỗi khi có thay đổi dưới `root`."""
+
+    name = "base"
+
+    def __init__(self, root: str, callback: WatchCallback):
+        self.root = os.path.abspath(root)
+        self.callback = callback
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name=f"FileWatcher-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 2.0) -> None:
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+        self._thread = None
+
+    @abstractmethod
+    def _run(self) -> None:
+        """Vòng theo dõi, chạy trên thread riêng cho tới khi `_stop_event` được set."""
+
+    def _emit(self, path: str, is_dir: bool) -> None:
+        try:
+            self.callback(path, is_dir)
+        except Exception as e:
+            print(f"[FileWatcher] Callback error for '{path}': {e}")
+
+
+class InotifyWatcherBackend(FileWatcherBackend):
+    """Linux inotify qua ctypes, không cần thư viện ngoài."""
+
+    name = "inotify"
+
+    IN_MODIFY = 0x00000002
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF = 0x00000800
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ISDIR = 0x40000000
+    WATCH_MASK = (
+        IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+        | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+    )
+    _EVENT_HEADER = struct.Struct("iIII")
+
+    @classmethod
+    def is_supported(cls) -> bool:
+        if not sys.platform.startswith("linux"):
+            return False
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            return hasattr(libc, "inotify_init1")
+        except OSError:
+            return False
+
+    def __init__(self, root: str, callback: WatchCallback):
+        super().__init__(root, callback)
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._fd = -1
+        self._watches: Dict[int, str] = {}
+
+    def _add_watch_tree(self, directory: str) -> None:
+        for current, dirs, _files in os.walk(directory):
+            dirs[:] = [d for d in dirs if not _is_ignored_dir(d)]
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(current), ctypes.c_uint32(self.WATCH_MASK))
+            if wd >= 0:
+                self._watches[wd] = current
+
+    def start(self) -> None:
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._add_watch_tree(self.root)
+        super().start()
+
+    def stop(self, timeout: float = 2.0) -> None:
+        super().stop(timeout)
+        if self._fd >= 0:
+            try:
+                os.close(self._fd)
+            except OSError:
+                pass
+            self._fd = -1
+        self._watches.clear()
+
+    def _run(self) -> None:
+        header_size = self._EVENT_HEADER.size
+        while not self._stop_event.is_set():
+            try:
+                readable, _, _ = select.select([self._fd], [], [], 0.5)
+                if not readable:
+                    continue
+                data = os.read(self._fd, 64 * 1024)
+            except (BlockingIOError, InterruptedError):
+                continue
+            except OSError:
+                if self._stop_event.is_set():
+                    return
+                raise
+            offset = 0
+            while offset + header_size <= len(data):
+                wd, mask, _cookie, name_len = self._EVENT_HEADER.unpack_from(data, offset)
+                raw_name = data[offset + header_size: offset + header_size + name_len].rstrip(b"\0")
+                offset += header_size + name_len
+
+                if mask & self.IN_Q_OVERFLOW:
+                    # Mất sự kiện -> báo thay đổi ở root để phía trên kiểm tra lại toàn bộ
+                    self._emit(self.root, True)
+                    continue
+                directory = self._watches.get(wd)
+                if mask & self.IN_IGNORED:
+                    self._watches.pop(wd, None)
+                    continue
+                if directory is None:
+                    continue
+                name = os.fsdecode(raw_name)
+                path = os.path.join(directory, name) if name else directory
+                is_dir = bool(mask & self.IN_ISDIR)
+                if is_dir and name and _is_ignored_dir(name):
+                    continue
+                if is_dir and mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                    self._add_watch_tree(path)
+                self._emit(path, is_dir or not name)
+
+
+class WatchdogWatcherBackend(FileWatcherBackend):
+    """Dùng thư viện `watchdog` nếu có cài (Windows/macOS)."""
+
+    name = "watchdog"
+
+    @classmethod
+    def is_supported(cls) -> bool:
+        return _WatchdogObserver is not None
+
+    def _run(self) -> None:
+        backend = self
+
+        class _Handler(_WatchdogHandler):
+            def on_any_event(self, event):
+                for path in (getattr(event, "src_path", None), getattr(event, "dest_path", None)):
+                    if not path:
+                        continue
+                    parts = os.path.relpath(path, backend.root).split(os.sep)
+                    if any(_is_ignored_dir(part) for part in parts[:-1]):
+                        continue
+                    backend._emit(path, bool(event.is_directory))
+
+        # Observer tự có thread riêng; thread này chỉ giữ vòng đời của nó cho tới khi stop()
+        observer = _WatchdogObserver()
+        observer.schedule(_Handler(), self.root, recursive=True)
+        observer.start()
+        try:
+            self._stop_event.wait()
+        finally:
+            observer.stop()
+            observer.join(timeout=2.0)
+
+
+class PollingWatcherBackend(FileWatcherBackend):
+    """
+    Fallback không phụ thuộc nền tảng. Mỗi vòng chỉ stat các thư mục và các file liên quan
+    (`relevant_file`); danh sách file của một thư mục chỉ được quét lại khi mtime thư mục đổi.
+    """
+
+    name = "polling"
+
+    def __init__(self, root: str, callback: WatchCallback, *, interval: float = 1.0,
+                 relevant_file: Optional[Callable[[str], bool]] = None):
+        super().__init__(root, callback)
+        self.interval = max(0.2, interval)
+        self._relevant_file = relevant_file or (lambda _name: True)
+        # dir path -> (dir mtime_ns, set(subdirs), {file path: (mtime_ns, size)})
+        self._dirs: Dict[str, Tuple[int, Set[str], Dict[str, Tuple[int, int]]]] = {}
+
+    def _scan_dir(self, directory: str):
+        subdirs: Set[str] = set()
+        files: Dict[str, Tuple[int, int]] = {}
+        try:
+            dir_mtime = os.stat(directory).st_mtime_ns
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if not _is_ignored_dir(entry.name):
+                                subdirs.add(entry.path)
+                        elif self._relevant_file(entry.name):
+                            stat = entry.stat()
+                            files[entry.path] = (stat.st_mtime_ns, stat.st_size)
+                    except OSError:
+                        pass
+        except OSError:
+            return None
+        return dir_mtime, subdirs, files
+
+    def _prime(self, directory: str, emit: bool) -> None:
+        result = self._scan_dir(directory)
+        if result is None:
+            return
+        self._dirs[directory] = result
+        if emit:
+            self._emit(directory, True)
+        for sub in result[1]:
+            self._prime(sub, emit)
+
+    def _forget(self, directory: str) -> None:
+        for path in [p for p in self._dirs if p == directory or p.startswith(directory + os.sep)]:
+            self._dirs.pop(path, None)
+
+    def _poll_once(self) -> None:
+        for directory in list(self._dirs.keys()):
+            state = self._dirs.get(directory)
+            if state is None:
+                continue
+            old_mtime, old_subdirs, old_files = state
+            try:
+                dir_mtime = os.stat(directory).st_mtime_ns
+            except OSError:
+                self._forget(directory)
+                self._emit(directory, True)
+                continue
+
+            if dir_mtime != old_mtime:
+                result = self._scan_dir(directory)
+                if result is None:
+                    continue
+                self._dirs[directory] = result
+                _, new_subdirs, new_files = result
+                for sub in new_subdirs - old_subdirs:
+                    self._prime(sub, emit=True)
+                for sub in old_subdirs - new_subdirs:
+                    self._forget(sub)
+                    self._emit(sub, True)
+                for path in set(old_files) ^ set(new_files):
+                    self._emit(path, False)
+                for path, sig in new_files.items():
+                    if path in old_files and old_files[path] != sig:
+                        self._emit(path, False)
+                continue
+
+            # Sửa file tại chỗ không đổi mtime thư mục -> stat riêng các file liên quan
+            changed = []
+            for path, sig in old_files.items():
+                try:
+                    stat = os.stat(path)
+                    current = (stat.st_mtime_ns, stat.st_size)
+                except OSError:
+                    current = None
+                if current != sig:
+                    changed.append(path)
+            if changed:
+                result = self._scan_dir(directory)
+                if result is not None:
+                    self._dirs[directory] = result
+                for path in changed:
+                    self._emit(path, False)
+
+    def start(self) -> None:
+        self._dirs.clear()
+        self._prime(self.root, emit=False)
+        super().start()
+
+    def _run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            try:
+                if self.root not in self._dirs:
+                    self._prime(self.root, emit=True)
+                self._poll_once()
+            except Exception as e:
+                print(f"[FileWatcher] Polling error: {e}")
+
+
+def create_file_watcher(root: str, callback: WatchCallback, *, backend: str = "auto", poll_interval: float = 1.0,
+                        relevant_file: Optional[Callable[[str], bool]] = None) -> FileWatcherBackend:
+    """Chọn backend: inotify (Linux) -> watchdog -> polling theo mtime thư mục."""
+    backend = (backend or "auto").lower()
+    if backend in ("auto", "inotify") and InotifyWatcherBackend.is_supported():
+        try:
+            watcher = InotifyWatcherBackend(root, callback)
+            watcher.start()
+            return watcher
+        except OSError as e:
+            print(f"[FileWatcher] inotify unavailable ({e}), falling back.")
+    if backend in ("auto", "watchdog") and WatchdogWatcherBackend.is_supported():
+        watcher = WatchdogWatcherBackend(root, callback)
+        watcher.start()
+        return watcher
+    watcher = PollingWatcherBackend(root, callback, interval=poll_interval, relevant_file=relevant_file)
+    watcher.start()
+    return watcher
@@ -6,6 +6,8 @@ import time
 import hashlib
 from collections import defaultdict
 
+from .auth_index import ROLE_ADMIN, ROLE_USER, ROLE_PENDING
+
 class GameService:
     """
     Yuuka: Service mới để quản lý các phòng game PvP và giao tiếp WebSocket.
@@ -124,15 +126,12 @@ class GameService:
             if not origin_ip:
                 origin_ip = client_ip if client_ip != "0.0.0.0" else None
 
-            whitelist = getattr(self.core_api, "_whitelist_users", []) or []
-            user_data = getattr(self.core_api, "_user_data", {}) or {}
-            registered_users = user_data.get("users", []) or []
-            waitlist = getattr(self.core_api, "_waitlist_users", []) or []
-
+            # Yuuka: auth index v1.0 - Tra role qua chỉ mục token của CoreAPI
+            roles = self.core_api.get_token_roles(token)
             is_valid = False
-            if token in whitelist or token in registered_users:
+            if roles & (ROLE_ADMIN | ROLE_USER):
                 is_valid = True
-            elif is_loopback and token in waitlist:
+            elif is_loopback and roles & ROLE_PENDING:
                 is_valid = True
 
             if not is_valid:
@@ -0,0 +1,132 @@
+import itertools
+import json
+from copy import deepcopy
+from typing import Any, Dict, List, Optional, Union
+
+DEFAULT_BATCH_LIMITS = {
+    "max_batch_items": 64,  # Số ảnh tối đa một batch job được tạo
+    "max_batch_size": 4,    # batch_size tối đa của EmptyLatentImage khi gộp các biến thể chỉ khác seed
+}
+
+# Workflow không dùng EmptyLatentImage (video, ảnh đầu vào) -> không gộp bằng batch_size
+_UNBATCHABLE_WORKFLOWS = {"dasiwa_wan2_i2v", "hires_input_image"}
+
+
+def resolve_batch_limits(raw: Optional[dict]) -> Dict[str, int]:
+    """Đọc max_batch_items / max_batch_size từ mục "generation" của server_config.json."""
+    limits = dict(DEFAULT_BATCH_LIMITS)
+    if isinstance(raw, dict):
+        for key in limits:
+            try:
+                value = int(raw.get(key, limits[key]))
+            except (TypeError, ValueError):
+                continue
+            if value > 0:
+                limits[key] = value
+    return limits
+
+
+def _seed_of(config: Dict[str, Any]) -> int:
+    try:
+        return int(config.get("seed", 0) or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def expand_batch(
+    base_config: Dict[str, Any],
+    variants: Optional[List[Dict[str, Any]]] = None,
+    seeds: Union[int, List[int], None] = None,
+    matrix: Optional[Dict[str, List[Any]]] = None,
+    max_items: int = DEFAULT_BATCH_LIMITS["max_batch_items"],
+    max_batch_size: int = DEFAULT_BATCH_LIMITS["max_batch_size"],
+) -> List[Dict[str, Any]]:
+    """
+    Yuuka: batch generation v1.0 - Bung một batch job thành danh sách prompt cho ComfyUI.
+
+    - `matrix`: {field: [values]} -> tích Descartes của các giá trị.
+    - `variants`: danh sách dict ghi đè lên config gốc (kết hợp với matrix nếu có cả hai).
+    - `seeds`: số nguyên N -> N biến thể seed ngẫu nhiên cho mỗi tổ hợp; list -> đúng các seed đó.
+
+    Các config chỉ khác nhau ở seed ngẫu nhiên (seed = 0) được gộp thành một prompt với
+    `_batch_size` tối đa `max_batch_size`. Seed chỉ định rõ thì chạy riêng, vì ảnh thứ i trong một
+    batch của ComfyUI không trùng với ảnh chạy lẻ bằng seed + i.
+
+    Trả về [{"config": dict, "images": int}]. Đầu vào không hợp lệ -> ValueError.
+    """
+    if not isinstance(base_config, dict):
+        raise ValueError("generation_config must be an object.")
+
+    combos: List[Dict[str, Any]] = [{}]
+    if matrix:
+        if not isinstance(matrix, dict):
+            raise ValueError("matrix must map field names to lists of values.")
+        fields = []
+        for field, values in matrix.items():
+            if not isinstance(values, list) or not values:
+                raise ValueError(f"matrix['{field}'] must be a non-empty list.")
+            fields.append((field, values))
+        combos = [
+            dict(zip([f for f, _ in fields], picked))
+            for picked in itertools.product(*[values for _, values in fields])
+        ]
+    if variants:
+        if not isinstance(variants, list) or not all(isinstance(v, dict) for v in variants):
+            raise ValueError("variants must be a list of objects.")
+        combos = [{**combo, **variant} for variant in variants for combo in combos]
+
+    if seeds is None:
+        seed_plan: List[Optional[int]] = [None]
+    elif isinstance(seeds, bool):
+        raise ValueError("seeds must be a count or a list of integers.")
+    elif isinstance(seeds, int):
+        if seeds < 1:
+            raise ValueError("seeds must be at least 1.")
+        seed_plan = [0] * seeds
+    elif isinstance(seeds, list):
+        try:
+            seed_plan = [int(s) for s in seeds]
+        except (TypeError, ValueError):
+            raise ValueError("seeds must be a count or a list of integers.")
+        if not seed_plan:
+            raise ValueError("seeds must not be empty.")
+    else:
+        raise ValueError("seeds must be a count or a list of integers.")
+
+    total = len(combos) * len(seed_plan)
+    if total > max_items:
+        raise ValueError(f"Batch expands to {total} images, the limit is {max_items}.")
+
+    configs: List[Dict[str, Any]] = []
+    for combo in combos:
+        for seed in seed_plan:
+            config = deepcopy(base_config)
+            config.update(deepcopy(combo))
+            if seed is not None:
+                config["seed"] = seed
+            config.pop("_batch_size", None)
+            configs.append(config)
+
+    # Gộp các config giống hệt nhau (trừ seed ngẫu nhiên), giữ nguyên thứ tự xuất hiện
+    prompts: List[Dict[str, Any]] = []
+    open_groups: Dict[str, Dict[str, Any]] = {}
+    batch_limit = max(1, int(max_batch_size))
+    for config in configs:
+        batchable = (
+            batch_limit > 1
+            and _seed_of(config) == 0
+            and config.get("_workflow_type") not in _UNBATCHABLE_WORKFLOWS
+        )
+        if not batchable:
+            prompts.append({"config": config, "images": 1})
+            continue
+        key = json.dumps({k: v for k, v in config.items() if k != "seed"}, sort_keys=True, default=str)
+        group = open_groups.get(key)
+        if group is not None and group["images"] < batch_limit:
+            group["images"] += 1
+            group["config"]["_batch_size"] = group["images"]
+            continue
+        group = {"config": config, "images": 1}
+        open_groups[key] = group
+        prompts.append(group)
+    return prompts
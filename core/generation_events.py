@@ -0,0 +1,210 @@
+import copy
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+# Các trường nội bộ không gửi qua stream (lớn và không đổi trong suốt task)
+_PRIVATE_TASK_FIELDS = ("workflow_node_types", "eta_dims")
+
+
+def public_task_view(task: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in task.items() if k not in _PRIVATE_TASK_FIELDS}
+
+
+def _snapshot_fields(fields: Dict[str, Any]) -> Dict[str, Any]:
+    """Copy sâu các giá trị dict/list: generation_config bị sửa tại chỗ trong lúc chạy (server_address,
+    _workflow_template...) nên giữ tham chiếu thì lần so sánh sau không thấy thay đổi."""
+    return {k: copy.deepcopy(v) if isinstance(v, (dict, list)) else v for k, v in fields.items()}
+
+
+class EventSubscription:
+    """Hàng đợi sự kiện của một consumer. Đầy thì bỏ sự kiện cũ và bật cờ `overflowed` để consumer resync."""
+
+    def __init__(self, bus: "GenerationEventBus", user_hash: str, max_pending: int):
+        self._bus = bus
+        self.user_hash = user_hash
+        self._events: Deque[Dict[str, Any]] = deque(maxlen=max_pending)
+        self._cond = threading.Condition()
+        self.closed = False
+        self.overflowed = False
+
+    def _push(self, event: Dict[str, Any]) -> None:
+        with self._cond:
+            if self.closed:
+                return
+            if len(self._events) == self._events.maxlen:
+                self.overflowed = True
+            self._events.append(event)
+            self._cond.notify()
+
+    def get(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Sự kiện kế tiếp, hoặc None khi hết thời gian chờ / subscription đã đóng."""
+        with self._cond:
+            if not self._events and not self.closed:
+                self._cond.wait(timeout)
+            if self._events:
+                return self._events.popleft()
+            return None
+
+    def reset_overflow(self) -> bool:
+        """Xoá hàng đợi sau khi tràn; trả về True nếu consumer cần gửi lại snapshot."""
+        with self._cond:
+            if not self.overflowed:
+                return False
+            self.overflowed = False
+            self._events.clear()
+            return True
+
+    def close(self) -> None:
+        with self._cond:
+            if self.closed:
+                return
+            self.closed = True
+            self._events.clear()
+            self._cond.notify_all()
+        self._bus._remove(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class GenerationEventBus:
+    """
+    Yuuka: generation event stream v1.0 - Luồng sự kiện tạo ảnh theo từng user.
+
+    Mỗi sự kiện có `seq` tăng dần (bắt đầu từ mốc thời gian khởi động nên seq cũ của lần chạy trước
+    luôn nhỏ hơn). Sự kiện gần đây được giữ trong ring buffer để client nối lại bằng Last-Event-ID;
+    nếu khoảng trống quá xa thì client nhận snapshot mới. Tiến độ task chỉ gửi các trường thay đổi.
+
+    Loại sự kiện: "task" ({task_id, changes, created?}), "task_removed" ({task_id}), "batch"
+    ({batch_id, changes, created?}), "batch_removed" và các sự kiện nghiệp vụ như IMAGE_SAVED / VIDEO_SAVED.
+    """
+
+    BUFFER_SIZE = 256
+    SUBSCRIBER_QUEUE = 512
+
+    def __init__(self, buffer_size: int = BUFFER_SIZE):
+        self.buffer_size = max(16, int(buffer_size))
+        self._lock = threading.Lock()
+        self._seq = int(time.time() * 1000)
+        self._initial_seq = self._seq
+        self._buffers: Dict[str, Deque[Dict[str, Any]]] = {}
+        self._evicted_upto: Dict[str, int] = {}
+        self._subscribers: Dict[str, List[EventSubscription]] = {}
+        self._task_views: Dict[str, Dict[Tuple[str, str], Dict[str, Any]]] = {}
+        self._published = 0
+        self._task_deltas = 0
+        self._suppressed = 0
+        self._resumes = 0
+        self._resyncs = 0
+
+    # ------------------------------------------------------------------ #
+    # Publishing
+    # ------------------------------------------------------------------ #
+
+    def publish(self, user_hash: str, event_type: str, data: Any) -> Dict[str, Any]:
+        with self._lock:
+            self._seq += 1
+            event = {"seq": self._seq, "type": event_type, "data": data, "timestamp": time.time()}
+            buffer = self._buffers.setdefault(user_hash, deque(maxlen=self.buffer_size))
+            if len(buffer) == buffer.maxlen:
+                self._evicted_upto[user_hash] = buffer[0]["seq"]
+            buffer.append(event)
+            subscribers = list(self._subscribers.get(user_hash, ()))
+            self._published += 1
+        for sub in subscribers:
+            sub._push(event)
+        return event
+
+    def publish_task(self, user_hash: str, task: Dict[str, Any], kind: str = "task") -> Optional[Dict[str, Any]]:
+        """
+        So với lần gửi trước của task này và chỉ phát các trường đã đổi. None nếu không có gì mới.
+        `kind` = "batch" dùng cho tiến độ tổng của batch job (khoá là `batch_id`).
+        """
+        id_field = f"{kind}_id"
+        item_id = task.get(id_field)
+        if not item_id:
+            return None
+        view = public_task_view(task)
+        with self._lock:
+            views = self._task_views.setdefault(user_hash, {})
+            previous = views.get((kind, item_id))
+            if previous is None:
+                snapshot = _snapshot_fields(view)
+                payload = {id_field: item_id, "created": True, "changes": snapshot}
+            else:
+                changes = {k: v for k, v in view.items() if k not in previous or previous[k] != v}
+                if not changes and previous.keys() <= view.keys():
+                    self._suppressed += 1
+                    return None
+                # Chỉ copy các trường đã đổi; trường còn lại dùng lại bản chụp trước
+                changes = _snapshot_fields(changes)
+                snapshot = {k: changes[k] if k in changes else previous[k] for k in view}
+                changes.update({k: None for k in previous if k not in view})
+                payload = {id_field: item_id, "changes": changes}
+            views[(kind, item_id)] = snapshot
+            self._task_deltas += 1
+        return self.publish(user_hash, kind, payload)
+
+    def forget_task(self, user_hash: str, task_id: str, announce: bool = True, kind: str = "task") -> None:
+        with self._lock:
+            known = self._task_views.get(user_hash, {}).pop((kind, task_id), None) is not None
+        if known and announce:
+            self.publish(user_hash, f"{kind}_removed", {f"{kind}_id": task_id})
+
+    # ------------------------------------------------------------------ #
+    # Consuming
+    # ------------------------------------------------------------------ #
+
+    def subscribe(self, user_hash: str, max_pending: int = SUBSCRIBER_QUEUE) -> EventSubscription:
+        sub = EventSubscription(self, user_hash, max_pending)
+        with self._lock:
+            self._subscribers.setdefault(user_hash, []).append(sub)
+        return sub
+
+    def _remove(self, sub: EventSubscription) -> None:
+        with self._lock:
+            subs = self._subscribers.get(sub.user_hash)
+            if subs and sub in subs:
+                subs.remove(sub)
+                if not subs:
+                    del self._subscribers[sub.user_hash]
+
+    def last_seq(self) -> int:
+        with self._lock:
+            return self._seq
+
+    def events_since(self, user_hash: str, seq: int) -> Optional[List[Dict[str, Any]]]:
+        """
+        Các sự kiện có seq > `seq`. Trả về None nếu không thể nối tiếp liền mạch (seq của lần chạy
+        trước, hoặc đã bị đẩy khỏi ring buffer) - khi đó client cần snapshot.
+        """
+        with self._lock:
+            if seq > self._seq or seq < self._initial_seq or seq < self._evicted_upto.get(user_hash, 0):
+                self._resyncs += 1
+                return None
+            self._resumes += 1
+            return [event for event in self._buffers.get(user_hash, ()) if event["seq"] > seq]
+
+    def close_all(self) -> None:
+        with self._lock:
+            subs = [sub for subs in self._subscribers.values() for sub in subs]
+        for sub in subs:
+            sub.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "seq": self._seq,
+                "users": len(self._buffers),
+                "subscribers": sum(len(subs) for subs in self._subscribers.values()),
+                "published": self._published,
+                "task_deltas": self._task_deltas,
+                "suppressed_task_updates": self._suppressed,
+                "resumes": self._resumes,
+                "resyncs": self._resyncs,
+            }
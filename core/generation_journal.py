@@ -0,0 +1,84 @@
+import threading
+import time
+from copy import deepcopy
+from typing import Any, Dict, List
+
+
+class GenerationJournal:
+    """
+    Yuuka: task journal v1.0 - Sổ ghi các prompt đã gửi ComfyUI nhưng chưa lưu kết quả.
+
+    Mỗi mục: task_id, user_hash, character_hash, prompt_id, server_address, seed, generation_config,
+    context, output_node_id, use_save_node, result_key, state ("submitted" / "executing"), thời điểm.
+    Mục được ghi khi ComfyUI nhận prompt và xoá khi task kết thúc; còn sót lại sau restart nghĩa là
+    prompt có thể vẫn đang chạy (hoặc đã xong) trên GPU -> GenerationService nhận lại khi khởi động.
+
+    Lưu ở data_cache/generation_journal.json, tắt bằng "generation": {"journal": false}.
+    """
+
+    FILENAME = "generation_journal.json"
+    # ComfyUI chỉ giữ history trong RAM; mục quá cũ gần như chắc chắn không còn gì để lấy
+    MAX_AGE = 24 * 3600
+
+    def __init__(self, data_manager, enabled: bool = True, filename: str = FILENAME):
+        self.data_manager = data_manager
+        self.enabled = bool(enabled)
+        self.filename = filename
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._writes = 0
+
+    def _save_locked(self) -> None:
+        self.data_manager.save_json({"tasks": self._entries}, self.filename)
+        self._writes += 1
+
+    def load(self) -> List[Dict[str, Any]]:
+        """Đọc các mục còn lại từ lần chạy trước (bỏ mục quá cũ / thiếu thông tin), theo thứ tự gửi."""
+        if not self.enabled:
+            return []
+        data = self.data_manager.read_json(self.filename, default_value={}) or {}
+        raw = data.get("tasks") if isinstance(data, dict) else None
+        cutoff = time.time() - self.MAX_AGE
+        entries = {}
+        for task_id, entry in (raw or {}).items():
+            if not isinstance(entry, dict) or not entry.get("prompt_id") or not entry.get("user_hash"):
+                continue
+            if float(entry.get("queued_at") or 0) < cutoff:
+                continue
+            entries[task_id] = entry
+        with self._lock:
+            self._entries = entries
+            if len(entries) != len(raw or {}):
+                self._save_locked()
+            return sorted((dict(e) for e in entries.values()), key=lambda e: e.get("queued_at") or 0)
+
+    def record(self, task_id: str, entry: Dict[str, Any]) -> None:
+        if not self.enabled:
+            return
+        # Copy: generation_config còn bị task sửa tiếp trong lúc journal ghi file ở thread khác
+        entry = deepcopy(dict(entry, task_id=task_id))
+        entry.setdefault("queued_at", time.time())
+        with self._lock:
+            self._entries[task_id] = entry
+            self._save_locked()
+
+    def update(self, task_id: str, **fields: Any) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            entry = self._entries.get(task_id)
+            if entry is None or all(entry.get(k) == v for k, v in fields.items()):
+                return
+            entry.update(fields)
+            self._save_locked()
+
+    def discard(self, task_id: str) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._entries.pop(task_id, None) is not None:
+                self._save_locked()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"enabled": self.enabled, "entries": len(self._entries), "writes": self._writes}
@@ -0,0 +1,244 @@
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+# Các pha của một task, theo thứ tự thời gian
+PHASES = ("queue_wait", "comfy_queue", "execution", "ingest", "total")
+DIMENSIONS = ("workflow", "checkpoint", "resolution", "steps", "server")
+# Yuuka: queue ETA v1.0 - Mức khớp khi ước lượng thời lượng, từ cụ thể tới chung
+ETA_LEVELS = (
+    ("server", "workflow", "resolution", "steps"),
+    ("workflow", "resolution", "steps"),
+    ("workflow", "resolution"),
+    ("workflow",),
+    (),
+)
+
+
+def _percentile(sorted_samples, fraction: float) -> float:
+    if not sorted_samples:
+        return 0.0
+    idx = min(len(sorted_samples) - 1, int(round(fraction * (len(sorted_samples) - 1))))
+    return sorted_samples[idx]
+
+
+def _distribution(values: List[float]) -> Dict[str, float]:
+    values = sorted(values)
+    return {
+        "p50": round(_percentile(values, 0.50), 3),
+        "p95": round(_percentile(values, 0.95), 3),
+        "max": round(values[-1], 3) if values else 0.0,
+    }
+
+
+class TaskTimeline:
+    """
+    Yuuka: generation metrics v1.0 - Đo thời gian một task từ các sự kiện ComfyUI.
+
+    Một node chạy từ lúc nhận `executing` của nó tới sự kiện `executing` kế tiếp (hoặc lúc prompt
+    xong). Node lấy từ cache (`execution_cached`) không được tính giờ. steps/s đo giữa hai sự kiện
+    `progress` đầu và cuối của node để không tính thời gian nạp model.
+    """
+
+    def __init__(self, node_types: Dict[str, str], submitted_at: Optional[float] = None):
+        self.node_types = node_types or {}
+        self.started_at = time.time()
+        self.submitted_at = submitted_at or self.started_at
+        self.queued_at: Optional[float] = None
+        self.exec_start: Optional[float] = None
+        self.exec_end: Optional[float] = None
+        self.nodes: Dict[str, Dict[str, Any]] = {}
+        self.cached_nodes: List[str] = []
+        self._current: Optional[str] = None
+        self._current_since = 0.0
+
+    def mark_queued(self) -> None:
+        self.queued_at = time.time()
+
+    def _close_current(self, now: float) -> None:
+        if self._current is None:
+            return
+        entry = self.nodes.setdefault(self._current, {"seconds": 0.0})
+        entry["seconds"] += max(0.0, now - self._current_since)
+        self._current = None
+
+    def observe(self, msg_type: str, msg_data: Dict[str, Any]) -> None:
+        now = time.time()
+        if msg_type in ("execution_start", "executing", "progress", "execution_cached") and self.exec_start is None:
+            self.exec_start = now
+        if msg_type == "execution_cached":
+            self.cached_nodes = [str(n) for n in (msg_data.get("nodes") or [])]
+        elif msg_type == "executing":
+            self._close_current(now)
+            node = msg_data.get("node")
+            if node is None:
+                self.finish_execution(now)
+            else:
+                self._current = str(node)
+                self._current_since = now
+        elif msg_type == "progress" and self._current is not None:
+            entry = self.nodes.setdefault(self._current, {"seconds": 0.0})
+            value = msg_data.get("value") or 0
+            if "first_step" not in entry:
+                entry["first_step"], entry["first_step_at"] = value, now
+            entry["last_step"], entry["last_step_at"] = value, now
+            entry["steps"] = max(entry.get("steps", 0), value)
+        elif msg_type == "execution_success":
+            self.finish_execution(now)
+
+    def finish_execution(self, now: Optional[float] = None) -> None:
+        now = now or time.time()
+        self._close_current(now)
+        if self.exec_end is None:
+            self.exec_end = now
+        if self.exec_start is None:
+            self.exec_start = now
+
+    def to_sample(self, dims: Dict[str, str], finished_at: Optional[float] = None, images: int = 1) -> Dict[str, Any]:
+        finished_at = finished_at or time.time()
+        self.finish_execution(finished_at)
+        queued_at = self.queued_at or self.started_at
+        phases = {
+            "queue_wait": max(0.0, self.started_at - self.submitted_at),
+            "comfy_queue": max(0.0, self.exec_start - queued_at),
+            "execution": max(0.0, self.exec_end - self.exec_start),
+            "ingest": max(0.0, finished_at - self.exec_end),
+            "total": max(0.0, finished_at - self.submitted_at),
+        }
+        nodes = []
+        for node_id, entry in self.nodes.items():
+            node = {"type": self.node_types.get(node_id) or "unknown", "seconds": entry["seconds"]}
+            if entry.get("steps"):
+                node["steps"] = entry["steps"]
+                span = entry["last_step_at"] - entry["first_step_at"]
+                stepped = entry["last_step"] - entry["first_step"]
+                if span > 0 and stepped > 0:
+                    node["steps_per_sec"] = stepped / span
+                elif entry["seconds"] > 0:
+                    node["steps_per_sec"] = entry["steps"] / entry["seconds"]
+            nodes.append(node)
+        return {
+            "at": finished_at,
+            "dims": {k: str(dims.get(k) or "unknown") for k in DIMENSIONS},
+            "phases": phases,
+            "nodes": nodes,
+            "cached_nodes": len(self.cached_nodes),
+            "images": max(1, int(images or 1)),
+        }
+
+
+class GenerationMetrics:
+    """
+    Yuuka: generation metrics v1.0 - Kho mẫu thời gian (rolling) của các task đã hoàn tất.
+
+    Giữ tối đa `max_samples` mẫu trong `max_age` giây. `summary()` trả về p50/p95 của từng pha
+    (queue_wait: chờ scheduler, comfy_queue: chờ trong hàng đợi ComfyUI, execution, ingest: lấy và lưu
+    kết quả) và của từng loại node, nhóm theo workflow / checkpoint / độ phân giải / server.
+    """
+
+    MAX_SAMPLES = 2000
+    MAX_AGE = 24 * 3600
+    ETA_SAMPLES = 50
+    # Chưa có mẫu nào: giả định một prompt SDXL bình thường
+    DEFAULT_DURATION = {"execution": 25.0, "ingest": 1.0}
+
+    def __init__(self, max_samples: int = MAX_SAMPLES, max_age: float = MAX_AGE):
+        self.max_age = max(60.0, float(max_age))
+        self._lock = threading.Lock()
+        self._samples: Deque[Dict[str, Any]] = deque(maxlen=max(10, int(max_samples)))
+        self._recorded = 0
+        self._outcomes: Dict[str, int] = {}
+        # (mức, giá trị) -> (execution, ingest) gần đây, tính cho một ảnh
+        self._durations: Dict[tuple, Deque[tuple]] = {}
+
+    def record(self, sample: Dict[str, Any]) -> None:
+        images = sample.get("images", 1)
+        per_image = (sample["phases"]["execution"] / images, sample["phases"]["ingest"] / images)
+        with self._lock:
+            self._samples.append(sample)
+            self._recorded += 1
+            for level in ETA_LEVELS:
+                key = (level, tuple(sample["dims"].get(d) for d in level))
+                self._durations.setdefault(key, deque(maxlen=self.ETA_SAMPLES)).append(per_image)
+
+    def estimate(self, dims: Dict[str, Any], images: int = 1) -> Dict[str, Any]:
+        """
+        Thời lượng dự kiến (giây) của một prompt: trung vị của mức khớp cụ thể nhất có mẫu.
+        Trả về {"execution", "ingest", "samples", "basis"}; basis = "default" khi chưa có mẫu nào.
+        """
+        dims = {k: str(v) for k, v in (dims or {}).items() if v is not None}
+        images = max(1, int(images or 1))
+        with self._lock:
+            for level in ETA_LEVELS:
+                if any(d not in dims for d in level):
+                    continue
+                samples = self._durations.get((level, tuple(dims[d] for d in level)))
+                if samples:
+                    execution = sorted(s[0] for s in samples)
+                    ingest = sorted(s[1] for s in samples)
+                    return {
+                        "execution": _percentile(execution, 0.50) * images,
+                        "ingest": _percentile(ingest, 0.50) * images,
+                        "samples": len(samples),
+                        "basis": "/".join(level) or "all",
+                    }
+        return {**{k: v * images for k, v in self.DEFAULT_DURATION.items()}, "samples": 0, "basis": "default"}
+
+    def count_outcome(self, outcome: str) -> None:
+        with self._lock:
+            self._outcomes[outcome] = self._outcomes.get(outcome, 0) + 1
+
+    def _window(self, since: Optional[float]) -> List[Dict[str, Any]]:
+        now = time.time()
+        cutoff = now - self.max_age
+        with self._lock:
+            while self._samples and self._samples[0]["at"] < cutoff:
+                self._samples.popleft()
+            if since:
+                cutoff = max(cutoff, now - float(since))
+            return [s for s in self._samples if s["at"] >= cutoff]
+
+    @staticmethod
+    def _aggregate(samples: List[Dict[str, Any]]) -> Dict[str, Any]:
+        phases = {name: _distribution([s["phases"][name] for s in samples]) for name in PHASES}
+        by_type: Dict[str, Dict[str, list]] = {}
+        for sample in samples:
+            for node in sample["nodes"]:
+                bucket = by_type.setdefault(node["type"], {"seconds": [], "steps_per_sec": []})
+                bucket["seconds"].append(node["seconds"])
+                if "steps_per_sec" in node:
+                    bucket["steps_per_sec"].append(node["steps_per_sec"])
+        execution_total = sum(s["phases"]["execution"] for s in samples)
+        nodes = {}
+        for node_type, bucket in by_type.items():
+            entry = {"count": len(bucket["seconds"]), **_distribution(bucket["seconds"])}
+            # Tỉ lệ trên tổng thời gian thực thi: node nào chiếm nhiều nhất
+            entry["share"] = round(sum(bucket["seconds"]) / execution_total, 3) if execution_total else 0.0
+            if bucket["steps_per_sec"]:
+                entry["steps_per_sec_p50"] = round(_percentile(sorted(bucket["steps_per_sec"]), 0.50), 3)
+            nodes[node_type] = entry
+        return {
+            "count": len(samples),
+            "phases": phases,
+            "nodes": dict(sorted(nodes.items(), key=lambda item: -item[1]["share"])),
+        }
+
+    def summary(self, group_by: Optional[List[str]] = None, since: Optional[float] = None,
+                filters: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        samples = self._window(since)
+        for key, value in (filters or {}).items():
+            if key in DIMENSIONS and value:
+                samples = [s for s in samples if s["dims"][key] == value]
+        groups = [g for g in (group_by or DIMENSIONS) if g in DIMENSIONS]
+        result: Dict[str, Any] = {"overall": self._aggregate(samples)}
+        for dimension in groups:
+            buckets: Dict[str, List[Dict[str, Any]]] = {}
+            for sample in samples:
+                buckets.setdefault(sample["dims"][dimension], []).append(sample)
+            result[f"by_{dimension}"] = {value: self._aggregate(items) for value, items in sorted(buckets.items())}
+        with self._lock:
+            result["recorded"] = self._recorded
+            result["outcomes"] = dict(self._outcomes)
+        result["window_s"] = float(since) if since else self.max_age
+        return result
@@ -0,0 +1,177 @@
+import copy
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+# Khoá config không ảnh hưởng tới ảnh đầu ra (hoặc do builder tự ghi vào config)
+_IGNORED_CONFIG_KEYS = {"server_address", "seed", "_workflow_template", "_workflow_info", "_batch_size"}
+# Workflow có đầu vào ngoài config (ảnh upload) hoặc ra video -> không cache
+_UNCACHEABLE_WORKFLOWS = {"hires_input_image", "dasiwa_wan2_i2v"}
+
+
+def _normalize(value: Any) -> Any:
+    if isinstance(value, str):
+        return value.strip()
+    if isinstance(value, dict):
+        return {str(k): _normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return value
+
+
+class GenerationResultCache:
+    """
+    Yuuka: result cache v1.0 - Trả lại ảnh đã có khi user gửi lại đúng config với seed cố định.
+
+    Khoá = sha1(generationConfig đã chuẩn hoá, seed, version template, checkpoint, alpha), theo từng
+    user + nhân vật. Ảnh lưu xong được gắn `resultKey` trong metadata nên cache sống qua restart:
+    index của một user (khoá -> metadata ảnh) được dựng trên thread nền ở lần tra đầu tiên, lần tra đó
+    tính là miss. Tra trúng chỉ kiểm tra file ảnh còn trên đĩa, không đọc lại img_data.json; ảnh đã
+    bị xoá -> miss.
+
+    Bật trong server_config.json -> "generation": {"result_cache": true}. Mỗi request có thể bỏ qua
+    bằng context {"bypass_cache": true}.
+    """
+
+    MAX_USERS = 256
+
+    def __init__(self, image_service, templates_version: str = "", enabled: bool = False):
+        self.image_service = image_service
+        self.templates_version = templates_version or ""
+        self.enabled = bool(enabled)
+        self._lock = threading.Lock()
+        # user_hash -> {result_key: metadata ảnh}
+        self._index: "OrderedDict[str, Dict[str, Dict[str, Any]]]" = OrderedDict()
+        # user_hash đang dựng index -> ảnh lưu xong trong lúc dựng (gộp vào khi dựng xong)
+        self._building: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._lookups = 0
+        self._cold = 0
+        self._hits = 0
+        self._stale = 0
+        self._bypassed = 0
+        self._stored = 0
+
+    def key_for(self, cfg_data: Dict[str, Any], context: Optional[Dict[str, Any]] = None,
+                default_checkpoint: str = "") -> Optional[str]:
+        """Khoá cache của một request, hoặc None nếu không cache được (seed ngẫu nhiên, batch, video...)."""
+        if not self.enabled or not isinstance(cfg_data, dict):
+            return None
+        try:
+            seed = int(cfg_data.get("seed", 0) or 0)
+        except (TypeError, ValueError):
+            return None
+        if seed == 0 or cfg_data.get("_workflow_type") in _UNCACHEABLE_WORKFLOWS:
+            return None
+        try:
+            if int(cfg_data.get("_batch_size") or 1) > 1:
+                return None
+        except (TypeError, ValueError):
+            return None
+        context = context if isinstance(context, dict) else {}
+        # Giá trị rỗng coi như không có (vd. lora_prompt_tags = [] do service tự ghi vào config đã lưu)
+        normalized = {
+            k: value for k, value in ((k, _normalize(v)) for k, v in cfg_data.items() if k not in _IGNORED_CONFIG_KEYS)
+            if value not in (None, "", [], {})
+        }
+        payload = {
+            "config": normalized,
+            "seed": seed,
+            "templates": self.templates_version,
+            "checkpoint": str(cfg_data.get("ckpt_name") or default_checkpoint).strip(),
+            "alpha": bool(context.get("Alpha") or context.get("alpha") is True),
+        }
+        try:
+            encoded = json.dumps(payload, sort_keys=True, default=str)
+        except (TypeError, ValueError):
+            return None
+        return hashlib.sha1(encoded.encode("utf-8")).hexdigest()
+
+    def note_bypass(self) -> None:
+        with self._lock:
+            self._bypassed += 1
+
+    def _user_index(self, user_hash: str) -> Optional[Dict[str, Dict[str, Any]]]:
+        """Index của user nếu đã dựng xong; chưa có thì bắt đầu dựng trên thread nền và trả về None."""
+        with self._lock:
+            index = self._index.get(user_hash)
+            if index is not None:
+                self._index.move_to_end(user_hash)
+                return index
+            if user_hash in self._building:
+                return None
+            self._building[user_hash] = {}
+        threading.Thread(
+            target=self._build_index, args=(user_hash,), name="ResultCacheIndex", daemon=True,
+        ).start()
+        return None
+
+    def _build_index(self, user_hash: str) -> None:
+        built: Dict[str, Dict[str, Any]] = {}
+        try:
+            # Mới nhất trước: cùng khoá thì giữ ảnh mới nhất
+            for image in self.image_service.get_user_image_records(user_hash):
+                key = image.get("resultKey")
+                if key and image.get("id"):
+                    built.setdefault(key, image)
+        except Exception as e:
+            print(f"[ResultCache] Could not index images of user {user_hash[-4:]}: {e}")
+            with self._lock:
+                self._building.pop(user_hash, None)
+            return
+        with self._lock:
+            built.update(self._building.pop(user_hash, {}))
+            self._index[user_hash] = built
+            while len(self._index) > self.MAX_USERS:
+                self._index.popitem(last=False)
+
+    def lookup(self, user_hash: str, character_hash: str, key: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Bản sao metadata ảnh đã lưu cho khoá này, hoặc None. Không đọc img_data.json."""
+        if not key:
+            return None
+        index = self._user_index(user_hash)
+        with self._lock:
+            self._lookups += 1
+            if index is None:
+                self._cold += 1
+                return None
+            image = index.get(key)
+        if image is None or image.get("character_hash") != character_hash:
+            return None
+        exists = self.image_service.image_file_exists(image)
+        with self._lock:
+            if not exists:
+                if index.get(key) is image:
+                    index.pop(key, None)
+                self._stale += 1
+                return None
+            self._hits += 1
+        return copy.deepcopy(image)
+
+    def remember(self, user_hash: str, key: Optional[str], metadata: Optional[Dict[str, Any]]) -> None:
+        if not key or not isinstance(metadata, dict) or not metadata.get("id"):
+            return
+        with self._lock:
+            index = self._index.get(user_hash)
+            if index is None:
+                index = self._building.get(user_hash)
+            # Chưa dựng index cho user này: lần tra sau sẽ đọc resultKey từ img_data.json
+            if index is not None:
+                index[key] = copy.deepcopy(metadata)
+            self._stored += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "templates_version": self.templates_version,
+                "users_indexed": len(self._index),
+                "lookups": self._lookups,
+                "hits": self._hits,
+                "cold_misses": self._cold,
+                "hit_rate": round(self._hits / self._lookups, 3) if self._lookups else 0.0,
+                "stale": self._stale,
+                "bypassed": self._bypassed,
+                "stored": self._stored,
+            }
@@ -0,0 +1,472 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Iterator, Optional, Tuple
+
+DEFAULT_GENERATION_LIMITS = {
+    "max_workers": 16,       # Số task tạo ảnh chạy đồng thời tối đa trên toàn server
+    "per_server_limit": 2,   # Số prompt đang xử lý tối đa trên mỗi ComfyUI (1 đang chạy + 1 look-ahead)
+    "max_queue": 500,        # Số task chờ tối đa trong hàng đợi phía server
+    "sticky_window": 0,      # > 0: ưu tiên prompt cùng checkpoint + LoRA trong N job đầu hàng của mỗi user
+}
+
+# Yuuka: fair scheduling v1.0 - Thứ tự lane từ ưu tiên cao xuống thấp và trọng số mặc định.
+# Lane nặng hơn được nhả nhiều prompt hơn mỗi vòng nhưng lane nhẹ vẫn luôn có lượt (không bị bỏ đói).
+PRIORITY_LANES = ("interactive", "bot", "batch")
+DEFAULT_LANE_WEIGHTS = {"interactive": 6, "bot": 3, "batch": 1}
+
+
+def resolve_generation_limits(raw: Optional[dict]) -> Dict[str, int]:
+    """Đọc mục "generation" của server_config.json, bỏ qua giá trị không hợp lệ."""
+    limits = dict(DEFAULT_GENERATION_LIMITS)
+    if isinstance(raw, dict):
+        for key in limits:
+            try:
+                value = int(raw.get(key, limits[key]))
+            except (TypeError, ValueError):
+                continue
+            if value > 0:
+                limits[key] = value
+    return limits
+
+
+def resolve_lane_weights(raw: Optional[dict]) -> Dict[str, float]:
+    """Đọc "generation" -> "lane_weights" của server_config.json; lane lạ / giá trị <= 0 bị bỏ qua."""
+    weights = {lane: float(w) for lane, w in DEFAULT_LANE_WEIGHTS.items()}
+    configured = raw.get("lane_weights") if isinstance(raw, dict) else None
+    if isinstance(configured, dict):
+        for lane in PRIORITY_LANES:
+            try:
+                value = float(configured.get(lane, weights[lane]))
+            except (TypeError, ValueError):
+                continue
+            if value > 0:
+                weights[lane] = value
+    return weights
+
+
+def classify_priority(context: Optional[dict], batch_id: Optional[str] = None) -> str:
+    """
+    Lane của một task theo context của nơi gọi:
+    - batch job, scene, hoặc context có `auto` (album tự sinh) -> "batch"
+    - discord bot -> "bot"
+    - còn lại (user bấm tạo ảnh trên UI) -> "interactive"
+    Context có thể chỉ định thẳng bằng khoá "priority".
+    """
+    context = context if isinstance(context, dict) else {}
+    explicit = str(context.get("priority") or "").strip().lower()
+    if explicit in PRIORITY_LANES:
+        return explicit
+    source = str(context.get("source") or "").strip().lower()
+    if batch_id or source == "scene" or context.get("auto") is True:
+        return "batch"
+    if source.startswith("discord"):
+        return "bot"
+    return "interactive"
+
+
+class _Job:
+    __slots__ = ("job_id", "server_address", "fn", "on_cancel", "user_hash", "priority", "cost", "affinity",
+                 "enqueued_at", "started_at")
+
+    def __init__(self, job_id: str, server_address: str, fn: Callable[[], Any], on_cancel: Optional[Callable[[], Any]],
+                 user_hash: str = "", priority: str = "interactive", cost: float = 1.0, affinity: str = ""):
+        self.job_id = job_id
+        self.server_address = server_address
+        self.fn = fn
+        self.on_cancel = on_cancel
+        self.user_hash = user_hash
+        self.priority = priority
+        self.cost = cost
+        self.affinity = affinity
+        self.enqueued_at = time.monotonic()
+        self.started_at: Optional[float] = None
+
+
+class _DeficitRoundRobin:
+    """
+    Deficit round robin trên một tập khoá (lane hoặc user). Mỗi lượt quét, khoá chưa đủ "deficit" để
+    trả chi phí job kế tiếp của nó được cộng thêm quantum; khoá đủ thì được chọn và trừ chi phí.
+    Khoá tạm thời không chạy được (server đích đã đầy) bị bỏ qua và không tích luỹ deficit.
+    """
+
+    def __init__(self, quantum_for: Callable[[str], float]):
+        self._quantum_for = quantum_for
+        self._order: Deque[str] = deque()
+        self._deficit: Dict[str, float] = {}
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._deficit
+
+    def add(self, key: str, front: bool = False) -> None:
+        """`front`: khoá vừa có việc trở lại được xếp đầu vòng với sẵn một quantum (dùng cho lane)."""
+        if key in self._deficit:
+            return
+        if front:
+            self._order.appendleft(key)
+            self._deficit[key] = self._quantum_for(key)
+        else:
+            self._order.append(key)
+            self._deficit[key] = 0.0
+
+    def copy(self) -> "_DeficitRoundRobin":
+        """Bản sao thứ tự vòng quay + deficit, dùng để mô phỏng mà không đụng trạng thái thật."""
+        clone = _DeficitRoundRobin(self._quantum_for)
+        clone._order = deque(self._order)
+        clone._deficit = dict(self._deficit)
+        return clone
+
+    def discard(self, key: str) -> None:
+        # Hàng đợi của khoá rỗng -> deficit về 0 như DRR chuẩn, không "để dành" lượt
+        if key in self._deficit:
+            self._order.remove(key)
+            del self._deficit[key]
+
+    def pick(self, cost_of: Callable[[str], Optional[float]]) -> Optional[str]:
+        costs = {key: cost_of(key) for key in self._order}
+        if all(cost is None for cost in costs.values()):
+            return None
+        while True:
+            for _ in range(len(self._order)):
+                key = self._order[0]
+                cost = costs[key]
+                if cost is not None:
+                    if self._deficit[key] >= cost:
+                        self._deficit[key] -= cost
+                        return key
+                    self._deficit[key] += self._quantum_for(key)
+                self._order.rotate(-1)
+
+
+class GenerationScheduler:
+    """
+    Yuuka: generation scheduler v1.0 - Hàng đợi phía server cho các task tạo ảnh.
+
+    Task chỉ được đưa vào ThreadPoolExecutor khi còn slot toàn cục (`max_workers`) và ComfyUI đích
+    còn slot (`per_server_limit`); phần còn lại nằm trong hàng đợi phía server nên số thread và bộ nhớ
+    không tăng theo tải. Task của server đã đầy không chặn task của server khác phía sau.
+
+    Yuuka: fair scheduling v1.0 - Thứ tự nhả task là deficit round robin hai tầng (tương tự vòng
+    round-robin trong AIService._next_task): giữa các lane ưu tiên theo `lane_weights`, rồi giữa các
+    user trong cùng lane, chi phí tính theo số ảnh của prompt. Giữ `per_server_limit` nhỏ để ComfyUI
+    chỉ có ít prompt xếp sẵn, request interactive mới tới không phải chờ sau cả loạt batch.
+
+    Yuuka: sticky scheduling v1.0 - Với `sticky_window` > 0, khi tới lượt một user, job cùng `affinity`
+    (checkpoint + LoRA) với prompt vừa gửi tới server đó được chọn trước, trong phạm vi N job đầu hàng
+    của user. Thứ tự giữa các user/lane vẫn giữ nguyên; job bị vượt chỉ chờ tối đa N lượt.
+    """
+
+    WAIT_SAMPLES = 512
+
+    def __init__(self, max_workers: int = 16, per_server_limit: int = 2, max_queue: int = 500,
+                 sticky_window: int = 0, lane_weights: Optional[Dict[str, float]] = None):
+        self.max_workers = max(1, int(max_workers))
+        self.per_server_limit = max(1, int(per_server_limit))
+        self.max_queue = max(1, int(max_queue))
+        self.sticky_window = max(0, int(sticky_window))
+        self.lane_weights = dict(DEFAULT_LANE_WEIGHTS)
+        self.lane_weights.update(lane_weights or {})
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="GenWorker")
+        self._lock = threading.Lock()
+        self._pending: Dict[str, _Job] = {}
+        # lane -> user_hash -> job của user đó theo thứ tự gửi
+        self._queues: Dict[str, Dict[str, Deque[_Job]]] = {lane: {} for lane in PRIORITY_LANES}
+        self._lane_rr = _DeficitRoundRobin(lambda lane: self.lane_weights.get(lane, 1.0))
+        self._user_rr: Dict[str, _DeficitRoundRobin] = {
+            lane: _DeficitRoundRobin(lambda _user: 1.0) for lane in PRIORITY_LANES
+        }
+        self._running: Dict[str, _Job] = {}
+        self._per_server: Dict[str, int] = {}
+        self._server_limits: Dict[str, int] = {}
+        self._last_affinity: Dict[str, str] = {}
+        self._sticky_hits = 0
+        self._wait_samples: Deque[float] = deque(maxlen=self.WAIT_SAMPLES)
+        self._lane_wait_samples: Dict[str, Deque[float]] = {
+            lane: deque(maxlen=self.WAIT_SAMPLES) for lane in PRIORITY_LANES
+        }
+        self._lane_dispatched: Dict[str, int] = {lane: 0 for lane in PRIORITY_LANES}
+        self._submitted = 0
+        self._completed = 0
+        self._cancelled = 0
+        self._rejected = 0
+        self._max_wait = 0.0
+
+    # ------------------------------------------------------------------ #
+    # Public API
+    # ------------------------------------------------------------------ #
+
+    def submit(self, job_id: str, server_address: str, fn: Callable[[], Any],
+               on_cancel: Optional[Callable[[], Any]] = None, user_hash: str = "",
+               priority: str = "interactive", cost: float = 1.0, affinity: str = "") -> bool:
+        """
+        Xếp một task vào hàng đợi. Trả về False nếu hàng đợi đã đầy.
+        `priority` là một trong PRIORITY_LANES (giá trị lạ -> "interactive"), `cost` là số ảnh của prompt,
+        `affinity` là chữ ký model dùng cho sticky ordering.
+        """
+        if priority not in self._queues:
+            priority = "interactive"
+        job = _Job(job_id, server_address or "", fn, on_cancel, user_hash or "", priority,
+                   max(1.0, float(cost or 1)), affinity or "")
+        with self._lock:
+            if len(self._pending) >= self.max_queue:
+                self._rejected += 1
+                return False
+            self._enqueue_locked(job)
+            self._submitted += 1
+            self._dispatch_locked()
+        return True
+
+    def set_server_limit(self, server_address: str, limit: int) -> None:
+        """Giới hạn riêng cho một địa chỉ (ví dụ pool nhiều backend có tổng sức chứa lớn hơn)."""
+        with self._lock:
+            self._server_limits[server_address] = max(1, int(limit))
+            self._dispatch_locked()
+
+    def _limit_for(self, server_address: str) -> int:
+        return self._server_limits.get(server_address, self.per_server_limit)
+
+    def cancel(self, job_id: str) -> bool:
+        """Huỷ task còn đang chờ (chưa chạy). Task đã chạy thì trả về False."""
+        with self._lock:
+            job = self._pending.get(job_id)
+            if job is None:
+                return False
+            self._dequeue_locked(job)
+            self._cancelled += 1
+        if job.on_cancel:
+            try:
+                job.on_cancel()
+            except Exception as e:
+                print(f"[GenScheduler] on_cancel failed for job {job_id}: {e}")
+        return True
+
+    def queue_position(self, job_id: str, same_server: bool = False) -> Optional[int]:
+        """
+        Vị trí ước lượng (0 = kế tiếp) theo thứ tự nhả dự kiến của DRR hai tầng (xem _dispatch_order_locked).
+        `same_server`: chỉ đếm job có cùng server đích (dùng cho ước lượng ETA).
+        """
+        with self._lock:
+            job = self._pending.get(job_id)
+            if job is None:
+                return None
+            position = 0
+            for other in self._dispatch_order_locked():
+                if other is job:
+                    break
+                if not same_server or other.server_address == job.server_address:
+                    position += 1
+            return position
+
+    def queue_positions(self, server_address: str) -> Dict[str, int]:
+        """
+        Vị trí (như queue_position(same_server=True)) của mọi job đang chờ một server đích, tính trong
+        một lần mô phỏng thay vì một lần cho mỗi job.
+        """
+        with self._lock:
+            positions: Dict[str, int] = {}
+            for job in self._dispatch_order_locked():
+                if job.server_address == server_address:
+                    positions[job.job_id] = len(positions)
+            return positions
+
+    def server_load(self, server_address: str) -> Tuple[int, int]:
+        """(số job đang chạy, giới hạn) của một server đích."""
+        with self._lock:
+            return self._per_server.get(server_address, 0), self._limit_for(server_address)
+
+    def is_pending(self, job_id: str) -> bool:
+        with self._lock:
+            return job_id in self._pending
+
+    def shutdown(self, wait: bool = False) -> None:
+        with self._lock:
+            pending = list(self._pending.values())
+            for job in pending:
+                self._dequeue_locked(job)
+        for job in pending:
+            if job.on_cancel:
+                try:
+                    job.on_cancel()
+                except Exception:
+                    pass
+        self._executor.shutdown(wait=wait)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            samples = sorted(self._wait_samples)
+            now = time.monotonic()
+            oldest_wait = max((now - job.enqueued_at for job in self._pending.values()), default=0.0)
+            pending_by_server: Dict[str, int] = {}
+            for job in self._pending.values():
+                pending_by_server[job.server_address] = pending_by_server.get(job.server_address, 0) + 1
+            lanes = {}
+            for lane in PRIORITY_LANES:
+                lane_samples = sorted(self._lane_wait_samples[lane])
+                lanes[lane] = {
+                    "weight": self.lane_weights.get(lane, 1.0),
+                    "pending": sum(len(queue) for queue in self._queues[lane].values()),
+                    "users": len(self._queues[lane]),
+                    "running": sum(1 for job in self._running.values() if job.priority == lane),
+                    "dispatched": self._lane_dispatched[lane],
+                    "wait_p50_s": round(self._percentile(lane_samples, 0.50), 3),
+                    "wait_p95_s": round(self._percentile(lane_samples, 0.95), 3),
+                }
+            stats = {
+                "max_workers": self.max_workers,
+                "per_server_limit": self.per_server_limit,
+                "max_queue": self.max_queue,
+                "sticky_window": self.sticky_window,
+                "sticky_hits": self._sticky_hits,
+                "running": len(self._running),
+                "pending": len(self._pending),
+                "in_flight_by_server": dict(self._per_server),
+                "pending_by_server": pending_by_server,
+                "lanes": lanes,
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "cancelled": self._cancelled,
+                "rejected": self._rejected,
+                "oldest_pending_wait_s": round(oldest_wait, 3),
+            }
+        stats["wait_s"] = {
+            "samples": len(samples),
+            "avg": round(sum(samples) / len(samples), 3) if samples else 0.0,
+            "p50": round(self._percentile(samples, 0.50), 3),
+            "p95": round(self._percentile(samples, 0.95), 3),
+            "max": round(self._max_wait, 3),
+        }
+        return stats
+
+    # ------------------------------------------------------------------ #
+    # Internals
+    # ------------------------------------------------------------------ #
+
+    @staticmethod
+    def _percentile(sorted_samples, fraction: float) -> float:
+        if not sorted_samples:
+            return 0.0
+        idx = min(len(sorted_samples) - 1, int(round(fraction * (len(sorted_samples) - 1))))
+        return sorted_samples[idx]
+
+    def _enqueue_locked(self, job: _Job) -> None:
+        self._pending[job.job_id] = job
+        self._queues[job.priority].setdefault(job.user_hash, deque()).append(job)
+        self._user_rr[job.priority].add(job.user_hash)
+        # Lane vừa từ rỗng có việc (ví dụ user bấm tạo một ảnh) được phục vụ ngay ở lượt kế tiếp
+        # thay vì chờ hết vòng của các lane đang xếp hàng
+        self._lane_rr.add(job.priority, front=True)
+
+    def _dequeue_locked(self, job: _Job) -> None:
+        self._pending.pop(job.job_id, None)
+        users = self._queues[job.priority]
+        queue = users.get(job.user_hash)
+        if queue is None:
+            return
+        queue.remove(job)
+        if not queue:
+            del users[job.user_hash]
+            self._user_rr[job.priority].discard(job.user_hash)
+            if not users:
+                self._lane_rr.discard(job.priority)
+
+    def _has_slot_locked(self, job: _Job) -> bool:
+        return self._per_server.get(job.server_address, 0) < self._limit_for(job.server_address)
+
+    def _first_runnable_locked(self, lane: str, user_hash: str) -> Optional[_Job]:
+        """
+        Job sớm nhất của user mà server đích còn slot (job kẹt ở server đầy không chặn job khác).
+        Bật sticky thì ưu tiên job cùng affinity với prompt cuối của server trong `sticky_window` job đầu.
+        """
+        first = None
+        for index, job in enumerate(self._queues[lane].get(user_hash, ())):
+            if self.sticky_window and index >= self.sticky_window and first is not None:
+                break
+            if not self._has_slot_locked(job):
+                continue
+            if first is None:
+                first = job
+                if not self.sticky_window:
+                    break
+            if job.affinity and job.affinity == self._last_affinity.get(job.server_address):
+                return job
+        return first
+
+    def _pick_next_locked(self) -> Optional[_Job]:
+        """Chọn lane theo DRR có trọng số, rồi chọn user trong lane theo DRR với chi phí = số ảnh."""
+        def lane_cost(lane: str) -> Optional[float]:
+            for user_hash in self._queues[lane]:
+                if self._first_runnable_locked(lane, user_hash) is not None:
+                    return 1.0
+            return None
+
+        lane = self._lane_rr.pick(lane_cost)
+        if lane is None:
+            return None
+
+        def user_cost(user_hash: str) -> Optional[float]:
+            job = self._first_runnable_locked(lane, user_hash)
+            return job.cost if job is not None else None
+
+        user_hash = self._user_rr[lane].pick(user_cost)
+        return self._first_runnable_locked(lane, user_hash) if user_hash is not None else None
+
+    def _dispatch_order_locked(self) -> Iterator[_Job]:
+        """
+        Thứ tự nhả dự kiến của các job đang chờ: lặp lại _pick_next_locked trên bản sao hàng đợi và
+        deficit của cả hai tầng DRR. Giả định server nào cũng còn slot và bỏ qua sticky ordering.
+        """
+        queues = {lane: {user: deque(jobs) for user, jobs in users.items()} for lane, users in self._queues.items()}
+        lane_rr = self._lane_rr.copy()
+        user_rr = {lane: rotation.copy() for lane, rotation in self._user_rr.items()}
+        while True:
+            lane = lane_rr.pick(lambda key: 1.0 if queues[key] else None)
+            if lane is None:
+                return
+            users = queues[lane]
+            user_hash = user_rr[lane].pick(lambda key: users[key][0].cost if users.get(key) else None)
+            if user_hash is None:
+                return
+            job = users[user_hash].popleft()
+            if not users[user_hash]:
+                del users[user_hash]
+                user_rr[lane].discard(user_hash)
+                if not users:
+                    lane_rr.discard(lane)
+            yield job
+
+    def _dispatch_locked(self) -> None:
+        while len(self._running) < self.max_workers and self._pending:
+            job = self._pick_next_locked()
+            if job is None:
+                return
+            if self.sticky_window and job.affinity:
+                if job.affinity == self._last_affinity.get(job.server_address):
+                    self._sticky_hits += 1
+                self._last_affinity[job.server_address] = job.affinity
+            self._dequeue_locked(job)
+            job.started_at = time.monotonic()
+            waited = job.started_at - job.enqueued_at
+            self._wait_samples.append(waited)
+            self._lane_wait_samples[job.priority].append(waited)
+            self._lane_dispatched[job.priority] += 1
+            self._max_wait = max(self._max_wait, waited)
+            self._running[job.job_id] = job
+            self._per_server[job.server_address] = self._per_server.get(job.server_address, 0) + 1
+            self._executor.submit(self._run_job, job)
+
+    def _run_job(self, job: _Job) -> None:
+        try:
+            job.fn()
+        except Exception as e:
+            print(f"💥 [GenScheduler] Job {job.job_id} raised: {e}")
+        finally:
+            with self._lock:
+                self._running.pop(job.job_id, None)
+                remaining = self._per_server.get(job.server_address, 1) - 1
+                if remaining > 0:
+                    self._per_server[job.server_address] = remaining
+                else:
+                    self._per_server.pop(job.server_address, None)
+                self._completed += 1
+                self._dispatch_locked()
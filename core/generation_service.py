@@ -3,52 +3,615 @@ import uuid
 import threading
 import time
 import json
-import websocket
 from datetime import datetime
 
+from .generation_scheduler import (
+    GenerationScheduler, classify_priority, resolve_generation_limits, resolve_lane_weights,
+)
+from .comfy_backend_pool import POOL_ADDRESS, ComfyBackendPool, is_connection_error
+from .generation_events import GenerationEventBus, public_task_view
+from .generation_batch import expand_batch, resolve_batch_limits
+from .generation_journal import GenerationJournal
+from .generation_metrics import GenerationMetrics, TaskTimeline
+from .generation_result_cache import GenerationResultCache
+from integrations.workflow_builder_service import DEFAULT_CONFIG, WORKFLOW_INFO_KEY, classify_workflow
+
+# Yuuka: wait deadline v1.0 - Giới hạn (giây) lúc task chờ ComfyUI: queue_timeout tính từ lúc gửi prompt tới khi
+# bắt đầu chạy, disconnect_timeout là thời gian mất websocket liên tục. 0 = không giới hạn.
+DEFAULT_WAIT_LIMITS = {"queue_timeout": 1800, "disconnect_timeout": 300}
+
+PROMPT_DONE, PROMPT_PENDING, PROMPT_MISSING, PROMPT_UNREACHABLE = "done", "pending", "missing", "unreachable"
+
+
+def resolve_wait_limits(raw):
+    """Đọc queue_timeout / disconnect_timeout từ mục "generation" của server_config.json."""
+    limits = dict(DEFAULT_WAIT_LIMITS)
+    if isinstance(raw, dict):
+        for key in limits:
+            try:
+                value = float(raw.get(key, limits[key]))
+            except (TypeError, ValueError):
+                continue
+            if value >= 0:
+                limits[key] = value
+    return limits
+
+
 class GenerationService:
     """Yuuka: Service mới để quản lý tập trung quá trình tạo ảnh."""
     def __init__(self, core_api):
         self.core_api = core_api
         self.image_service = core_api.image_service
         self.MAX_TASKS_PER_USER = 5
+        # Yuuka: generation event stream v1.0 - Task đã xong được giữ tối đa chừng này giây nếu không ai
+        # poll /status (client dùng stream không dọn), event kiểu cũ giữ tối đa LEGACY_EVENT_LIMIT cái
+        self.FINISHED_TASK_TTL = 300
+        self.LEGACY_EVENT_LIMIT = 200
+        # Yuuka: queue ETA v1.0 - ETA của task đang chờ chỉ được phát lại khi lệch quá chừng này giây
+        self.ETA_REFRESH_THRESHOLD = 2.0
+        self.event_bus = GenerationEventBus()
+        # Yuuka: stable node ids v1.0 - Tổng số node ComfyUI lấy lại từ cache trên các task hoàn tất
+        self._stats_lock = threading.Lock()
+        self._execution_cache_stats = {"tasks": 0, "cached_nodes": 0, "total_nodes": 0}
         self.user_states = {}
         self.user_locks = {}
     # Console output coordination for dynamic progress
         self.console_lock = threading.Lock()
         self._last_console_len = 0
+        # Yuuka: generation scheduler v1.0 - Giới hạn toàn cục + theo từng ComfyUI, cấu hình ở
+        # server_config.json -> "generation": {"max_workers", "per_server_limit", "max_queue", "sticky_window"}
+        server_config = core_api.data_manager.read_json('server_config.json', default_value={}) or {}
+        generation_cfg = server_config.get('generation') if isinstance(server_config, dict) else None
+        limits = resolve_generation_limits(generation_cfg)
+        # Yuuka: fair scheduling v1.0 - "generation": {"lane_weights": {"interactive": 6, "bot": 3, "batch": 1}}
+        self.scheduler = GenerationScheduler(**limits, lane_weights=resolve_lane_weights(generation_cfg))
+        # Yuuka: batch generation v1.0 - "generation": {"max_batch_items", "max_batch_size"}
+        self.batch_limits = resolve_batch_limits(generation_cfg)
+        self.wait_limits = resolve_wait_limits(generation_cfg)
+        # Yuuka: save-node output v1.0 - "generation": {"output_mode": "save_node", "save_node": "PreviewImage"}
+        # base64 (mặc định): ảnh nhúng trong history qua ImageToBase64_Yuuka. save_node: node lưu ảnh chuẩn,
+        # tên file lấy từ sự kiện 'executed' trên websocket và tải bytes qua /view.
+        generation_cfg = generation_cfg if isinstance(generation_cfg, dict) else {}
+        self.output_mode = str(generation_cfg.get('output_mode') or 'base64').strip().lower()
+        self.save_node_class = str(generation_cfg.get('save_node') or 'PreviewImage').strip()
+        # Yuuka: result cache v1.0 - "generation": {"result_cache": true}; context {"bypass_cache": true} để bỏ qua
+        self.result_cache = GenerationResultCache(
+            self.image_service,
+            getattr(core_api.workflow_builder, 'templates_version', ''),
+            enabled=bool(generation_cfg.get('result_cache')),
+        )
+        # Yuuka: generation metrics v1.0 - Thời gian từng pha / từng node, xem /api/core/generate/metrics
+        self.metrics = GenerationMetrics()
+        # Yuuka: comfy backend pool v1.0 - Nhiều ComfyUI, cấu hình ở server_config.json -> "comfy_backends"
+        self.backend_pool = ComfyBackendPool(
+            server_config.get('comfy_backends') if isinstance(server_config, dict) else None,
+            queue_depth_provider=core_api.comfy_event_hub.get_queue_remaining,
+        )
+        if self.backend_pool.enabled:
+            self.scheduler.set_server_limit(POOL_ADDRESS, self.backend_pool.total_capacity)
+            self.backend_pool.start()
+        # Yuuka: task journal v1.0 - Prompt đang chạy trên ComfyUI khi server restart được nhận lại
+        self._shutting_down = False
+        self._journal_stats = {"reattached": 0, "recovered": 0, "lost": 0}
+        self.journal = GenerationJournal(core_api.data_manager, enabled=generation_cfg.get('journal', True) is not False)
+        self._journal_resumed = False
+
+    def shutdown(self):
+        """Dừng scheduler và pool. Task đang chờ ComfyUI vẫn nằm trong journal để nhận lại sau restart."""
+        self._shutting_down = True
+        self.scheduler.shutdown()
+        self.backend_pool.stop()
+
+    def resume_journal(self):
+        """
+        Nhận lại các prompt còn trong journal từ lần chạy trước. Gọi một lần từ initialize_server sau khi
+        dữ liệu lõi và plugin đã nạp xong (task nhận lại gọi ComfyUI và ghi metadata ảnh ngay).
+        """
+        if self._journal_resumed or self._shutting_down:
+            return
+        self._journal_resumed = True
+        self._reattach_journaled_tasks()
+
+    def _reattach_journaled_tasks(self):
+        entries = self.journal.load()
+        if not entries:
+            return
+        print(f"[GenService] Reattaching {len(entries)} ComfyUI prompt(s) left over from the last run.")
+        for entry in entries:
+            self._resume_journaled_task(entry)
+
+    def _resume_journaled_task(self, entry):
+        """Tạo lại task từ một mục journal và xếp vào scheduler; _run_task sẽ nhận lại prompt thay vì gửi mới."""
+        user_hash, task_id = entry["user_hash"], entry["task_id"]
+        character_hash = entry.get("character_hash")
+        cfg_data = entry.get("generation_config") or {}
+        context = entry.get("context") if isinstance(entry.get("context"), dict) else {}
+        server_address = entry.get("server_address") or cfg_data.get('server_address', '127.0.0.1:8888')
+        with self._get_user_lock(user_hash):
+            state = self._user_state_locked(user_hash)
+            task = {
+                "task_id": task_id, "is_running": True, "character_hash": character_hash,
+                "progress_message": "Đang kết nối lại với ComfyUI...", "progress_percent": 0,
+                "cancel_requested": False, "prompt_id": entry["prompt_id"], "context": context,
+                "generation_config": cfg_data, "is_alpha": bool(entry.get("is_alpha")),
+                "comfy_event_type": "scheduled", "created_at": entry.get("created_at") or time.time(),
+                "reattached": True,
+            }
+            task["eta_dims"] = self._metric_dims(cfg_data, server_address)
+            state["tasks"][task_id] = task
+            self._publish_task_locked(user_hash, task)
+            accepted = self.scheduler.submit(
+                task_id,
+                POOL_ADDRESS if self.backend_pool.handles(server_address) else server_address,
+                lambda: self._run_task(user_hash, task_id, character_hash, cfg_data, entry.get("result_key"), resume=entry),
+                on_cancel=lambda: self._mark_task_finished(user_hash, task_id),
+                user_hash=user_hash,
+                cost=self._task_image_count(task),
+            )
+            if not accepted:
+                del state["tasks"][task_id]
+                self.event_bus.forget_task(user_hash, task_id)
+        if accepted:
+            with self._stats_lock:
+                self._journal_stats["reattached"] += 1
+        else:
+            self.journal.discard(task_id)
 
     def _get_user_lock(self, user_hash):
         return self.user_locks.setdefault(user_hash, threading.Lock())
 
+    def _user_state_locked(self, user_hash):
+        state = self.user_states.setdefault(user_hash, {"tasks": {}, "events": []})
+        state.setdefault("batches", {})
+        return state
+
+    def _active_job_count_locked(self, state):
+        """Số tác vụ đang chạy tính vào MAX_TASKS_PER_USER; cả batch job chỉ tính là một."""
+        singles = sum(1 for t in state["tasks"].values() if t["is_running"] and not t.get("batch_id"))
+        batches = sum(1 for b in state.get("batches", {}).values() if b["is_running"])
+        return singles + batches
+
     def start_generation_task(self, user_hash, character_hash, gen_config, context):
+        cached = self._lookup_cached_result(user_hash, character_hash, gen_config, context)
         with self._get_user_lock(user_hash):
-            user_tasks = self.user_states.setdefault(user_hash, {"tasks": {}, "events": []})
-            if len(user_tasks["tasks"]) >= self.MAX_TASKS_PER_USER:
+            user_tasks = self._user_state_locked(user_hash)
+            self._prune_finished_locked(user_hash, user_tasks)
+            if self._active_job_count_locked(user_tasks) >= self.MAX_TASKS_PER_USER:
                 return None, "Đã đạt giới hạn tác vụ đồng thời."
 
-            task_id = str(uuid.uuid4())
-            user_tasks["tasks"][task_id] = {
-                "task_id": task_id, "is_running": True, "character_hash": character_hash,
-                "progress_message": "Đang khởi tạo...", "progress_percent": 0,
-                "cancel_requested": False, "prompt_id": None, "context": context,
-                "generation_config": gen_config, # Yuuka: global cancel v1.0
-                "is_alpha": bool(isinstance(context, dict) and (context.get('Alpha') or context.get('alpha') is True)),
-            }
-            thread = threading.Thread(target=self._run_task, args=(user_hash, task_id, character_hash, gen_config))
-            thread.start()
+            task_id = self._submit_task_locked(user_hash, user_tasks, character_hash, gen_config, context, cached)
+            if not task_id:
+                return None, "Hàng đợi tạo ảnh của server đang đầy, vui lòng thử lại sau."
             return task_id, "Đã bắt đầu tác vụ."
 
+    def _lookup_cached_result(self, user_hash, character_hash, gen_config, context):
+        """
+        Yuuka: result cache v1.0 - (result_key, metadata ảnh đã có hoặc None) của một request.
+        Gọi trước khi lấy user lock để tra cache không chặn /status và huỷ task.
+        """
+        if self.result_cache.enabled and isinstance(context, dict) and context.get('bypass_cache'):
+            self.result_cache.note_bypass()
+            return None, None
+        result_key = self.result_cache.key_for(gen_config, context, DEFAULT_CONFIG["ckpt_name"])
+        return result_key, self.result_cache.lookup(user_hash, character_hash, result_key)
+
+    def _submit_task_locked(self, user_hash, user_tasks, character_hash, gen_config, context, cached, batch_id=None):
+        """
+        Tạo task và xếp vào scheduler. `cached`: kết quả _lookup_cached_result đã tra trước đó.
+        Trả về task_id, hoặc None nếu hàng đợi đã đầy.
+        """
+        task_id = str(uuid.uuid4())
+        user_tasks["tasks"][task_id] = {
+            "task_id": task_id, "is_running": True, "character_hash": character_hash,
+            "progress_message": "Đang chờ lượt xử lý...", "progress_percent": 0,
+            "cancel_requested": False, "prompt_id": None, "context": context,
+            "generation_config": gen_config, # Yuuka: global cancel v1.0
+            "is_alpha": bool(isinstance(context, dict) and (context.get('Alpha') or context.get('alpha') is True)),
+            "comfy_event_type": "scheduled", "created_at": time.time(),
+        }
+        if batch_id:
+            user_tasks["tasks"][task_id]["batch_id"] = batch_id
+        server_address = gen_config.get('server_address', '127.0.0.1:8888') if isinstance(gen_config, dict) else ''
+        if self.backend_pool.handles(server_address):
+            server_address = POOL_ADDRESS
+        user_tasks["tasks"][task_id]["eta_dims"] = self._metric_dims(gen_config, server_address)
+        self._publish_task_locked(user_hash, user_tasks["tasks"][task_id])
+        result_key, cached_image = cached
+        if cached_image is not None:
+            self._complete_from_cache_locked(user_hash, user_tasks["tasks"][task_id], cached_image)
+            return task_id
+        accepted = self.scheduler.submit(
+            task_id,
+            server_address,
+            lambda: self._run_task(user_hash, task_id, character_hash, gen_config, result_key),
+            on_cancel=lambda: self._mark_task_finished(user_hash, task_id),
+            user_hash=user_hash,
+            priority=classify_priority(context, batch_id),
+            cost=self._task_image_count(user_tasks["tasks"][task_id]),
+            affinity=self.core_api.workflow_builder.model_signature(gen_config),
+        )
+        if not accepted:
+            del user_tasks["tasks"][task_id]
+            self.event_bus.forget_task(user_hash, task_id)
+            return None
+        task = user_tasks["tasks"].get(task_id)
+        if task is not None:
+            self._update_eta_locked(task)
+            self._publish_task_locked(user_hash, task)
+        return task_id
+
+    # ---------- Batch jobs ----------
+    def start_batch(self, user_hash, character_hash, base_config, context=None,
+                    variants=None, seeds=None, matrix=None):
+        """
+        Yuuka: batch generation v1.0 - Một lần gửi cho cả seed sweep / prompt matrix.
+
+        Bung thành các prompt ComfyUI (xem `expand_batch`), xếp tất cả vào scheduler liền nhau để
+        hàng đợi GPU không bị trống giữa các ảnh. Cả batch tính là một tác vụ trong giới hạn
+        MAX_TASKS_PER_USER và được theo dõi như một job với tiến độ tổng.
+        Trả về (batch dict, thông điệp); batch = None nếu bị từ chối. Input sai -> ValueError.
+        """
+        prompts = expand_batch(
+            base_config, variants=variants, seeds=seeds, matrix=matrix,
+            max_items=self.batch_limits["max_batch_items"],
+            max_batch_size=self.batch_limits["max_batch_size"],
+        )
+        context = context if isinstance(context, dict) else {}
+        member_contexts = [dict(context, batch_index=index) for index in range(len(prompts))]
+        cached_results = [
+            self._lookup_cached_result(user_hash, character_hash, prompt["config"], member_context)
+            for prompt, member_context in zip(prompts, member_contexts)
+        ]
+        with self._get_user_lock(user_hash):
+            state = self._user_state_locked(user_hash)
+            self._prune_finished_locked(user_hash, state)
+            if self._active_job_count_locked(state) >= self.MAX_TASKS_PER_USER:
+                return None, "Đã đạt giới hạn tác vụ đồng thời."
+            queue_room = self.scheduler.max_queue - self.scheduler.get_stats()["pending"]
+            if len(prompts) > queue_room:
+                return None, "Hàng đợi tạo ảnh của server đang đầy, vui lòng thử lại sau."
+
+            batch_id = str(uuid.uuid4())
+            batch = {
+                "batch_id": batch_id, "is_running": True, "character_hash": character_hash,
+                "context": context, "task_ids": [], "prompts": len(prompts),
+                "total_images": sum(p["images"] for p in prompts), "images_saved": 0,
+                "completed": 0, "failed": 0, "cancelled": 0, "progress_percent": 0,
+                "progress_message": "Đang chờ lượt xử lý...", "created_at": time.time(),
+                "_results": {}, "_unsubmitted": 0, "_submitting": True,
+            }
+            state["batches"][batch_id] = batch
+            for index, prompt in enumerate(prompts):
+                member_context = member_contexts[index]
+                member_context["batch_id"] = batch_id
+                task_id = self._submit_task_locked(
+                    user_hash, state, character_hash, prompt["config"], member_context, cached_results[index],
+                    batch_id=batch_id,
+                )
+                if not task_id:
+                    # Hàng đợi vừa đầy giữa chừng: phần còn lại tính là lỗi, phần đã gửi vẫn chạy
+                    batch["_unsubmitted"] = len(prompts) - index
+                    batch["total_images"] = sum(p["images"] for p in prompts[:index])
+                    break
+                batch["task_ids"].append(task_id)
+            batch["_submitting"] = False
+            if not batch["task_ids"]:
+                del state["batches"][batch_id]
+                return None, "Hàng đợi tạo ảnh của server đang đầy, vui lòng thử lại sau."
+            self._refresh_batch_locked(user_hash, batch)
+            print(f"[GenService] Batch {batch_id[:8]} for {user_hash[-4:]}: "
+                  f"{batch['total_images']} images in {len(batch['task_ids'])} prompts.")
+            return self._batch_view(batch), "Đã bắt đầu batch."
+
+    def get_batch_status(self, user_hash, batch_id):
+        with self._get_user_lock(user_hash):
+            batch = self.user_states.get(user_hash, {}).get("batches", {}).get(batch_id)
+            return self._batch_view(batch) if batch else None
+
+    def cancel_batch(self, user_hash, batch_id):
+        with self._get_user_lock(user_hash):
+            batch = self.user_states.get(user_hash, {}).get("batches", {}).get(batch_id)
+            if not batch or not batch["is_running"]:
+                return False
+            task_ids = list(batch["task_ids"])
+        for task_id in task_ids:
+            self.request_cancellation(user_hash, task_id)
+        return True
+
+    @staticmethod
+    def _task_image_count(task):
+        cfg = task.get("generation_config") if isinstance(task, dict) else None
+        try:
+            return max(1, int((cfg or {}).get("_batch_size") or 1))
+        except (TypeError, ValueError):
+            return 1
+
+    @staticmethod
+    def _batch_view(batch):
+        return {k: v for k, v in batch.items() if not k.startswith('_')}
+
+    def _refresh_batch_locked(self, user_hash, batch):
+        """Tính lại tiến độ tổng (theo số ảnh) từ các task thành viên và phát delta "batch"."""
+        if batch["_submitting"]:
+            return
+        tasks = self.user_states.get(user_hash, {}).get("tasks", {})
+        results = batch["_results"]
+        done_weight = 0.0
+        running_message = None
+        for task_id in batch["task_ids"]:
+            task = tasks.get(task_id)
+            images = self._task_image_count(task) if task else 1
+            if task_id in results:
+                done_weight += images * 100
+            elif task:
+                done_weight += images * (task.get("progress_percent") or 0)
+                if running_message is None and task.get("comfy_event_type") not in (None, "scheduled"):
+                    running_message = task.get("progress_message")
+        finished = len(results)
+        batch["completed"] = sum(1 for r in results.values() if r == "completed")
+        batch["failed"] = sum(1 for r in results.values() if r == "failed") + batch["_unsubmitted"]
+        batch["cancelled"] = sum(1 for r in results.values() if r == "cancelled")
+        total = batch["total_images"] or 1
+        batch["progress_percent"] = int(done_weight / total)
+        if finished >= len(batch["task_ids"]):
+            if batch["is_running"]:
+                batch["is_running"] = False
+                batch["finished_at"] = time.time()
+            batch["progress_percent"] = 100
+            batch["progress_message"] = f"Hoàn tất: {batch['images_saved']}/{batch['total_images']} ảnh."
+        else:
+            batch["progress_message"] = (
+                f"{finished}/{len(batch['task_ids'])} prompt xong - {running_message or 'Đang chờ lượt xử lý...'}"
+            )
+        self.event_bus.publish_task(user_hash, self._batch_view(batch), kind="batch")
+
+    @staticmethod
+    def _metric_dims(cfg_data, server_address):
+        """Khoá nhóm dùng chung cho metrics và ước lượng ETA."""
+        cfg_data = cfg_data if isinstance(cfg_data, dict) else {}
+        info = cfg_data.get(WORKFLOW_INFO_KEY) or classify_workflow(cfg_data)
+        width = cfg_data.get('width') or cfg_data.get('img_width') or DEFAULT_CONFIG["width"]
+        height = cfg_data.get('height') or cfg_data.get('img_height') or DEFAULT_CONFIG["height"]
+        return {
+            "workflow": cfg_data.get('_workflow_type') or info["workflow_type"],
+            "checkpoint": cfg_data.get('ckpt_name') or DEFAULT_CONFIG["ckpt_name"],
+            "resolution": f"{width}x{height}",
+            "steps": str(cfg_data.get('steps') or DEFAULT_CONFIG["steps"]),
+            "server": server_address,
+        }
+
+    def _record_timeline(self, user_hash, task_id, timeline, cfg_data, server_address, images=1):
+        """Yuuka: generation metrics v1.0 - Đưa thời gian của task đã xong vào kho metrics."""
+        sample = timeline.to_sample(self._metric_dims(cfg_data, server_address), images=images)
+        self.metrics.record(sample)
+        with self._get_user_lock(user_hash):
+            task = self.user_states[user_hash]["tasks"].get(task_id)
+            if task:
+                task['timings'] = {name: round(value, 3) for name, value in sample["phases"].items()}
+
+    def _update_eta_locked(self, task, now=None, ahead=None):
+        """
+        Yuuka: queue ETA v1.0 - Ước lượng thời điểm bắt đầu / xong (epoch giây) của task đang chờ hoặc đang chạy.
+
+        Thời lượng lấy từ metrics theo (server, workflow, độ phân giải, steps). Task còn trong scheduler
+        chờ các job đứng trước cùng server; task trong hàng đợi ComfyUI chờ `queue_position` prompt;
+        task đang chạy còn lại phần chưa chạy hết của thời lượng dự kiến. `ahead`: vị trí trong scheduler
+        đã tính sẵn (xem _refresh_waiting_etas).
+        """
+        if not task.get('is_running'):
+            return
+        now = now or time.time()
+        dims = task.get('eta_dims') or {}
+        images = self._task_image_count(task)
+        estimate = self.metrics.estimate(dims, images)
+        duration = estimate["execution"] + estimate["ingest"]
+        per_prompt = self.metrics.estimate({k: v for k, v in dims.items() if k != "steps"})
+        per_prompt = per_prompt["execution"] + per_prompt["ingest"]
+        event_type = task.get('comfy_event_type')
+        started_at = task.get('started_at')
+        if event_type == 'scheduled':
+            server = dims.get("server") or ""
+            if ahead is None:
+                ahead = self.scheduler.queue_position(task['task_id'], same_server=True) or 0
+            running, _limit = self.scheduler.server_load(server)
+            parallel = self.backend_pool.backend_count if server == POOL_ADDRESS else 1
+            start_in = (ahead + running) * per_prompt / max(1, parallel)
+        elif event_type == 'queued':
+            start_in = int(task.get('queue_position') or 0) * per_prompt
+        else:
+            start_in = 0.0
+        if event_type == 'history':
+            remaining = estimate["ingest"]
+        elif started_at:
+            # Quá thời lượng dự kiến thì vẫn báo còn ít nhất 1 giây thay vì ETA trong quá khứ
+            remaining = max(1.0, duration - (now - started_at))
+        else:
+            remaining = duration
+        task['eta_start'] = round(started_at or (now + start_in), 1)
+        task['eta_finish'] = round(now + start_in + remaining, 1)
+        task['eta_basis'] = estimate["basis"]
+
+    def _refresh_etas_locked(self, state):
+        now = time.time()
+        for task in state["tasks"].values():
+            self._update_eta_locked(task, now)
+
+    def _refresh_waiting_etas(self, server_address):
+        """
+        Tính lại ETA của các task còn chờ trong scheduler cho cùng server đích (gọi mỗi khi scheduler nhả
+        một task của server đó). Vị trí của mọi task lấy từ một lần mô phỏng DRR; task có ETA lệch ít hơn
+        ETA_REFRESH_THRESHOLD giây giữ nguyên giá trị cũ và không phát delta.
+        """
+        positions = self.scheduler.queue_positions(server_address)
+        if not positions:
+            return
+        threshold = self.ETA_REFRESH_THRESHOLD
+        for user_hash in list(self.user_states.keys()):
+            with self._get_user_lock(user_hash):
+                tasks = self.user_states.get(user_hash, {}).get("tasks", {})
+                now = time.time()
+                for task_id in positions.keys() & tasks.keys():
+                    task = tasks[task_id]
+                    if not task.get('is_running') or task.get('comfy_event_type') != 'scheduled':
+                        continue
+                    previous = (task.get('eta_start'), task.get('eta_finish'))
+                    self._update_eta_locked(task, now, ahead=positions[task_id])
+                    if None not in previous and abs(task['eta_start'] - previous[0]) < threshold \
+                            and abs(task['eta_finish'] - previous[1]) < threshold:
+                        task['eta_start'], task['eta_finish'] = previous
+                        continue
+                    self._publish_task_locked(user_hash, task)
+
+    def _finish_task_locked(self, user_hash, task, outcome):
+        """Đánh dấu task kết thúc (completed / failed / cancelled) và cập nhật batch chứa nó."""
+        task['is_running'] = False
+        task['finished_at'] = time.time()
+        task.setdefault('outcome', outcome)
+        self._publish_task_locked(user_hash, task)
+        if task['outcome'] == "completed" and task.get('workflow_node_types'):
+            with self._stats_lock:
+                self._execution_cache_stats["tasks"] += 1
+                self._execution_cache_stats["cached_nodes"] += task.get('cached_nodes', 0)
+                self._execution_cache_stats["total_nodes"] += len(task['workflow_node_types'])
+        batch_id = task.get("batch_id")
+        batch = self.user_states.get(user_hash, {}).get("batches", {}).get(batch_id) if batch_id else None
+        if batch is not None:
+            batch["_results"].setdefault(task["task_id"], task['outcome'])
+            self._refresh_batch_locked(user_hash, batch)
+
+    def _complete_from_cache_locked(self, user_hash, task, image_data):
+        """Yuuka: result cache v1.0 - Kết thúc task ngay bằng ảnh đã lưu, không gửi gì tới ComfyUI."""
+        task['progress_message'] = "Đã có sẵn kết quả (cache)."
+        task['progress_percent'] = 100
+        task['comfy_event_type'] = 'cache_hit'
+        task['cache_hit'] = True
+        self._add_event_locked(user_hash, "IMAGE_SAVED", {
+            "task_id": task["task_id"], "image_data": image_data, "context": task.get("context"), "cached": True,
+        })
+        batch = self.user_states.get(user_hash, {}).get("batches", {}).get(task.get("batch_id"))
+        if batch is not None:
+            batch["images_saved"] += 1
+        self._finish_task_locked(user_hash, task, "completed")
+
+    def _mark_task_finished(self, user_hash, task_id):
+        with self._get_user_lock(user_hash):
+            task = self.user_states.get(user_hash, {}).get("tasks", {}).get(task_id)
+            if task:
+                task['cancel_requested'] = True
+                self._finish_task_locked(user_hash, task, "cancelled")
+
+    def _publish_task_locked(self, user_hash, task):
+        """Phát phần thay đổi của task lên event stream. Gọi khi đang giữ user lock để thứ tự đúng."""
+        if self.event_bus.publish_task(user_hash, task) is None:
+            return
+        batch_id = task.get("batch_id")
+        if batch_id and task.get("is_running"):
+            batch = self.user_states.get(user_hash, {}).get("batches", {}).get(batch_id)
+            if batch is not None:
+                self._refresh_batch_locked(user_hash, batch)
+
+    def _prune_finished_locked(self, user_hash, state):
+        now = time.time()
+        expired = [
+            tid for tid, t in state["tasks"].items()
+            if not t["is_running"] and now - t.get("finished_at", now) > self.FINISHED_TASK_TTL
+        ]
+        for tid in expired:
+            del state["tasks"][tid]
+            self.event_bus.forget_task(user_hash, tid)
+        expired_batches = [
+            bid for bid, b in state.get("batches", {}).items()
+            if not b["is_running"] and now - b.get("finished_at", now) > self.FINISHED_TASK_TTL
+        ]
+        for bid in expired_batches:
+            del state["batches"][bid]
+            self.event_bus.forget_task(user_hash, bid, kind="batch")
+
+    def subscribe_events(self, user_hash):
+        """
+        Đăng ký nhận sự kiện tạo ảnh của user (dùng phía server, vd plugin Scene). Không lấy mất event
+        của client khác như get_user_status. Dùng được với `with`; nhớ close() khi xong.
+        """
+        return self.event_bus.subscribe(user_hash)
+
+    def get_stream_snapshot(self, user_hash):
+        """(seq, tasks, batches) nhất quán với nhau: mọi sự kiện có seq lớn hơn đều xảy ra sau snapshot."""
+        with self._get_user_lock(user_hash):
+            state = self.user_states.get(user_hash, {"tasks": {}, "events": []})
+            tasks = {tid: public_task_view(t) for tid, t in state["tasks"].items()}
+            batches = {bid: self._batch_view(b) for bid, b in state.get("batches", {}).items()}
+            return self.event_bus.last_seq(), tasks, batches
+
+    def get_metrics(self, group_by=None, since=None, filters=None):
+        return self.metrics.summary(group_by=group_by, since=since, filters=filters)
+
+    def get_scheduler_stats(self):
+        stats = self.scheduler.get_stats()
+        stats["backend_pool"] = self.backend_pool.get_stats()
+        stats["event_stream"] = self.event_bus.get_stats()
+        stats["workflow_build"] = self.core_api.workflow_builder.get_build_stats()
+        stats["result_cache"] = self.result_cache.get_stats()
+        stats["journal"] = self.journal.get_stats()
+        with self._stats_lock:
+            cache_stats = dict(self._execution_cache_stats)
+            stats["journal"].update(self._journal_stats)
+        cache_stats["cached_node_ratio"] = (
+            round(cache_stats["cached_nodes"] / cache_stats["total_nodes"], 3) if cache_stats["total_nodes"] else 0.0
+        )
+        stats["execution_cache"] = cache_stats
+        return stats
+
+    def _required_models(self, cfg_data):
+        checkpoint = cfg_data.get('ckpt_name') if isinstance(cfg_data.get('ckpt_name'), str) else None
+        try:
+            loras = [spec['lora_name'] for spec in self.core_api.workflow_builder._parse_lora_chain(cfg_data)]
+        except Exception:
+            loras = []
+        return checkpoint, loras
+
+    def _queue_on_backend(self, cfg_data, workflow, requested_address):
+        """
+        Gửi prompt tới ComfyUI. Nếu địa chỉ thuộc pool: chọn backend phù hợp nhất và failover khi
+        không kết nối được. Trả về (prompt_info, address, backend hoặc None).
+        """
+        hub = self.core_api.comfy_event_hub
+        if not self.backend_pool.handles(requested_address):
+            hub.ensure_connected(requested_address, timeout=5.0)
+            return self.core_api.comfy_api_client.queue_prompt(workflow, hub.client_id, requested_address), requested_address, None
+
+        checkpoint, loras = self._required_models(cfg_data)
+        tried = []
+        last_error = None
+        while True:
+            backend = self.backend_pool.acquire(checkpoint, loras, exclude=tried)
+            if backend is None:
+                raise last_error or ConnectionError(f"COMFY_CONN_ERROR:{requested_address or POOL_ADDRESS}:No ComfyUI backend available")
+            try:
+                hub.ensure_connected(backend.address, timeout=5.0)
+                prompt_info = self.core_api.comfy_api_client.queue_prompt(workflow, hub.client_id, backend.address)
+                return prompt_info, backend.address, backend
+            except Exception as e:
+                if not is_connection_error(e):
+                    self.backend_pool.release(backend, False, 0.0)
+                    raise
+                self.backend_pool.report_connection_failure(backend, e)
+                tried.append(backend.address)
+                last_error = e
+
     def get_user_status(self, user_hash):
         with self._get_user_lock(user_hash):
             state = self.user_states.get(user_hash, {"tasks": {}, "events": []})
+            self._refresh_etas_locked(state)
             response = {"tasks": state["tasks"].copy(), "events": list(state["events"])}
+            if state.get("batches"):
+                response["batches"] = {bid: self._batch_view(b) for bid, b in state["batches"].items()}
             state["events"].clear() # Xóa event sau khi đã lấy
             
             # Dọn dẹp task đã hoàn thành
             finished_tasks = [tid for tid, t in state["tasks"].items() if not t["is_running"]]
             for tid in finished_tasks:
                 del state["tasks"][tid]
+                self.event_bus.forget_task(user_hash, tid)
 
             return response
 
@@ -56,9 +619,11 @@ class GenerationService:
         """Return a status snapshot without consuming events or clearing finished tasks."""
         with self._get_user_lock(user_hash):
             state = self.user_states.get(user_hash, {"tasks": {}, "events": []})
+            self._refresh_etas_locked(state)
             return {
                 "tasks": state["tasks"].copy(),
                 "events": list(state["events"]),
+                "batches": {bid: self._batch_view(b) for bid, b in state.get("batches", {}).items()},
             }
 
     def dismiss_task(self, user_hash, task_id):
@@ -70,7 +635,8 @@ class GenerationService:
             task = state.get("tasks", {}).get(task_id)
             if task and task.get("is_running"):
                 return False
-            state.get("tasks", {}).pop(task_id, None)
+            if state.get("tasks", {}).pop(task_id, None) is not None:
+                self.event_bus.forget_task(user_hash, task_id)
             state["events"] = [
                 event for event in state.get("events", [])
                 if str((event.get("data") or {}).get("task_id") or "") != str(task_id)
@@ -78,6 +644,9 @@ class GenerationService:
             return True
 
     def request_cancellation(self, user_hash, task_id):
+        # Task còn nằm trong hàng đợi của scheduler: bỏ ra luôn, không cần đụng tới ComfyUI
+        if self.scheduler.cancel(task_id):
+            return True
         with self._get_user_lock(user_hash):
             task = self.user_states.get(user_hash, {}).get("tasks", {}).get(task_id)
             if not task or not task["is_running"]:
@@ -109,13 +678,19 @@ class GenerationService:
             
             # Đặt cờ hủy nội bộ để dừng vòng lặp trong _run_task
             task["cancel_requested"] = True
+            self._publish_task_locked(user_hash, task)
             return True
 
     def _add_event(self, user_hash, event_type, data):
         with self._get_user_lock(user_hash):
-            self.user_states.setdefault(user_hash, {"tasks": {}, "events": []})["events"].append({
-                "type": event_type, "data": data, "timestamp": time.time()
-            })
+            self._add_event_locked(user_hash, event_type, data)
+
+    def _add_event_locked(self, user_hash, event_type, data):
+        events = self.user_states.setdefault(user_hash, {"tasks": {}, "events": []})["events"]
+        events.append({"type": event_type, "data": data, "timestamp": time.time()})
+        if len(events) > self.LEGACY_EVENT_LIMIT:
+            del events[:-self.LEGACY_EVENT_LIMIT]
+        self.event_bus.publish(user_hash, event_type, data)
 
     # ---------- Console progress helpers ----------
     def _render_generation_progress(self, user_tail: str, workflow_label: str, size_label: str, percent: int):
@@ -145,89 +720,10 @@ class GenerationService:
             pass
 
     # ---------- Workflow label helpers (multi-LoRA aware) ----------
-    def _count_loras_from_cfg(self, cfg: dict) -> int:
-        """Count how many LoRA entries are requested in the config.
-        Supports lora_chain (list of dict/str), lora_names (list or CSV), and lora_name (single).
-        """
-        try:
-            # 1) lora_chain
-            chain = cfg.get('lora_chain')
-            if isinstance(chain, list) and chain:
-                count = 0
-                for item in chain:
-                    if isinstance(item, dict):
-                        name = (item.get('name') or item.get('lora_name') or '').strip()
-                        if name and name.lower() != 'none':
-                            count += 1
-                    elif isinstance(item, str):
-                        name = item.strip()
-                        if name and name.lower() != 'none':
-                            count += 1
-                if count:
-                    return count
-
-            # 2) lora_names (CSV or list)
-            names = cfg.get('lora_names')
-            if isinstance(names, str):
-                parts = [p.strip() for p in names.split(',') if p.strip() and p.strip().lower() != 'none']
-                if parts:
-                    return len(parts)
-            elif isinstance(names, list):
-                parts = []
-                for p in names:
-                    if isinstance(p, str):
-                        s = p.strip()
-                        if s and s.lower() != 'none':
-                            parts.append(s)
-                    elif isinstance(p, dict):
-                        s = (p.get('name') or p.get('lora_name') or '').strip()
-                        if s and s.lower() != 'none':
-                            parts.append(s)
-                if parts:
-                    return len(parts)
-
-            # 3) lora_name (single)
-            single = cfg.get('lora_name')
-            if isinstance(single, str):
-                s = single.strip()
-                if s and s.lower() != 'none':
-                    return 1
-        except Exception:
-            pass
-        return 0
-
-    def _base_workflow_label(self, cfg: dict) -> str:
-        """Derive a base workflow label from config fields.
-        Prefers explicit labels; strips .json suffix if present.
-        """
-        label = (
-            cfg.get('workflow_template') or
-            cfg.get('workflow_type') or
-            cfg.get('_workflow_template') or
-            cfg.get('_workflow_type') or
-            'workflow'
-        )
-        try:
-            if isinstance(label, str) and label.endswith('.json'):
-                return label[:-5]
-        except Exception:
-            pass
-        return label
-
     def _format_workflow_label(self, cfg: dict) -> str:
-        """Format workflow label with multi-LoRA awareness.
-        Examples:
-          - standard
-          - standard + LoRA
-          - hiresfix_esrgan_input_image + 3 LoRA
-        """
-        base = self._base_workflow_label(cfg or {})
-        lora_count = self._count_loras_from_cfg(cfg or {})
-        if lora_count > 1:
-            return f"{base} + {lora_count} LoRA"
-        if lora_count == 1:
-            return f"{base} + LoRA"
-        return base
+        """Nhãn workflow cho log; dùng kết quả phân loại WorkflowBuilder đã gắn vào config nếu có."""
+        info = (cfg or {}).get(WORKFLOW_INFO_KEY) or classify_workflow(cfg or {})
+        return info["label"]
 
     def _friendly_node_label(self, node_type: str) -> str:
         if not isinstance(node_type, str) or not node_type.strip():
@@ -252,26 +748,192 @@ class GenerationService:
         key = node_type.strip().lower()
         return mapping.get(key, node_type)
 
-    def _run_task(self, user_hash, task_id, character_hash, cfg_data):
-        ws = None
+    def _check_resumed_prompt(self, prompt_id, server_address):
+        """
+        Prompt nhận lại từ journal: True nếu đã xong (có output trong history), False nếu vẫn đang chờ /
+        đang chạy trong /queue, hoặc ComfyUI chưa trả lời (vd. đang khởi động) - vòng chờ trong _run_task
+        hỏi lại sau với backoff. Chỉ lỗi khi ComfyUI trả lời được mà không còn prompt.
+        """
+        return self._probe_prompt(prompt_id, server_address) == PROMPT_DONE
+
+    def _locate_prompt(self, prompt_id, server_address):
+        """
+        Hỏi ComfyUI prompt đang ở đâu: PROMPT_DONE (có output trong history), PROMPT_PENDING (còn trong
+        /queue), PROMPT_MISSING (ComfyUI trả lời nhưng không còn prompt, vd. đã restart) hoặc
+        PROMPT_UNREACHABLE (không hỏi được - chưa kết luận gì).
+        """
+        client = self.core_api.comfy_api_client
+        try:
+            if self._history_has_outputs(client.get_history(prompt_id, server_address), prompt_id):
+                return PROMPT_DONE
+            queue = client.get_queue(server_address)
+            for item in (queue.get('queue_running') or []) + (queue.get('queue_pending') or []):
+                if isinstance(item, (list, tuple)) and len(item) > 1 and item[1] == prompt_id:
+                    return PROMPT_PENDING
+            # ComfyUI có thể vừa chạy xong và ghi history trễ
+            time.sleep(0.5)
+            if self._history_has_outputs(client.get_history(prompt_id, server_address), prompt_id):
+                return PROMPT_DONE
+        except Exception:
+            return PROMPT_UNREACHABLE
+        return PROMPT_MISSING
+
+    def _probe_prompt(self, prompt_id, server_address):
+        """_locate_prompt nhưng báo lỗi khi ComfyUI không còn giữ prompt (task mồ côi không chờ mãi)."""
+        location = self._locate_prompt(prompt_id, server_address)
+        if location == PROMPT_MISSING:
+            raise Exception(f"Prompt {prompt_id} không còn trên ComfyUI {server_address} (ComfyUI đã khởi động lại?)")
+        return location
+
+    @staticmethod
+    def _history_has_outputs(history, prompt_id):
+        return bool(((history or {}).get(prompt_id) or {}).get('outputs'))
+
+    def _fetch_save_node_images(self, prompt_id, server_address, output_node_id, refs):
+        """
+        Tải bytes ảnh từ /view theo các tham chiếu {filename, subfolder, type}. Không có tham chiếu từ
+        sự kiện 'executed' (node được cache, mất kết nối hub...) thì đọc history một lần; ComfyUI có thể
+        ghi history trễ hơn thông điệp cuối trên websocket nên thử lại vài lần ngắn.
+        """
+        client = self.core_api.comfy_api_client
+        attempts = 0
+        while not refs and attempts < 5:
+            attempts += 1
+            try:
+                history = client.get_history(prompt_id, server_address)
+                outputs = (history.get(prompt_id) or {}).get('outputs') or {}
+                refs = (outputs.get(str(output_node_id)) or {}).get('images') or []
+            except Exception as e:
+                print(f"[GenService] History fallback failed for {prompt_id}: {e}")
+            if not refs:
+                time.sleep(0.5)
+        return [
+            client.get_image(ref.get('filename'), ref.get('subfolder', ''), ref.get('type', 'output'), server_address)
+            for ref in refs if isinstance(ref, dict) and ref.get('filename')
+        ]
+
+    def _apply_comfy_event(self, task, msg_type, msg_data, workflow_node_types, display):
+        """Cập nhật trạng thái task theo một sự kiện của ComfyEventHub. Trả về True khi prompt đã chạy xong."""
+        user_tail, workflow_label_display, size_label_display = display
+        if msg_type == 'queue_position':
+            if msg_data.get('running'):
+                return False
+            total_ahead = int(msg_data.get('position') or 0)
+            task['progress_message'] = f"Trong hàng đợi ({total_ahead} trước)..."
+            task['comfy_event_type'] = 'queued'
+            task['queue_position'] = total_ahead
+            # Dynamic generation-style progress (0%) while in queue
+            self._render_generation_progress(user_tail, workflow_label_display, size_label_display, 0)
+        elif msg_type == 'execution_start':
+            task['progress_message'] = "Bắt đầu xử lý..."
+            task['comfy_event_type'] = 'execution_start'
+            task['queue_position'] = 0
+            task['current_node'] = None
+            task['current_node_type'] = None
+            task['current_node_label'] = None
+            task['step_value'] = 0
+            task['step_max'] = 0
+            self._render_generation_progress(user_tail, workflow_label_display, size_label_display, 0)
+        elif msg_type == 'executing' and msg_data.get('node') is not None:
+            current_node = str(msg_data.get('node'))
+            node_type = workflow_node_types.get(current_node, '')
+            task['comfy_event_type'] = 'executing'
+            task['queue_position'] = 0
+            task['current_node'] = current_node
+            task['current_node_type'] = node_type or None
+            task['current_node_label'] = self._friendly_node_label(node_type)
+            if task.get('step_max') and task.get('step_value'):
+                task['progress_message'] = f"{task['current_node_label']}... {task['progress_percent']}%"
+            else:
+                task['progress_message'] = f"{task['current_node_label']}..."
+        elif msg_type == 'execution_cached':
+            # Yuuka: stable node ids v1.0 - ComfyUI gửi danh sách node được lấy lại từ cache
+            cached_nodes = msg_data.get('nodes')
+            if isinstance(cached_nodes, list):
+                total_nodes = len(workflow_node_types) or len(cached_nodes)
+                task['cached_nodes'] = len(cached_nodes)
+                task['cached_node_ratio'] = round(len(cached_nodes) / total_nodes, 3) if total_nodes else 0.0
+            current_node = str(msg_data.get('node') or '')
+            node_type = workflow_node_types.get(current_node, '') if current_node else ''
+            task['comfy_event_type'] = 'execution_cached'
+            if current_node:
+                task['current_node'] = current_node
+            if node_type:
+                task['current_node_type'] = node_type
+                task['current_node_label'] = f"{self._friendly_node_label(node_type)} (cache)"
+                task['progress_message'] = task['current_node_label']
+        elif msg_type == 'progress':
+            v, m = msg_data.get('value', 0), msg_data.get('max', 1)
+            p = int(v / m * 100) if m > 0 else 0
+            task['comfy_event_type'] = 'progress'
+            task['step_value'] = v
+            task['step_max'] = m
+            task['progress_percent'] = p
+            node_label = task.get('current_node_label') or 'Đang tạo'
+            if m and m > 0:
+                task['progress_message'] = f"{node_label}... bước {v}/{m} · {p}%"
+            else:
+                task['progress_message'] = f"{node_label}... {p}%"
+            self._render_generation_progress(user_tail, workflow_label_display, size_label_display, p)
+        elif msg_type == 'execution_success' or (msg_type == 'executing' and msg_data.get('node') is None):
+            # move to 100% visually as execution ends
+            task['comfy_event_type'] = msg_type
+            task['current_node'] = None
+            task['current_node_type'] = None
+            task['current_node_label'] = 'Hoàn tất thực thi'
+            task['progress_percent'] = 100
+            task['progress_message'] = 'Hoàn tất thực thi, đang lấy kết quả...'
+            self._render_generation_progress(user_tail, workflow_label_display, size_label_display, 100)
+            return True
+        elif msg_type == 'execution_error':
+            raise Exception(f"Node error: {msg_data.get('exception_message', 'Unknown')}")
+        elif msg_type == 'execution_interrupted':
+            raise Exception("Execution interrupted on ComfyUI.")
+        return False
+
+    def _run_task(self, user_hash, task_id, character_hash, cfg_data, result_key=None, resume=None):
+        """
+        Chạy một task từ đầu tới lúc lưu kết quả. `resume`: mục journal của prompt đã gửi trước khi
+        server restart - không gửi lại mà nhận lại prompt đó (hoặc lấy luôn kết quả nếu đã xong).
+        """
+        subscription = None
+        backend = None
+        backend_started = time.time()
         execution_successful = False
+        outcome = "failed"
+        keep_journal = False
         start_time = None
         # Yuuka: I2V timeout support
         context = None
+        timeline = None
         with self._get_user_lock(user_hash):
-            context = self.user_states.get(user_hash, {}).get("tasks", {}).get(task_id, {}).get("context") or {}
+            task_state = self.user_states.get(user_hash, {}).get("tasks", {}).get(task_id, {})
+            context = task_state.get("context") or {}
+            submitted_at = task_state.get("created_at")
         timeout_seconds = None
         if isinstance(context, dict):
             ts = context.get('timeout_seconds')
             if ts and int(ts) > 0:
                 timeout_seconds = int(ts)
         try:
-            client_id = str(uuid.uuid4())
-            seed = uuid.uuid4().int % (10**15) if int(cfg_data.get("seed", 0)) == 0 else int(cfg_data.get("seed", 0))
+            with self._get_user_lock(user_hash):
+                task = self.user_states.get(user_hash, {}).get("tasks", {}).get(task_id)
+                if not task or task.get('cancel_requested'):
+                    raise InterruptedError("Cancelled before start.")
+                task['progress_message'] = "Đang khởi tạo..."
+                scheduled_server = (task.get('eta_dims') or {}).get('server') or ''
+                task['comfy_event_type'] = None
+                self._update_eta_locked(task)
+                self._publish_task_locked(user_hash, task)
+            # Scheduler vừa nhả task này: các task còn chờ đều tiến lên một bậc
+            self._refresh_waiting_etas(scheduled_server)
+            if resume:
+                seed = int(resume["seed"])
+            else:
+                seed = uuid.uuid4().int % (10**15) if int(cfg_data.get("seed", 0)) == 0 else int(cfg_data.get("seed", 0))
             target_address = cfg_data.get('server_address', '127.0.0.1:8888')
             # Pre-calc display fields for progress line
             user_tail = user_hash[-4:]
-            workflow_label_display = self._format_workflow_label(cfg_data)
             width_display = cfg_data.get('width') or cfg_data.get('img_width') or '?'
             height_display = cfg_data.get('height') or cfg_data.get('img_height') or '?'
             size_label_display = f"{width_display} x {height_display}"
@@ -281,14 +943,47 @@ class GenerationService:
                 original_lora_tags = []
 
             workflow, output_node_id = self.core_api.workflow_builder.build_workflow(cfg_data, seed)
+            workflow_label_display = self._format_workflow_label(cfg_data)
+            # Output video (VideoToBase64_Yuuka) vẫn đi đường base64
+            wants_save_node = resume.get("use_save_node") if resume else self.output_mode == 'save_node'
+            use_save_node = bool(wants_save_node) and self.core_api.workflow_builder.convert_output_to_save_node(
+                workflow, output_node_id, self.save_node_class
+            )
+            save_node_refs = []
             workflow_node_types = {}
             if isinstance(workflow, dict):
                 for node_id, node_data in workflow.items():
                     if isinstance(node_data, dict):
                         workflow_node_types[str(node_id)] = str(node_data.get('class_type') or '').strip()
             
-            prompt_info = self.core_api.comfy_api_client.queue_prompt(workflow, client_id, target_address)
-            prompt_id = prompt_info['prompt_id']
+            # Yuuka: comfy event hub v1.0 - Dùng websocket chung của hub thay vì mỗi task tự mở socket + poll /queue
+            hub = self.core_api.comfy_event_hub
+            timeline = TaskTimeline(workflow_node_types, submitted_at)
+            prompt_done = False
+            if resume:
+                target_address = resume.get("server_address") or target_address
+                prompt_id = resume["prompt_id"]
+                hub.ensure_connected(target_address, timeout=5.0)
+                # Đăng ký trước khi kiểm tra để không lỡ sự kiện kết thúc xảy ra ở giữa
+                subscription = hub.subscribe(target_address, prompt_id)
+                prompt_done = self._check_resumed_prompt(prompt_id, target_address)
+                timeline.mark_queued()
+            else:
+                prompt_info, target_address, backend = self._queue_on_backend(cfg_data, workflow, target_address)
+                timeline.mark_queued()
+                if backend is not None:
+                    # Ghi lại backend thực tế để huỷ/interrupt đúng server
+                    cfg_data['server_address'] = target_address
+                prompt_id = prompt_info['prompt_id']
+                subscription = hub.subscribe(target_address, prompt_id)
+                self.journal.record(task_id, {
+                    "user_hash": user_hash, "character_hash": character_hash, "prompt_id": prompt_id,
+                    "server_address": target_address, "seed": seed, "generation_config": cfg_data,
+                    "context": context, "is_alpha": bool(task.get('is_alpha')), "output_node_id": output_node_id,
+                    "use_save_node": use_save_node, "result_key": result_key, "state": "submitted",
+                    "created_at": submitted_at,
+                })
+            backend_started = time.time()
 
             with self._get_user_lock(user_hash):
                 task = self.user_states[user_hash]["tasks"][task_id]
@@ -303,145 +998,107 @@ class GenerationService:
                 task['step_value'] = 0
                 task['step_max'] = 0
                 task['workflow_node_types'] = workflow_node_types
+                task['eta_dims'] = dict(task.get('eta_dims') or {}, server=target_address)
+                self._update_eta_locked(task)
+                self._publish_task_locked(user_hash, task)
 
-            # YUUKA: QUEUE POLLING LOGIC v1.0
-            while True:
+            display = (user_tail, workflow_label_display, size_label_display)
+            last_history_check = time.time()
+            probe_interval = 5.0
+            disconnected_since = None
+            queue_timeout = self.wait_limits["queue_timeout"]
+            disconnect_timeout = self.wait_limits["disconnect_timeout"]
+            execution_successful = prompt_done
+            while not prompt_done:
                 with self._get_user_lock(user_hash):
                     task = self.user_states[user_hash]["tasks"].get(task_id)
                     if not task or task.get('cancel_requested'):
-                        raise InterruptedError("Cancelled by user during queue wait.")
-                
-                queue_details = self.core_api.comfy_api_client.get_queue_details_sync(target_address)
-                running_prompts = queue_details.get("queue_running", [])
-                pending_prompts = queue_details.get("queue_pending", [])
-                
-                if any(p[1] == prompt_id for p in running_prompts):
-                    break # Đến lượt của chúng ta, thoát khỏi vòng lặp polling
-                
-                is_pending = any(p[1] == prompt_id for p in pending_prompts)
-                if is_pending:
-                    try:
-                        # Tìm vị trí chính xác trong hàng đợi
-                        queue_pos = [p[1] for p in pending_prompts].index(prompt_id)
-                        total_ahead = len(running_prompts) + queue_pos
-                        with self._get_user_lock(user_hash):
-                            self.user_states[user_hash]["tasks"][task_id]['progress_message'] = f"Trong hàng đợi ({total_ahead} trước)..."
-                            self.user_states[user_hash]["tasks"][task_id]['comfy_event_type'] = 'queued'
-                            self.user_states[user_hash]["tasks"][task_id]['queue_position'] = total_ahead
-                        # Dynamic generation-style progress (0%) while in queue
-                        self._render_generation_progress(user_tail, workflow_label_display, size_label_display, 0)
-                    except ValueError:
-                        pass # Prompt có thể đã chuyển sang running giữa hai lần check
-                    time.sleep(1)
-                else:
-                    # Không running, cũng không pending -> có thể đã xong rất nhanh hoặc lỗi
-                    break
+                        raise InterruptedError("Cancelled by user.")
+                if self._shutting_down:
+                    # Prompt vẫn chạy tiếp trên ComfyUI; mục journal được giữ để nhận lại sau restart
+                    raise InterruptedError("Server shutting down.")
 
-            # Yuuka: creation time patch v1.0 - Bắt đầu đếm giờ ngay khi rời hàng đợi
-            start_time = time.time()
+                # Yuuka: I2V timeout check
+                now = time.time()
+                if timeout_seconds and start_time and (now - start_time) > timeout_seconds:
+                    raise TimeoutError(f"Task quá thời gian ({timeout_seconds}s)")
+                # Yuuka: wait deadline v1.0 - Không chờ mãi khi prompt kẹt trong hàng đợi hoặc ComfyUI mất kết nối
+                if queue_timeout and start_time is None and (now - backend_started) > queue_timeout:
+                    raise TimeoutError(f"Prompt chờ trong hàng đợi ComfyUI quá {int(queue_timeout)}s")
+                if hub.is_connected(target_address):
+                    disconnected_since = None
+                elif disconnected_since is None:
+                    disconnected_since = now
+                elif disconnect_timeout and (now - disconnected_since) > disconnect_timeout:
+                    # Chưa biết prompt còn hay mất: giữ mục journal để lần khởi động sau hỏi lại
+                    keep_journal = True
+                    raise TimeoutError(f"Mất kết nối tới ComfyUI {target_address} quá {int(disconnect_timeout)}s")
 
-            ws = websocket.WebSocket()
-            ws.connect(f"ws://{target_address}/ws?clientId={client_id}", timeout=10)
-            # Set a short timeout for recv so we can periodically check for user cancellation or overall task timeout
-            ws.settimeout(3.0)
-            websocket_closed_early = False
+                event = subscription.get(timeout=1.0)
+                if event is None:
+                    # Mất kết nối hub -> có thể lỡ sự kiện kết thúc, thỉnh thoảng hỏi lại ComfyUI
+                    if disconnected_since is not None and time.time() - last_history_check > probe_interval:
+                        last_history_check = time.time()
+                        location = self._probe_prompt(prompt_id, target_address)
+                        if location == PROMPT_DONE:
+                            execution_successful = True
+                            break
+                        # ComfyUI không trả lời -> giãn dần khoảng hỏi lại
+                        probe_interval = min(60.0, probe_interval * 2) if location == PROMPT_UNREACHABLE else 5.0
+                    continue
 
-            while True:
-                with self._get_user_lock(user_hash):
-                    task = self.user_states[user_hash]["tasks"].get(task_id)
-                    if not task or task.get('cancel_requested'): raise InterruptedError("Cancelled by user.")
-                
-                # Yuuka: I2V timeout check
-                if timeout_seconds and start_time and (time.time() - start_time) > timeout_seconds:
-                    raise TimeoutError(f"Task timed out after {timeout_seconds}s.")
-                
-                try:
-                    out = ws.recv()
-                except websocket.WebSocketTimeoutException:
-                    # Expected: no messages from ComfyUI for 3s (e.g. during a long generation step).
-                    # Just loop back to check cancellation/timeout and recv again.
+                msg_type, msg_data = event.get('type'), event.get('data') or {}
+                if use_save_node and msg_type == 'executed' and str(msg_data.get('node')) == str(output_node_id):
+                    save_node_refs.extend((msg_data.get('output') or {}).get('images') or [])
+                if msg_type in ('hub_reconnected', 'queue_position') and (
+                    msg_type == 'hub_reconnected' or msg_data.get('position') is None
+                ):
+                    # Prompt không còn trong hàng đợi hoặc vừa kết nối lại: hỏi lại ComfyUI một lần
+                    last_history_check = time.time()
+                    if self._probe_prompt(prompt_id, target_address) == PROMPT_DONE:
+                        execution_successful = True
+                        break
                     continue
-                except websocket.WebSocketConnectionClosedException:
-                    websocket_closed_early = True
-                    break
-                
-                if not isinstance(out, str): continue
-                try: message = json.loads(out)
-                except json.JSONDecodeError: continue
-                
-                msg_type, msg_data = message.get('type'), message.get('data', {})
+                timeline.observe(msg_type, msg_data)
+                if start_time is None and msg_type in ('execution_start', 'executing', 'progress'):
+                    # Yuuka: creation time patch v1.0 - Bắt đầu đếm giờ ngay khi rời hàng đợi
+                    start_time = time.time()
+                    self.journal.update(task_id, state="executing")
                 with self._get_user_lock(user_hash):
                     task = self.user_states[user_hash]["tasks"].get(task_id)
-                    if not task: continue
-                    if msg_data.get('prompt_id') == prompt_id:
-                        if msg_type == 'execution_start':
-                            task['progress_message'] = "Bắt đầu xử lý..."
-                            task['comfy_event_type'] = 'execution_start'
-                            task['queue_position'] = 0
-                            task['current_node'] = None
-                            task['current_node_type'] = None
-                            task['current_node_label'] = None
-                            task['step_value'] = 0
-                            task['step_max'] = 0
-                            self._render_generation_progress(user_tail, workflow_label_display, size_label_display, 0)
-                        elif msg_type == 'executing' and msg_data.get('node') is not None:
-                            current_node = str(msg_data.get('node'))
-                            node_type = workflow_node_types.get(current_node, '')
-                            task['comfy_event_type'] = 'executing'
-                            task['queue_position'] = 0
-                            task['current_node'] = current_node
-                            task['current_node_type'] = node_type or None
-                            task['current_node_label'] = self._friendly_node_label(node_type)
-                            if task.get('step_max') and task.get('step_value'):
-                                task['progress_message'] = f"{task['current_node_label']}... {task['progress_percent']}%"
-                            else:
-                                task['progress_message'] = f"{task['current_node_label']}..."
-                        elif msg_type == 'execution_cached':
-                            current_node = str(msg_data.get('node') or '')
-                            node_type = workflow_node_types.get(current_node, '') if current_node else ''
-                            task['comfy_event_type'] = 'execution_cached'
-                            if current_node:
-                                task['current_node'] = current_node
-                            if node_type:
-                                task['current_node_type'] = node_type
-                                task['current_node_label'] = f"{self._friendly_node_label(node_type)} (cache)"
-                                task['progress_message'] = task['current_node_label']
-                        elif msg_type == 'progress':
-                            v, m = msg_data.get('value',0), msg_data.get('max',1)
-                            p = int(v/m*100) if m>0 else 0
-                            task['comfy_event_type'] = 'progress'
-                            task['step_value'] = v
-                            task['step_max'] = m
-                            task['progress_percent'] = p
-                            node_label = task.get('current_node_label') or 'Đang tạo'
-                            if m and m > 0:
-                                task['progress_message'] = f"{node_label}... bước {v}/{m} · {p}%"
-                            else:
-                                task['progress_message'] = f"{node_label}... {p}%"
-                            self._render_generation_progress(user_tail, workflow_label_display, size_label_display, p)
-                        elif msg_type in ('executing', 'execution_done', 'execution_end') and msg_data.get('node') is None:
-                            # move to 100% visually as execution ends
-                            task['comfy_event_type'] = msg_type
-                            task['current_node'] = None
-                            task['current_node_type'] = None
-                            task['current_node_label'] = 'Hoàn tất thực thi'
-                            task['progress_percent'] = 100
-                            task['progress_message'] = 'Hoàn tất thực thi, đang lấy kết quả...'
-                            self._render_generation_progress(user_tail, workflow_label_display, size_label_display, 100)
-                            execution_successful = True
-                            break
-                        elif msg_type == 'execution_error': raise Exception(f"Node error: {msg_data.get('exception_message', 'Unknown')}")
-            
+                    if not task:
+                        continue
+                    finished = self._apply_comfy_event(task, msg_type, msg_data, workflow_node_types, display)
+                    if start_time is not None and not task.get('started_at'):
+                        task['started_at'] = start_time
+                    self._update_eta_locked(task)
+                    self._publish_task_locked(user_hash, task)
+                if finished:
+                    execution_successful = True
+                    break
+
+            if start_time is None:
+                start_time = time.time()
+            timeline.finish_execution()
+
             history_outputs = {}
             image_b64 = None
+            image_b64_list = []
             video_b64 = None
             history_error = None
 
-            max_history_attempts = 360
+            if use_save_node:
+                image_b64_list = self._fetch_save_node_images(prompt_id, target_address, output_node_id, save_node_refs)
+                if image_b64_list:
+                    # bytes thô, ImageService nhận trực tiếp không cần base64
+                    image_b64 = image_b64_list[0]
+                    execution_successful = True
+
+            max_history_attempts = 0 if use_save_node else 360
             for attempt in range(max_history_attempts):
                 # Yuuka: I2V timeout check in history poll
                 if timeout_seconds and start_time and (time.time() - start_time) > timeout_seconds:
-                    raise TimeoutError(f"Task timed out after {timeout_seconds}s.")
+                    raise TimeoutError(f"Task quá thời gian ({timeout_seconds}s)")
                 try:
                     history = self.core_api.comfy_api_client.get_history(prompt_id, target_address)
                 except Exception as err:
@@ -458,6 +1115,7 @@ class GenerationService:
                     images_base64 = node_output.get("images_base64")
                     if images_base64:
                         image_b64 = images_base64[0]
+                        image_b64_list = list(images_base64)
                         execution_successful = True
                         break
                     # Check for video output (VideoToBase64_Yuuka)
@@ -481,6 +1139,8 @@ class GenerationService:
                     self.user_states[user_hash]["tasks"][task_id]['current_node_type'] = workflow_node_types.get(str(output_node_id)) or None
                     self.user_states[user_hash]["tasks"][task_id]['current_node_label'] = 'Đọc kết quả đầu ra'
                     self.user_states[user_hash]["tasks"][task_id]['progress_message'] = "\u0110ang x\u1eed l\u00fd k\u1ebft qu\u1ea3..."
+                    self._update_eta_locked(self.user_states[user_hash]["tasks"][task_id])
+                    self._publish_task_locked(user_hash, self.user_states[user_hash]["tasks"][task_id])
 
                 creation_duration = (time.time() - start_time) - 0.3 # tru do tre websocket
                 if original_lora_tags:
@@ -496,10 +1156,20 @@ class GenerationService:
                     new_metadata = self.image_service.save_video_metadata(
                         user_hash, character_hash, video_b64, cfg_data, creation_duration
                     )
+                    saved_metadata = [new_metadata] if new_metadata else []
                 else:
-                    new_metadata = self.image_service.save_image_metadata(
-                        user_hash, character_hash, image_b64, cfg_data, creation_duration, alpha=alpha_flag
-                    )
+                    # Yuuka: batch generation v1.0 - Prompt gộp seed (batch_size > 1) trả về nhiều ảnh
+                    batch_images = image_b64_list if self._task_image_count(task) > 1 else [image_b64]
+                    saved_metadata = []
+                    for one_b64 in batch_images:
+                        one_metadata = self.image_service.save_image_metadata(
+                            user_hash, character_hash, one_b64, cfg_data, creation_duration / len(batch_images), alpha=alpha_flag,
+                            result_key=result_key if len(batch_images) == 1 else None,
+                        )
+                        if one_metadata:
+                            saved_metadata.append(one_metadata)
+                            self.result_cache.remember(user_hash, result_key, one_metadata)
+                    new_metadata = saved_metadata[0] if saved_metadata else None
                 if not new_metadata:
                     raise Exception("L\u01b0u k\u1ebft qu\u1ea3 th\u1ea5t b\u1ea1i.")
 
@@ -509,7 +1179,7 @@ class GenerationService:
                     # user_hash tail (last 4 chars or segments separated by '-')
                     user_tail = user_hash[-4:]
                     cfg_gc = new_metadata.get('generationConfig', {}) or {}
-                    workflow_label = self._format_workflow_label(cfg_gc)
+                    workflow_label = workflow_label_display
                     media_type = "Video" if is_video_result else "Art"
                     # image size: try width/height from config, else '?' placeholders
                     width = cfg_gc.get('width') or cfg_gc.get('img_width') or '?'
@@ -521,15 +1191,25 @@ class GenerationService:
                     pass
 
                 event_type = "VIDEO_SAVED" if is_video_result else "IMAGE_SAVED"
-                self._add_event(user_hash, event_type, {"task_id": task_id, "image_data": new_metadata, "context": task.get("context")})
+                for one_metadata in saved_metadata:
+                    self._add_event(user_hash, event_type, {"task_id": task_id, "image_data": one_metadata, "context": task.get("context")})
+                batch_id = task.get("batch_id")
+                if batch_id:
+                    with self._get_user_lock(user_hash):
+                        batch = self.user_states[user_hash].get("batches", {}).get(batch_id)
+                        if batch is not None:
+                            batch["images_saved"] += len(saved_metadata)
+                self._record_timeline(user_hash, task_id, timeline, cfg_data, target_address, self._task_image_count(task))
+                outcome = "completed"
             else:
                 if history_error and result_b64 is None:
-                    raise ConnectionAbortedError(f"WebSocket closed early and history unavailable: {history_error}")
-                if websocket_closed_early and not execution_successful:
-                    raise ConnectionAbortedError("WebSocket connection lost before prompt finished execution.")
+                    raise ConnectionAbortedError(f"History unavailable after execution: {history_error}")
+                if use_save_node:
+                    raise Exception(f"Không tìm thấy ảnh đầu ra của node '{output_node_id}' ({self.save_node_class})")
                 raise Exception(f"Kh\u00f4ng t\u00ecm th\u1ea5y d\u1eef li\u1ec7u base64 trong node '{output_node_id}'")
 
         except InterruptedError as e:
+             outcome = "cancelled"
              self._clear_progress_line()
              print(f"✅ [GenService Task {task_id}] Cancelled gracefully for user {user_hash}.")
         except TimeoutError as e:
@@ -543,7 +1223,7 @@ class GenerationService:
             with self._get_user_lock(user_hash):
                 task = self.user_states[user_hash]["tasks"].get(task_id)
                 if task:
-                    task['error_message'] = f"Lỗi: Task quá thời gian ({timeout_seconds}s)"
+                    task['error_message'] = f"Lỗi: {e}"
         except Exception as e:
             self._clear_progress_line()
             msg = str(e)
@@ -573,9 +1253,18 @@ class GenerationService:
                     else:
                         task['error_message'] = f"Lỗi: {str(e)}"
         finally:
-            if ws: ws.close()
+            self.metrics.count_outcome(outcome)
+            if outcome == "completed" or not (self._shutting_down or keep_journal):
+                self.journal.discard(task_id)
+            if resume:
+                with self._stats_lock:
+                    self._journal_stats["recovered" if outcome == "completed" else "lost"] += 1
+            if subscription: subscription.close()
+            if backend is not None:
+                self.backend_pool.release(backend, execution_successful, time.time() - backend_started)
             with self._get_user_lock(user_hash):
                 task = self.user_states[user_hash]["tasks"].get(task_id)
-                if task: task['is_running'] = False
+                if task:
+                    self._finish_task_locked(user_hash, task, outcome)
             # Ensure any lingering progress line is cleared
             self._clear_progress_line()
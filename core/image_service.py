@@ -5,9 +5,12 @@ import time
 import base64
 import io
 import random
+import threading
 from PIL import Image
 from copy import deepcopy
 
+from integrations.workflow_builder_service import WORKFLOW_INFO_KEY, classify_workflow
+
 class ImageService:
     """Yuuka: Service mới để quản lý tập trung dữ liệu ảnh."""
     def __init__(self, core_api):
@@ -15,6 +18,9 @@ class ImageService:
         self.data_manager = core_api.data_manager
         self.IMAGE_DATA_FILENAME = "img_data.json"
         self.PREVIEW_MAX_DIMENSION = 350 # Yuuka: new image paths v1.0
+        # Yuuka: metadata lock v1.0 - Mọi thao tác đọc-sửa-ghi img_data.json (kể cả job bảo trì chạy nền)
+        # đều đi qua lock này, để hai bên ghi cùng lúc không làm mất ảnh của nhau.
+        self._metadata_lock = threading.RLock()
 
     def _sanitize_config(self, config_data):
         if not isinstance(config_data, dict):
@@ -26,12 +32,67 @@ class ImageService:
             sanitized[key] = value.strip() if isinstance(value, str) else value
         return sanitized
 
-    def save_image_metadata(self, user_hash, character_hash, image_base64, generation_config, creation_time=None, alpha: bool = False):
-        """Lưu metadata ảnh, tự tạo preview và trả về object metadata mới."""
-        all_images = self.data_manager.read_json(self.IMAGE_DATA_FILENAME, obfuscated=True)
-        user_images = all_images.setdefault(user_hash, {})
-        char_images = user_images.setdefault(character_hash, [])
+    def _append_metadata(self, user_hash, character_hash, new_metadata):
+        """Thêm metadata vào bản img_data.json mới nhất (file ảnh đã được ghi xong trước đó, ngoài lock)."""
+        with self._metadata_lock:
+            all_images = self.data_manager.read_json(self.IMAGE_DATA_FILENAME, obfuscated=True)
+            all_images.setdefault(user_hash, {}).setdefault(character_hash, []).append(new_metadata)
+            self.data_manager.save_json(all_images, self.IMAGE_DATA_FILENAME, obfuscated=True)
 
+    @staticmethod
+    def _backfill_legacy_fields(images_by_char):
+        """Bổ sung field cho ảnh cũ; trả về True nếu có thay đổi."""
+        data_was_modified = False
+        for images in images_by_char:
+            for img in images:
+                if 'creationTime' not in img:
+                    img['creationTime'] = round(random.uniform(16, 22), 2)
+                    data_was_modified = True
+                # Yuuka: new image paths v1.0 - Thêm pv_url fallback cho ảnh cũ
+                if 'pv_url' not in img:
+                    img['pv_url'] = img['url']
+                    data_was_modified = True
+                # Yuuka: Alpha images v1.0 - Ảnh cũ không có key này mặc định False
+                if 'Alpha' not in img:
+                    img['Alpha'] = False
+                    data_was_modified = True
+        return data_was_modified
+
+    def _backfill_and_save(self, user_hash):
+        """Ghi phần bổ sung cho ảnh cũ lên bản mới nhất; trả về ảnh của user theo nhân vật."""
+        with self._metadata_lock:
+            all_images_data = self.data_manager.read_json(self.IMAGE_DATA_FILENAME, obfuscated=True)
+            user_images_by_char = all_images_data.get(user_hash, {})
+            if self._backfill_legacy_fields(user_images_by_char.values()):
+                self.data_manager.save_json(all_images_data, self.IMAGE_DATA_FILENAME, obfuscated=True)
+            return user_images_by_char
+
+    def apply_metadata_patches(self, patches, remove_users=()):
+        """
+        Yuuka: startup maintenance v2.0 - Áp patch {(user_hash, char_hash, url): {field: value}} và xoá
+        các user trong `remove_users` trên bản img_data.json mới nhất. Trả về dữ liệu đã ghi.
+        """
+        with self._metadata_lock:
+            all_images = self.data_manager.read_json(self.IMAGE_DATA_FILENAME, default_value={}, obfuscated=True)
+            if not isinstance(all_images, dict):
+                all_images = {}
+            for user_hash in remove_users:
+                all_images.pop(user_hash, None)
+            for (user_hash, char_hash, url), patch in patches.items():
+                for img_meta in (all_images.get(user_hash) or {}).get(char_hash) or []:
+                    if img_meta.get('url') == url:
+                        img_meta.update(patch)
+                        break
+            self.data_manager.save_json(all_images, self.IMAGE_DATA_FILENAME, obfuscated=True)
+            return all_images
+
+    def save_image_metadata(self, user_hash, character_hash, image_base64, generation_config, creation_time=None, alpha: bool = False,
+                            result_key=None):
+        """
+        Lưu metadata ảnh, tự tạo preview và trả về object metadata mới.
+        `image_base64` có thể là bytes ảnh thô (lấy trực tiếp từ /view của ComfyUI) - khi đó bỏ qua bước decode.
+        `result_key`: khoá của GenerationResultCache, lưu vào metadata để tra lại sau restart.
+        """
         def _to_bool(value):
             if isinstance(value, bool):
                 return value
@@ -43,7 +104,7 @@ class ImageService:
         
         try:
             # Yuuka: new image paths v1.0 - Chuyển logic lưu file vào đây
-            image_data = base64.b64decode(image_base64)
+            image_data = bytes(image_base64) if isinstance(image_base64, (bytes, bytearray)) else base64.b64decode(image_base64)
             filename = f"{uuid.uuid4()}.png"
 
             # 1. Lưu ảnh gốc
@@ -64,73 +125,14 @@ class ImageService:
             config_to_save = generation_config
             if isinstance(generation_config, dict):
                 config_to_save = deepcopy(generation_config)
-                workflow_template = config_to_save.get("_workflow_template")
-                if workflow_template is not None:
-                    workflow_template = str(workflow_template).strip()
-                # Detect LoRA usage (single or multi) for correct workflow_type classification
-                raw_lora_name = config_to_save.get("lora_name")
-                has_single_lora = isinstance(raw_lora_name, str) and raw_lora_name.strip() and raw_lora_name.strip().lower() != "none"
-
-                def _has_multi_lora_from_chain(chain_val):
-                    if isinstance(chain_val, list) and len(chain_val) > 0:
-                        for item in chain_val:
-                            if isinstance(item, dict):
-                                name = item.get("name") or item.get("lora_name")
-                                if isinstance(name, str) and name.strip() and name.strip().lower() != "none":
-                                    return True
-                            elif isinstance(item, str):
-                                if item.strip() and item.strip().lower() != "none":
-                                    return True
-                    return False
-
-                def _has_multi_lora_from_names(names_val):
-                    if isinstance(names_val, list):
-                        return any(isinstance(s, str) and s.strip() and s.strip().lower() != "none" for s in names_val)
-                    if isinstance(names_val, str):
-                        parts = [p.strip() for p in names_val.split(',') if p.strip()]
-                        return any(p.lower() != "none" for p in parts)
-                    return False
-
-                has_lora = (
-                    has_single_lora
-                    or _has_multi_lora_from_chain(config_to_save.get("lora_chain"))
-                    or _has_multi_lora_from_names(config_to_save.get("lora_names"))
-                )
-
-                if config_to_save.get("_workflow_type") == "hires_input_image":
-                    config_to_save["hires_enabled"] = True
-
-                template_lower = (workflow_template or "").lower()
-                is_hires = _to_bool(config_to_save.get("hires_enabled"))
-                if not is_hires and "hiresfix" in template_lower:
+                # Yuuka: workflow classifier v1.0 - WorkflowBuilder đã phân loại lúc build (_workflow_info)
+                info = config_to_save.get(WORKFLOW_INFO_KEY) or classify_workflow(config_to_save)
+                if info["hires"] and not _to_bool(config_to_save.get("hires_enabled")):
                     config_to_save["hires_enabled"] = True
-                    is_hires = True
-
-                workflow_type_value = config_to_save.get("workflow_type")
-                workflow_type = workflow_type_value.strip().lower() if isinstance(workflow_type_value, str) else ""
-
-                if not workflow_type:
-                    if template_lower:
-                        if "hiresfix" in template_lower and "input_image" in template_lower:
-                            workflow_type = "hires_input_image_lora" if ("lora" in template_lower or has_lora) else "hires_input_image"
-                        elif "hiresfix" in template_lower:
-                            workflow_type = "hires_lora" if ("lora" in template_lower or has_lora) else "hires"
-                        elif "lora" in template_lower:
-                            workflow_type = "sdxl_lora"
-                        else:
-                            workflow_type = "standard"
-                    else:
-                        if is_hires:
-                            workflow_type = "hires_lora" if has_lora else "hires"
-                        elif has_lora:
-                            workflow_type = "sdxl_lora"
-                        else:
-                            workflow_type = "standard"
-
-                if workflow_template:
-                    config_to_save["workflow_template"] = workflow_template
-                if workflow_type:
-                    config_to_save["workflow_type"] = workflow_type
+                if info["workflow_template"]:
+                    config_to_save["workflow_template"] = info["workflow_template"]
+                if info["workflow_type"]:
+                    config_to_save["workflow_type"] = info["workflow_type"]
 
             sanitized_config = self._sanitize_config(config_to_save)
 
@@ -145,9 +147,10 @@ class ImageService:
             }
             if creation_time is not None:
                 new_metadata["creationTime"] = round(creation_time, 2)
-                
-            char_images.append(new_metadata)
-            self.data_manager.save_json(all_images, self.IMAGE_DATA_FILENAME, obfuscated=True)
+            if result_key:
+                new_metadata["resultKey"] = result_key
+
+            self._append_metadata(user_hash, character_hash, new_metadata)
             return new_metadata
         except Exception as e:
             print(f"💥 [ImageService] Failed to save image metadata: {e}")
@@ -155,10 +158,6 @@ class ImageService:
 
     def save_video_metadata(self, user_hash, character_hash, video_base64, generation_config, creation_time=None):
         """Lưu metadata video (webm), tạo preview thumbnail từ frame giả và trả về object metadata mới."""
-        all_images = self.data_manager.read_json(self.IMAGE_DATA_FILENAME, obfuscated=True)
-        user_images = all_images.setdefault(user_hash, {})
-        char_images = user_images.setdefault(character_hash, [])
-
         try:
             video_data = base64.b64decode(video_base64)
             filename = f"{uuid.uuid4()}.webm"
@@ -215,8 +214,7 @@ class ImageService:
             if creation_time is not None:
                 new_metadata["creationTime"] = round(creation_time, 2)
 
-            char_images.append(new_metadata)
-            self.data_manager.save_json(all_images, self.IMAGE_DATA_FILENAME, obfuscated=True)
+            self._append_metadata(user_hash, character_hash, new_metadata)
             return new_metadata
         except Exception as e:
             print(f"💥 [ImageService] Failed to save video metadata: {e}")
@@ -227,81 +225,70 @@ class ImageService:
         all_images_data = self.data_manager.read_json(self.IMAGE_DATA_FILENAME, obfuscated=True)
         user_images_by_char = all_images_data.get(user_hash, {})
         
-        data_was_modified = False
-        for char_hash, images in user_images_by_char.items():
-            for img in images:
-                if 'creationTime' not in img:
-                    img['creationTime'] = round(random.uniform(16, 22), 2)
-                    data_was_modified = True
-                # Yuuka: new image paths v1.0 - Thêm pv_url fallback cho ảnh cũ
-                if 'pv_url' not in img:
-                    img['pv_url'] = img['url']
-                    data_was_modified = True
-                # Yuuka: Alpha images v1.0 - Ảnh cũ không có key này mặc định False
-                if 'Alpha' not in img:
-                    img['Alpha'] = False
-                    data_was_modified = True
-        
-        if data_was_modified:
-            self.data_manager.save_json(all_images_data, self.IMAGE_DATA_FILENAME, obfuscated=True)
+        if self._backfill_legacy_fields(user_images_by_char.values()):
+            user_images_by_char = self._backfill_and_save(user_hash)
 
         flat_list = [img for images in user_images_by_char.values() for img in images]
         return sorted(flat_list, key=lambda x: x.get('createdAt', 0), reverse=True)
         
+    def get_user_image_records(self, user_hash):
+        """Giống get_all_user_images nhưng chỉ đọc: field của ảnh cũ được bổ sung trong bộ nhớ, không ghi file."""
+        all_images_data = self.data_manager.read_json(self.IMAGE_DATA_FILENAME, obfuscated=True)
+        user_images_by_char = all_images_data.get(user_hash, {})
+        self._backfill_legacy_fields(user_images_by_char.values())
+        flat_list = [img for images in user_images_by_char.values() for img in images]
+        return sorted(flat_list, key=lambda x: x.get('createdAt', 0), reverse=True)
+
+    def image_file_exists(self, metadata):
+        """File ảnh gốc của metadata còn trên đĩa (ảnh bị xoá thì file cũng bị xoá theo)."""
+        url = (metadata or {}).get('url')
+        if not url:
+            return False
+        filepath = self.data_manager.get_path(os.path.join('user_images', 'imgs', os.path.basename(url)))
+        return os.path.exists(filepath)
+
     def get_images_by_character(self, user_hash, character_hash):
         """Lấy ảnh của một nhân vật cụ thể."""
         all_images_data = self.data_manager.read_json(self.IMAGE_DATA_FILENAME, obfuscated=True)
         user_images_by_char = all_images_data.get(user_hash, {})
         
-        data_was_modified = False
-        if character_hash in user_images_by_char:
-            for img in user_images_by_char[character_hash]:
-                if 'creationTime' not in img:
-                    img['creationTime'] = round(random.uniform(16, 22), 2)
-                    data_was_modified = True
-                # Yuuka: new image paths v1.0 - Thêm pv_url fallback cho ảnh cũ
-                if 'pv_url' not in img:
-                    img['pv_url'] = img['url']
-                    data_was_modified = True
-                # Yuuka: Alpha images v1.0 - Ảnh cũ không có key này mặc định False
-                if 'Alpha' not in img:
-                    img['Alpha'] = False
-                    data_was_modified = True
-
-        if data_was_modified:
-             self.data_manager.save_json(all_images_data, self.IMAGE_DATA_FILENAME, obfuscated=True)
+        if self._backfill_legacy_fields([user_images_by_char.get(character_hash, [])]):
+            user_images_by_char = self._backfill_and_save(user_hash)
 
         char_images = user_images_by_char.get(character_hash, [])
         return sorted(char_images, key=lambda x: x.get('createdAt', 0), reverse=True)
 
     def delete_image_by_id(self, user_hash, image_id):
         """Xóa metadata và file ảnh (gốc + preview) tương ứng."""
-        all_images = self.data_manager.read_json(self.IMAGE_DATA_FILENAME, obfuscated=True)
-        if user_hash not in all_images: return False
-        
         found_and_deleted = False
         image_to_delete_url = None
         preview_to_delete_url = None # Yuuka: new image paths v1.0
 
-        for char_hash, images in all_images[user_hash].items():
-            image_to_delete_idx = -1
-            for i, img in enumerate(images):
-                if img.get('id') == image_id:
-                    image_to_delete_idx = i
-                    image_to_delete_url = img.get('url')
-                    preview_to_delete_url = img.get('pv_url') # Yuuka: new image paths v1.0
+        with self._metadata_lock:
+            all_images = self.data_manager.read_json(self.IMAGE_DATA_FILENAME, obfuscated=True)
+            if user_hash not in all_images: return False
+
+            for char_hash, images in all_images[user_hash].items():
+                image_to_delete_idx = -1
+                for i, img in enumerate(images):
+                    if img.get('id') == image_id:
+                        image_to_delete_idx = i
+                        image_to_delete_url = img.get('url')
+                        preview_to_delete_url = img.get('pv_url') # Yuuka: new image paths v1.0
+                        break
+                
+                if image_to_delete_idx != -1:
+                    del all_images[user_hash][char_hash][image_to_delete_idx]
+                    if not all_images[user_hash][char_hash]:
+                        del all_images[user_hash][char_hash]
+                    
+                    found_and_deleted = True
                     break
             
-            if image_to_delete_idx != -1:
-                del all_images[user_hash][char_hash][image_to_delete_idx]
-                if not all_images[user_hash][char_hash]:
-                    del all_images[user_hash][char_hash]
-                
-                found_and_deleted = True
-                break
-        
+            if found_and_deleted:
+                self.data_manager.save_json(all_images, self.IMAGE_DATA_FILENAME, obfuscated=True)
+
         if found_and_deleted:
-            self.data_manager.save_json(all_images, self.IMAGE_DATA_FILENAME, obfuscated=True)
             # Yuuka: new image paths v1.0 - Xóa cả ảnh gốc và preview
             if image_to_delete_url:
                 try:
@@ -0,0 +1,298 @@
+import hashlib
+import io
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from PIL import Image
+
+
+class StartupMaintenanceJob:
+    """
+    Yuuka: startup maintenance v2.0 - Gộp migrate ảnh cũ, tạo preview thiếu, dọn user chết
+    và dọn file mồ côi thành một job chạy nền sau khi server đã nhận request.
+
+    - img_data.json chỉ được giải mã một lần; thư mục user_images được quét bằng os.scandir
+      một lượt (root + imgs + pv_imgs) thay vì os.path.exists cho từng ảnh.
+    - Preview thiếu được tạo trong worker pool.
+    - Thay đổi metadata được ghi lại dưới dạng patch rồi áp lên bản img_data.json mới nhất ở
+      cuối job qua ImageService (cùng lock với lúc lưu ảnh), để không ghi đè ảnh vừa được tạo.
+    - User chết chỉ bị gỡ khỏi metadata như trước; xoá luôn file ảnh của họ phải bật
+      "maintenance": {"delete_dead_user_files": true} trong server_config.json.
+    """
+
+    IMAGE_DATA_FILENAME = "img_data.json"
+    # Format: (filename, is_image_data)
+    PER_USER_DATA_FILES = [
+        ("img_data.json", True),
+        ("core_lists.json", False),
+        ("scenes.json", False),  # Giả định plugin `scene` có file này
+        ("tag_groups.json", False),  # Giả định plugin `tagger` có file này
+    ]
+
+    def __init__(self, core_api, preview_workers: Optional[int] = None, delete_dead_user_files: bool = False):
+        self.core_api = core_api
+        self.data_manager = core_api.data_manager
+        self.delete_dead_user_files = bool(delete_dead_user_files)
+        self.preview_workers = preview_workers or max(1, min(4, os.cpu_count() or 1))
+        self._lock = threading.Lock()
+        self._progress: Dict[str, Any] = {
+            "phase": "pending",
+            "previews_total": 0,
+            "previews_done": 0,
+            "previews_failed": 0,
+            "migrated": 0,
+            "dead_users_removed": 0,
+            "orphans_deleted": 0,
+            "started_at": None,
+            "finished_at": None,
+            "duration_seconds": None,
+        }
+
+    # ------------------------------------------------------------------ #
+    # Progress
+    # ------------------------------------------------------------------ #
+
+    def _update(self, **fields) -> None:
+        with self._lock:
+            self._progress.update(fields)
+
+    def _increment(self, key: str, amount: int = 1) -> None:
+        with self._lock:
+            self._progress[key] = self._progress.get(key, 0) + amount
+
+    def get_progress(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._progress)
+
+    # ------------------------------------------------------------------ #
+    # Helpers
+    # ------------------------------------------------------------------ #
+
+    def _scan_user_images(self) -> Dict[str, Set[str]]:
+        """Quét user_images một lượt: {'' : file ở root, 'imgs': ..., 'pv_imgs': ...}."""
+        user_images_dir = self.data_manager.get_path('user_images')
+        existing: Dict[str, Set[str]] = {'': set()}
+        try:
+            with os.scandir(user_images_dir) as root_entries:
+                subdirs = []
+                for entry in root_entries:
+                    if entry.is_file():
+                        existing[''].add(entry.name)
+                    elif entry.is_dir():
+                        subdirs.append(entry)
+            for subdir in subdirs:
+                names = set()
+                with os.scandir(subdir.path) as sub_entries:
+                    for entry in sub_entries:
+                        if entry.is_file():
+                            names.add(entry.name)
+                existing[subdir.name] = names
+        except FileNotFoundError:
+            pass
+        existing.setdefault('imgs', set())
+        existing.setdefault('pv_imgs', set())
+        return existing
+
+    def _url_exists(self, url: str, existing: Dict[str, Set[str]]) -> bool:
+        # URL: /user_image/pv_imgs/filename.png -> user_images/pv_imgs/filename.png
+        url_parts = url.strip('/').split('/')
+        if len(url_parts) < 2 or url_parts[0] != 'user_image':
+            return True  # URL không hợp lệ thì bỏ qua như logic cũ
+        if len(url_parts) == 2:
+            return url_parts[1] in existing['']
+        if len(url_parts) == 3 and url_parts[1] in existing:
+            return url_parts[2] in existing[url_parts[1]]
+        return os.path.exists(self.data_manager.get_path(os.path.join('user_images', *url_parts[1:])))
+
+    def _valid_user_hashes(self) -> Optional[Set[str]]:
+        # Yuuka: auth rework v1.0 - User hợp lệ là user trong user_data HOẶC whitelist
+        def get_tokens(data):
+            if isinstance(data, list): return set(data)
+            if isinstance(data, dict): return set(data.keys())
+            return set()
+
+        valid_tokens = get_tokens(self.core_api._user_data.get("users", [])) | get_tokens(self.core_api._whitelist_users)
+        if not valid_tokens:
+            return None
+        return {hashlib.sha256(t.encode('utf-8')).hexdigest() for t in valid_tokens}
+
+    def _generate_preview(self, filename: str) -> bool:
+        main_image_relative_path = os.path.join('user_images', 'imgs', filename)
+        obfuscated_data = self.data_manager.read_binary(main_image_relative_path)
+        if not obfuscated_data:
+            print(f"  - ⚠️ Source not found for {filename}, skipping preview generation.")
+            return False
+        image_data = self.data_manager.deobfuscate_binary(obfuscated_data)
+        max_dim = self.core_api.image_service.PREVIEW_MAX_DIMENSION
+        img = Image.open(io.BytesIO(image_data))
+        img.thumbnail((max_dim, max_dim))
+        buffer = io.BytesIO()
+        img.save(buffer, format="PNG")
+        obfuscated_preview_data = self.data_manager.obfuscate_binary(buffer.getvalue())
+        return self.data_manager.save_binary(obfuscated_preview_data, os.path.join('user_images', 'pv_imgs', filename))
+
+    def _delete_user_image_files(self, img_meta: Dict[str, Any]) -> None:
+        for url_key in ('url', 'pv_url'):
+            if (url := img_meta.get(url_key)) and url.startswith('/user_image/'):
+                try:
+                    # URL: /user_image/imgs/filename.png -> Path: user_images/imgs/filename.png
+                    relative_path = os.path.join('user_images', *url.strip('/').split('/')[1:])
+                    filepath = self.data_manager.get_path(relative_path)
+                    if os.path.exists(filepath): os.remove(filepath)
+                except Exception as e:
+                    print(f"    - ⚠️ Could not delete image file {url}: {e}")
+
+    # ------------------------------------------------------------------ #
+    # Job body
+    # ------------------------------------------------------------------ #
+
+    def run(self, stop_event: Optional[threading.Event] = None) -> Dict[str, Any]:
+        stop_event = stop_event or threading.Event()
+        started = time.time()
+        self._update(phase="scanning", started_at=started)
+        print("[CoreAPI Maintenance] Startup maintenance started in background.")
+
+        all_images = self.data_manager.read_json(self.IMAGE_DATA_FILENAME, default_value={}, obfuscated=True)
+        if not isinstance(all_images, dict):
+            all_images = {}
+        existing = self._scan_user_images()
+        valid_hashes = self._valid_user_hashes()
+        user_images_dir = self.data_manager.get_path('user_images')
+
+        # Patch theo (user_hash, char_hash, url gốc) -> các field cần cập nhật
+        patches: Dict[Tuple[str, str, str], Dict[str, str]] = {}
+        preview_jobs: List[Tuple[Tuple[str, str, str], str]] = []
+        dead_users = set() if valid_hashes is None else {h for h in all_images if h not in valid_hashes}
+
+        for user_hash, characters in all_images.items():
+            if user_hash in dead_users or not isinstance(characters, dict):
+                continue
+            for char_hash, images in characters.items():
+                for img_meta in images or []:
+                    url = img_meta.get('url')
+                    if not url:
+                        continue
+                    key = (user_hash, char_hash, url)
+                    current_url = url
+                    patch: Dict[str, str] = {}
+
+                    # 1. Yuuka: data migration v1.0 - Di chuyển ảnh cũ từ root sang imgs/
+                    if not url.startswith('/user_image/imgs/'):
+                        filename = os.path.basename(url)
+                        if filename in existing['']:
+                            try:
+                                os.rename(os.path.join(user_images_dir, filename), os.path.join(user_images_dir, 'imgs', filename))
+                                existing[''].discard(filename)
+                                existing['imgs'].add(filename)
+                                print(f"  - Migrated: {filename}")
+                                current_url = patch['url'] = f'/user_image/imgs/{filename}'
+                            except OSError as e:
+                                print(f"  - ⚠️ Failed to migrate {filename}: {e}")
+                        elif filename in existing['imgs']:
+                            # File đã ở đúng vị trí, chỉ cần cập nhật URL
+                            current_url = patch['url'] = f'/user_image/imgs/{filename}'
+                        if 'url' in patch:
+                            self._increment("migrated")
+                            if 'pv_url' not in img_meta:
+                                patch['pv_url'] = current_url
+
+                    # 2. Yuuka: preview generation v1.1 - Preview thiếu hoặc là fallback
+                    pv_url = patch.get('pv_url', img_meta.get('pv_url'))
+                    if not img_meta.get('is_video'):
+                        if not pv_url or pv_url == current_url or not self._url_exists(pv_url, existing):
+                            preview_jobs.append((key, os.path.basename(current_url)))
+
+                    if patch:
+                        patches[key] = patch
+
+        # 3. Tạo preview song song
+        self._update(phase="previews", previews_total=len(preview_jobs))
+        if preview_jobs and not stop_event.is_set():
+            with ThreadPoolExecutor(max_workers=self.preview_workers, thread_name_prefix="yuuka-preview") as pool:
+                futures = {pool.submit(self._generate_preview, filename): (key, filename) for key, filename in preview_jobs}
+                for future in as_completed(futures):
+                    key, filename = futures[future]
+                    try:
+                        ok = future.result()
+                    except Exception as e:
+                        ok = False
+                        print(f"  - 💥 Error generating preview for {filename}: {e}")
+                    if ok:
+                        patches.setdefault(key, {})['pv_url'] = f'/user_image/pv_imgs/{filename}'
+                        existing['pv_imgs'].add(filename)
+                        self._increment("previews_done")
+                    else:
+                        self._increment("previews_failed")
+                    if stop_event.is_set():
+                        for pending in futures:
+                            pending.cancel()
+                        break
+
+        # 4. Áp patch + xoá user chết trên bản img_data.json mới nhất
+        self._update(phase="saving")
+        if patches or dead_users:
+            if self.delete_dead_user_files:
+                for user_hash in dead_users:
+                    for images in (all_images.get(user_hash) or {}).values():
+                        for img_meta in images or []:
+                            self._delete_user_image_files(img_meta)
+            all_images = self.core_api.image_service.apply_metadata_patches(patches, remove_users=dead_users)
+        self._update(dead_users_removed=len(dead_users))
+        if dead_users:
+            print(f"  - Removed {len(dead_users)} dead user(s) from '{self.IMAGE_DATA_FILENAME}'.")
+
+        # 5. Yuuka: data cleanup v1.0 - Các file dữ liệu theo user_hash còn lại (nhỏ)
+        if valid_hashes is not None and not stop_event.is_set():
+            for filename, is_image_data in self.PER_USER_DATA_FILES:
+                if is_image_data or not os.path.exists(self.data_manager.get_path(filename)):
+                    continue
+                data = self.data_manager.read_json(filename, obfuscated=True)
+                if not isinstance(data, dict):
+                    continue
+                dead = [h for h in data if h not in valid_hashes]
+                if not dead:
+                    continue
+                for user_hash in dead:
+                    del data[user_hash]
+                self.data_manager.save_json(data, filename, obfuscated=True)
+                print(f"  - Removed {len(dead)} dead user(s) from '{filename}'.")
+
+        # 6. Yuuka: orphan file cleanup v1.0 - Chỉ xét file ở root user_images
+        self._update(phase="orphans")
+        if existing[''] and not stop_event.is_set():
+            valid_filenames = set()
+            for characters in all_images.values():
+                for images in (characters or {}).values():
+                    for img_meta in images or []:
+                        if url := img_meta.get('url'):
+                            valid_filenames.add(os.path.basename(url))
+                        if pv_url := img_meta.get('pv_url'):
+                            valid_filenames.add(os.path.basename(pv_url))
+            for filename in existing[''] - valid_filenames:
+                file_path = os.path.join(user_images_dir, filename)
+                try:
+                    # File vừa được ghi sau khi job bắt đầu thì bỏ qua
+                    if os.path.getmtime(file_path) >= started:
+                        continue
+                    os.remove(file_path)
+                    print(f"  - Deleted orphan file: {filename}")
+                    self._increment("orphans_deleted")
+                except OSError as e:
+                    print(f"  - ⚠️ Failed to delete orphan file {filename}: {e}")
+
+        finished = time.time()
+        self._update(
+            phase="stopped" if stop_event.is_set() else "done",
+            finished_at=finished,
+            duration_seconds=round(finished - started, 3),
+        )
+        progress = self.get_progress()
+        print(
+            f"[CoreAPI Maintenance] Finished in {progress['duration_seconds']}s: "
+            f"{progress['migrated']} migrated, {progress['previews_done']}/{progress['previews_total']} previews, "
+            f"{progress['dead_users_removed']} dead users, {progress['orphans_deleted']} orphans."
+        )
+        return progress
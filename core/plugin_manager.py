@@ -5,8 +5,14 @@ import importlib
 import sys
 import time
 import threading
+from contextlib import contextmanager
+
+from flask import Blueprint, abort, request
+from flask.globals import request_ctx
 
 from .core_api import CoreAPI
+from .file_watcher import IGNORED_DIR_NAMES, create_file_watcher
+from .startup_profiler import startup_profiler
 
 try:
     from colorama import Fore as _Fore, Style as _Style, init as _colorama_init
@@ -21,6 +27,79 @@ except ImportError:
     COLOR_RESET = "\033[0m"
 
 
+class _RouteTableLock:
+    """
+    Yuuka: lazy plugins v1.0 - Khoá đọc/ghi cho bảng route của Flask.
+    Đọc: match/build URL của từng request. Ghi: đăng ký / gỡ blueprint khi server đang chạy.
+    Ưu tiên writer để một đợt request dày không chặn việc kích hoạt plugin mãi. Thread đang giữ
+    quyền ghi được phép đọc / ghi lồng nhau.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = None
+        self._write_depth = 0
+        self._waiting_writers = 0
+
+    @contextmanager
+    def read(self):
+        me = threading.get_ident()
+        if self._writer == me:
+            yield
+            return
+        with self._cond:
+            while self._writer is not None or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        me = threading.get_ident()
+        with self._cond:
+            if self._writer != me:
+                self._waiting_writers += 1
+                while self._writer is not None or self._readers:
+                    self._cond.wait()
+                self._waiting_writers -= 1
+                self._writer = me
+            self._write_depth += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._write_depth -= 1
+                if not self._write_depth:
+                    self._writer = None
+                    self._cond.notify_all()
+
+
+class _GuardedUrlAdapter:
+    """MapAdapter của werkzeug, nhưng match/build chạy dưới quyền đọc của _RouteTableLock."""
+
+    def __init__(self, adapter, route_lock):
+        self._adapter = adapter
+        self._route_lock = route_lock
+
+    def match(self, *args, **kwargs):
+        with self._route_lock.read():
+            return self._adapter.match(*args, **kwargs)
+
+    def build(self, *args, **kwargs):
+        with self._route_lock.read():
+            return self._adapter.build(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._adapter, name)
+
+
 class Plugin:
     def __init__(self, path, metadata, backend_instance):
         self.path = path
@@ -33,6 +112,16 @@ class Plugin:
         self.blueprint_name = None
         self.url_prefix = None
         self._files_snapshot = {}
+        # Yuuka: lazy activation v1.0 - Plugin "activation": "lazy" chỉ import backend khi cần
+        self.lazy = metadata.get("activation") == "lazy"
+        self.placeholder_blueprint = None
+        self.activation_ms = None
+        self.activation_trigger = None
+        self.activation_error = None
+
+    @property
+    def is_activated(self):
+        return self.backend is not None
 
 
 class PluginManager:
@@ -47,6 +136,57 @@ class PluginManager:
         self._lock = threading.RLock()
         self._watcher_thread = None
         self._watcher_stop_event = None
+        self._file_watcher = None
+        self._watch_cond = threading.Condition()
+        self._pending_reloads = set()
+        self._last_watch_event = 0.0
+        # Lazy activation / hot-reload đổi url_map trong lúc các thread khác đang phục vụ request
+        self._route_lock = _RouteTableLock()
+        self._registration_local = threading.local()
+        # Lazy activation dựa vào vài API nội bộ của Flask/werkzeug (bản đã thử ghi trong requirements.txt);
+        # bản khác thiếu chúng thì plugin lazy được nạp ngay lúc khởi động như plugin thường
+        self.lazy_activation_supported = self._route_internals_supported()
+        if self.lazy_activation_supported:
+            self._install_route_guard()
+        else:
+            print(self._color_text(
+                "[PluginManager] Warning: this Flask/werkzeug version lacks the routing internals used by "
+                "lazy activation; lazy plugins will be loaded at startup.", COLOR_RED))
+
+    def _route_internals_supported(self):
+        """Kiểm tra các thuộc tính nội bộ mà route guard và việc gỡ blueprint lúc chạy cần tới."""
+        app = self.app
+        url_map = app.url_map
+        try:
+            if not (callable(getattr(app, "create_url_adapter", None))
+                    and callable(getattr(app, "_check_setup_finished", None))):
+                return False
+            if not (isinstance(getattr(url_map, "_rules", None), list)
+                    and isinstance(getattr(url_map, "_rules_by_endpoint", None), dict)):
+                return False
+            matcher = type(url_map._matcher)(url_map.merge_slashes)
+            return callable(getattr(matcher, "add", None)) and hasattr(url_map, "_remap")
+        except Exception:
+            return False
+
+    def _install_route_guard(self):
+        app = self.app
+        create_url_adapter = app.create_url_adapter
+        check_setup_finished = app._check_setup_finished
+
+        def _guarded_create_url_adapter(req):
+            adapter = create_url_adapter(req)
+            return _GuardedUrlAdapter(adapter, self._route_lock) if adapter is not None else None
+
+        def _check_setup_finished(f_name):
+            # Chỉ bỏ qua kiểm tra cho thread đang đăng ký route qua _runtime_registration();
+            # không đụng tới app._got_first_request mà các request khác cũng ghi.
+            if getattr(self._registration_local, "depth", 0):
+                return
+            check_setup_finished(f_name)
+
+        app.create_url_adapter = _guarded_create_url_adapter
+        app._check_setup_finished = _check_setup_finished
 
     def load_plugins(self):
         print("[PluginManager] Starting plugin discovery and initialization...")
@@ -72,13 +212,18 @@ class PluginManager:
         print(f"[PluginManager] Loaded successfully: {success_text}")
         print(f"[PluginManager] Failed to load: {failure_text}")
 
-    def _load_plugin_from_path(self, path):
+    def _load_plugin_from_path(self, path, activate=False):
         plugin_id = os.path.basename(path)
         manifest_path = os.path.join(path, "plugin.json")
         if not os.path.exists(manifest_path):
             print(f"[PluginManager] Skipping '{plugin_id}': missing plugin.json.")
             return False, plugin_id
 
+        # Yuuka: startup profiler v1.0 - Đo thời gian import/__init__/đăng ký của từng plugin
+        with startup_profiler.plugin(plugin_id) as profile:
+            return self._load_plugin_profiled(path, plugin_id, manifest_path, profile, activate)
+
+    def _load_plugin_profiled(self, path, plugin_id, manifest_path, profile, activate=False):
         metadata = {}
         full_module_path = ""
 
@@ -94,6 +239,12 @@ class PluginManager:
             module_name, class_name = backend_entry.split(":")
             full_module_path = f"plugins.{plugin_id}.{module_name}"
 
+            if metadata.get("activation") == "lazy" and not activate and self.lazy_activation_supported:
+                profile["lazy"] = True
+                self._register_lazy_plugin(path, plugin_id, metadata)
+                profile["loaded"] = True
+                return True, display_name
+
             module_spec = importlib.util.spec_from_file_location(
                 full_module_path,
                 os.path.join(path, f"{module_name}.py"),
@@ -103,10 +254,12 @@ class PluginManager:
 
             module = importlib.util.module_from_spec(module_spec)
             sys.modules[full_module_path] = module
-            module_spec.loader.exec_module(module)
+            with startup_profiler.step(profile, "import"):
+                module_spec.loader.exec_module(module)
 
             plugin_class = getattr(module, class_name)
-            backend_instance = plugin_class(self.core_api)
+            with startup_profiler.step(profile, "init"):
+                backend_instance = plugin_class(self.core_api)
 
             # Provide plugin with identifying info and task service access
             if not hasattr(backend_instance, "plugin_id"):
@@ -116,19 +269,23 @@ class PluginManager:
             if hasattr(backend_instance, "register_services") and callable(
                 getattr(backend_instance, "register_services")
             ):
-                backend_instance.register_services()
+                with startup_profiler.step(profile, "register_services"):
+                    backend_instance.register_services()
 
             if hasattr(backend_instance, "register_background_tasks") and callable(
                 getattr(backend_instance, "register_background_tasks")
             ):
-                backend_instance.register_background_tasks(self.core_api.task_service)
+                with startup_profiler.step(profile, "register_background_tasks"):
+                    backend_instance.register_background_tasks(self.core_api.task_service)
 
             blueprint_name = None
             url_prefix = None
             if hasattr(backend_instance, "get_blueprint"):
-                blueprint, url_prefix = backend_instance.get_blueprint()
-                if blueprint:
-                    self.app.register_blueprint(blueprint, url_prefix=url_prefix)
+                with startup_profiler.step(profile, "blueprint"):
+                    blueprint, url_prefix = backend_instance.get_blueprint()
+                    if blueprint:
+                        with self._runtime_registration():
+                            self.app.register_blueprint(blueprint, url_prefix=url_prefix)
                     try:
                         blueprint_name = getattr(blueprint, "name", None)
                     except Exception:
@@ -142,6 +299,7 @@ class PluginManager:
             plugin_obj._files_snapshot = self._snapshot_plugin_files(path)
 
             self._plugins[plugin_id] = plugin_obj
+            profile["loaded"] = True
             #print(f"[PluginManager] Loaded plugin '{display_name}'.")
             return True, display_name
 
@@ -150,13 +308,140 @@ class PluginManager:
                 del sys.modules[full_module_path]
             display_name = metadata.get("name", plugin_id) or plugin_id
             print(self._color_text(f"[PluginManager] Error loading plugin '{plugin_id}': {e}", COLOR_RED))
+            profile["loaded"] = False
+            profile["error"] = str(e)
             return False, display_name
 
+    # -------------------- Lazy activation --------------------
+    LAZY_ROUTE_METHODS = ["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"]
+
+    @staticmethod
+    def _lazy_route_prefixes(plugin_id, metadata):
+        """Prefix URL mà placeholder cần giữ chỗ; mặc định /api/plugin/<id>, có thể khai báo trong manifest."""
+        lazy_cfg = metadata.get("lazy") if isinstance(metadata.get("lazy"), dict) else {}
+        routes = lazy_cfg.get("routes") or [f"/api/plugin/{plugin_id}"]
+        if isinstance(routes, str):
+            routes = [routes]
+        return ["/" + str(route).strip("/") for route in routes if str(route).strip("/")]
+
+    @contextmanager
+    def _runtime_registration(self):
+        """
+        Flask chặn register_blueprint sau request đầu tiên, nhưng plugin lazy và hot-reload
+        cần đăng ký route khi server đang chạy. Giữ quyền ghi bảng route để request đang match
+        không thấy url_map dựng dở.
+        """
+        local = self._registration_local
+        with self._route_lock.write():
+            # Endpoint mới có thể trùng tên view tạm của blueprint vừa gỡ (hot-reload) -> bỏ view tạm trước
+            for endpoint in [e for e, view in self.app.view_functions.items() if view == self._rematch_view]:
+                self.app.view_functions.pop(endpoint, None)
+            local.depth = getattr(local, "depth", 0) + 1
+            try:
+                yield
+            finally:
+                local.depth -= 1
+
+    def _register_lazy_plugin(self, path, plugin_id, metadata):
+        """Đăng ký placeholder (route + service) cho plugin lazy, chưa import backend."""
+        placeholder = Blueprint(f"lazy_{plugin_id}", __name__)
+
+        def _activate_and_dispatch(subpath=None):
+            return self._dispatch_to_activated(plugin_id)
+
+        for idx, prefix in enumerate(self._lazy_route_prefixes(plugin_id, metadata)):
+            placeholder.add_url_rule(prefix, f"activate_{idx}", _activate_and_dispatch, methods=self.LAZY_ROUTE_METHODS)
+            placeholder.add_url_rule(
+                f"{prefix}/<path:subpath>", f"activate_{idx}_sub", _activate_and_dispatch, methods=self.LAZY_ROUTE_METHODS
+            )
+        with self._runtime_registration():
+            self.app.register_blueprint(placeholder)
+
+        lazy_cfg = metadata.get("lazy") if isinstance(metadata.get("lazy"), dict) else {}
+        for service_name in lazy_cfg.get("services") or []:
+            self.core_api.register_lazy_service(
+                service_name,
+                plugin_id,
+                lambda name=service_name: self.activate_plugin(plugin_id, trigger=f"service {name}"),
+            )
+
+        plugin_obj = Plugin(path, metadata, None)
+        plugin_obj.placeholder_blueprint = placeholder.name
+        plugin_obj._files_snapshot = self._snapshot_plugin_files(path)
+        self._plugins[plugin_id] = plugin_obj
+
+    def activate_plugin(self, plugin_id, trigger="manual"):
+        """Import và khởi tạo thật một plugin lazy. Trả về True nếu plugin đã sẵn sàng."""
+        plugin = self._plugins.get(plugin_id)
+        if plugin is None:
+            return False
+        if plugin.is_activated:
+            return True
+        with self._lock:
+            plugin = self._plugins.get(plugin_id)
+            if plugin is None:
+                return False
+            if plugin.is_activated:
+                return True
+
+            started = time.perf_counter()
+            success, _ = self._load_plugin_from_path(plugin.path, activate=True)
+            elapsed_ms = round((time.perf_counter() - started) * 1000, 3)
+            if not success:
+                # Giữ placeholder để request sau thử lại
+                plugin.activation_error = f"Activation failed after {elapsed_ms:.1f} ms (trigger: {trigger})."
+                return False
+
+            activated = self._plugins[plugin_id]
+            self._unregister_blueprint(plugin.placeholder_blueprint)
+            self.core_api.unregister_lazy_services(plugin_id)
+            activated.activation_ms = elapsed_ms
+            activated.activation_trigger = trigger
+            print(f"[PluginManager] Activated lazy plugin '{plugin_id}' in {elapsed_ms:.1f} ms (trigger: {trigger}).")
+            return True
+
+    def _dispatch_to_activated(self, plugin_id):
+        """View của placeholder: kích hoạt plugin rồi match lại URL để chạy route thật."""
+        if not self.activate_plugin(plugin_id, trigger=f"{request.method} {request.path}"):
+            abort(503, description=f"Plugin '{plugin_id}' could not be activated.")
+        return self._redispatch()
+
+    def _redispatch(self):
+        request_ctx.match_request()
+        if request.routing_exception is not None:
+            raise request.routing_exception
+        if self.app.view_functions.get(request.url_rule.endpoint) == self._rematch_view:
+            abort(404)
+        return self.app.dispatch_request()
+
+    def _rematch_view(self, **_view_args):
+        """
+        View thay cho view của blueprint vừa gỡ: request đã match rule cũ ngay trước lúc gỡ sẽ được
+        match lại trên url_map mới (route thật sau khi kích hoạt / reload, hoặc 404).
+        """
+        return self._redispatch()
+
+    def get_lazy_plugin_stats(self):
+        stats = []
+        for plugin in self._plugins.values():
+            if not plugin.lazy:
+                continue
+            stats.append({
+                "plugin_id": plugin.id,
+                "activated": plugin.is_activated,
+                "activation_ms": plugin.activation_ms,
+                "trigger": plugin.activation_trigger,
+                "error": plugin.activation_error,
+            })
+        return stats
+
     # -------------------- Hot-reload helpers --------------------
     def _snapshot_plugin_files(self, plugin_path):
         snapshot = {}
         try:
             for root, dirs, files in os.walk(plugin_path):
+                # static/, __pycache__... không chứa code backend, bỏ qua để khỏi stat cả cây asset
+                dirs[:] = [d for d in dirs if d not in IGNORED_DIR_NAMES and not d.startswith('.')]
                 for fname in files:
                     if not (fname.endswith('.py') or fname == 'plugin.json'):
                         continue
@@ -188,11 +473,19 @@ class PluginManager:
     def _unregister_blueprint(self, blueprint_name):
         if not blueprint_name:
             return
+        with self._route_lock.write():
+            self._unregister_blueprint_locked(blueprint_name)
+
+    def _unregister_blueprint_locked(self, blueprint_name):
         try:
             app = self.app
+            endpoint_prefix = f"{blueprint_name}."
+            # Không xoá hẳn view: request đã match rule cũ (trước khi có quyền ghi) vẫn tra view_functions
+            for endpoint in [e for e in app.view_functions if e.startswith(endpoint_prefix)]:
+                app.view_functions[endpoint] = self._rematch_view
             if blueprint_name in app.blueprints:
                 # Remove routes associated with the blueprint
-                rules_to_remove = [r for r in list(app.url_map.iter_rules()) if r.endpoint.startswith(f"{blueprint_name}.")]
+                rules_to_remove = [r for r in list(app.url_map.iter_rules()) if r.endpoint.startswith(endpoint_prefix)]
                 for rule in rules_to_remove:
                     # Remove from url_map rules
                     try:
@@ -208,8 +501,16 @@ class PluginManager:
                             pass
                         if not lst:
                             app.url_map._rules_by_endpoint.pop(rule.endpoint, None)
-                    # Remove view function
-                    app.view_functions.pop(rule.endpoint, None)
+                if rules_to_remove:
+                    # werkzeug biên dịch rule vào state machine riêng, xoá khỏi _rules_by_endpoint là chưa đủ
+                    # -> dựng lại matcher từ các rule còn lại để URL cũ không còn khớp
+                    url_map = app.url_map
+                    matcher = type(url_map._matcher)(url_map.merge_slashes)
+                    for rule in url_map.iter_rules():
+                        if not rule.build_only:
+                            matcher.add(rule)
+                    url_map._matcher = matcher
+                    url_map._remap = True
                 # Finally remove the blueprint registry entry
                 app.blueprints.pop(blueprint_name, None)
         except Exception as e:
@@ -239,6 +540,9 @@ class PluginManager:
                 # Unregister blueprint routes
                 if plugin.blueprint_name:
                     self._unregister_blueprint(plugin.blueprint_name)
+                if plugin.placeholder_blueprint:
+                    self._unregister_blueprint(plugin.placeholder_blueprint)
+                    self.core_api.unregister_lazy_services(plugin_id)
 
                 # Remove loaded modules for this plugin
                 try:
@@ -270,6 +574,12 @@ class PluginManager:
                     return True
                 return False
 
+            # Plugin lazy chưa kích hoạt: chỉ dựng lại placeholder theo manifest mới, không import
+            if old_plugin and old_plugin.lazy and not old_plugin.is_activated:
+                self._unload_plugin(plugin_id)
+                success, _ = self._load_plugin_from_path(plugin_path)
+                return success
+
             # Read manifest and prepare import
             try:
                 with open(manifest_path, "r", encoding="utf-8") as f:
@@ -333,7 +643,8 @@ class PluginManager:
                 if hasattr(backend_instance, "get_blueprint"):
                     blueprint, url_prefix = backend_instance.get_blueprint()
                     if blueprint:
-                        self.app.register_blueprint(blueprint, url_prefix=url_prefix)
+                        with self._runtime_registration():
+                            self.app.register_blueprint(blueprint, url_prefix=url_prefix)
                         try:
                             blueprint_name = getattr(blueprint, "name", None)
                         except Exception:
@@ -353,54 +664,114 @@ class PluginManager:
                 print(self._color_text(f"[PluginManager] Reload failed for '{plugin_id}': {e}", COLOR_RED))
                 return False
 
-    def start_hot_reload_watcher(self, interval: float = 1.0):
+    @staticmethod
+    def _is_hot_reload_relevant(filename):
+        return filename.endswith('.py') or filename == 'plugin.json'
+
+    def _on_watch_event(self, path, is_dir):
+        """Callback của file watcher: chỉ ghi nhận plugin bị ảnh hưởng, việc reload làm theo lô."""
+        rel = os.path.relpath(path, os.path.abspath(self.plugins_dir))
+        if rel.startswith('..'):
+            return
+        parts = rel.split(os.sep)
+        if rel == '.':
+            plugin_id = None  # inotify overflow / root thay đổi -> kiểm tra toàn bộ
+        else:
+            plugin_id = parts[0]
+            # Thay đổi không phải code backend (css/js/ảnh...) và không phải thư mục thì bỏ qua
+            if len(parts) > 1 and not is_dir and not self._is_hot_reload_relevant(parts[-1]):
+                return
+        with self._watch_cond:
+            self._pending_reloads.add(plugin_id)
+            self._last_watch_event = time.monotonic()
+            self._watch_cond.notify()
+
+    def _process_reload_batch(self, plugin_ids):
+        if None in plugin_ids:
+            plugin_ids = set(self._plugins.keys())
+            try:
+                plugin_ids.update(e.name for e in os.scandir(self.plugins_dir) if e.is_dir())
+            except OSError:
+                pass
+        for pid in sorted(plugin_ids):
+            plugin_path = os.path.join(self.plugins_dir, pid)
+            plugin = self._plugins.get(pid)
+            if plugin is None:
+                # Plugin mới được thêm vào
+                if os.path.isdir(plugin_path) and os.path.exists(os.path.join(plugin_path, "plugin.json")):
+                    self._load_plugin_from_path(plugin_path)
+                continue
+            if not os.path.isdir(plugin.path):
+                self._unload_plugin(pid)
+                print(f"[PluginManager] Plugin '{pid}' directory removed. Unloaded.")
+                continue
+            # Chỉ snapshot lại plugin có sự kiện, xác nhận thay đổi thật trước khi reload
+            if self._files_changed(plugin):
+                self.reload_plugin(pid)
+
+    def start_hot_reload_watcher(self, interval: float = 1.0, backend: str = "auto", debounce: float = 0.5):
+        """
+        Yuuka: hot-reload v2.0 - Theo dõi thư mục plugins bằng inotify/watchdog (fallback: polling theo
+        mtime thư mục), gom các thay đổi trong `debounce` giây rồi reload theo lô các plugin bị ảnh hưởng.
+        """
         with self._lock:
             if self._watcher_thread and self._watcher_thread.is_alive():
                 return
+            os.makedirs(self.plugins_dir, exist_ok=True)
             self._watcher_stop_event = threading.Event()
-
-            def _watch_loop():
-                # Initial discover of new plugin folders not yet loaded
-                os.makedirs(self.plugins_dir, exist_ok=True)
-                while not self._watcher_stop_event.is_set():
+            self._watch_cond = threading.Condition()
+            self._pending_reloads = set()
+            self._last_watch_event = 0.0
+            stop_event = self._watcher_stop_event
+
+            self._file_watcher = create_file_watcher(
+                self.plugins_dir,
+                self._on_watch_event,
+                backend=backend,
+                poll_interval=interval,
+                relevant_file=self._is_hot_reload_relevant,
+            )
+            # Bắt các plugin được thêm vào trước khi watcher kịp khởi động
+            self._on_watch_event(os.path.abspath(self.plugins_dir), True)
+
+            def _dispatch_loop():
+                while not stop_event.is_set():
+                    with self._watch_cond:
+                        while not self._pending_reloads and not stop_event.is_set():
+                            self._watch_cond.wait(1.0)
+                        if stop_event.is_set():
+                            return
+                        # Debounce: đợi tới khi không còn sự kiện mới trong `debounce` giây
+                        quiet_for = time.monotonic() - self._last_watch_event
+                        if quiet_for < debounce:
+                            self._watch_cond.wait(debounce - quiet_for)
+                            continue
+                        batch = self._pending_reloads
+                        self._pending_reloads = set()
                     try:
-                        # Discover and load newly added plugins
-                        seen = set()
-                        for entry in os.scandir(self.plugins_dir):
-                            if entry.is_dir():
-                                seen.add(entry.name)
-                                if entry.name not in self._plugins:
-                                    self._load_plugin_from_path(entry.path)
-
-                        # Unload plugins removed from disk
-                        for pid in list(self._plugins.keys()):
-                            plugin = self._plugins.get(pid)
-                            if not plugin:
-                                continue
-                            if not os.path.isdir(plugin.path):
-                                self._unload_plugin(pid)
-                                print(f"[PluginManager] Plugin '{pid}' directory removed. Unloaded.")
-                                continue
-                            # Reload if files changed
-                            if self._files_changed(plugin):
-                                self.reload_plugin(pid)
+                        with self._lock:
+                            self._process_reload_batch(batch)
                     except Exception as e:
                         print(self._color_text(f"[PluginManager] Hot-reload watcher error: {e}", COLOR_RED))
-                    finally:
-                        time.sleep(max(0.2, interval))
 
-            self._watcher_thread = threading.Thread(target=_watch_loop, name="PluginHotReload", daemon=True)
+            self._watcher_thread = threading.Thread(target=_dispatch_loop, name="PluginHotReload", daemon=True)
             self._watcher_thread.start()
-            print("[PluginManager] Hot-reload watcher started.")
+            print(f"[PluginManager] Hot-reload watcher started ({self._file_watcher.name} backend).")
 
     def stop_hot_reload_watcher(self):
         with self._lock:
-            if self._watcher_stop_event:
-                self._watcher_stop_event.set()
-            if self._watcher_thread:
-                self._watcher_thread.join(timeout=2.0)
-            self._watcher_thread = None
-            self._watcher_stop_event = None
+            file_watcher, self._file_watcher = self._file_watcher, None
+            watcher_thread, self._watcher_thread = self._watcher_thread, None
+            stop_event, self._watcher_stop_event = self._watcher_stop_event, None
+            if stop_event:
+                stop_event.set()
+                with self._watch_cond:
+                    self._watch_cond.notify_all()
+        # Join ngoài self._lock: thread dispatch cần chính lock này để xử lý nốt lô reload đang dở
+        if file_watcher:
+            file_watcher.stop()
+        if watcher_thread:
+            watcher_thread.join(timeout=2.0)
 
     def _color_text(self, text, color_code):
         if not text:
@@ -0,0 +1,281 @@
+import select
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from werkzeug.serving import ThreadedWSGIServer, WSGIRequestHandler
+
+
+DEFAULT_SERVER_CONFIG = {
+    "mode": "development",  # development | production
+    "host": "0.0.0.0",
+    "port": 5000,
+    "worker_threads": 32,
+    "keep_alive": True,
+    "request_timeout": 30.0,
+    "keep_alive_timeout": 5.0,
+    "drain_timeout": 15.0,
+}
+
+# Requests on these paths stay open (event stream / websocket) and give their worker slot back.
+# Only known routes qualify, so a client cannot escape the worker cap by sending the headers elsewhere.
+LONG_LIVED_PATHS = {
+    "/api/core/generate/stream": "event-stream",
+    "/ws/game": "websocket",
+}
+
+
+def resolve_server_config(raw_config: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Merge the "server" section of server_config.json with defaults and sanitize values."""
+    config = dict(DEFAULT_SERVER_CONFIG)
+    if isinstance(raw_config, dict):
+        config.update({k: v for k, v in raw_config.items() if v is not None})
+    config["mode"] = str(config.get("mode") or "development").strip().lower()
+    try:
+        config["port"] = int(config["port"])
+    except (TypeError, ValueError):
+        config["port"] = DEFAULT_SERVER_CONFIG["port"]
+    try:
+        config["worker_threads"] = max(2, int(config["worker_threads"]))
+    except (TypeError, ValueError):
+        config["worker_threads"] = DEFAULT_SERVER_CONFIG["worker_threads"]
+    for key in ("request_timeout", "keep_alive_timeout", "drain_timeout"):
+        try:
+            config[key] = max(0.0, float(config[key]))
+        except (TypeError, ValueError):
+            config[key] = DEFAULT_SERVER_CONFIG[key]
+    config["keep_alive"] = bool(config.get("keep_alive"))
+    return config
+
+
+class PooledWSGIServer(ThreadedWSGIServer):
+    """
+    Threaded Werkzeug server with a bounded number of concurrent connections.
+
+    - At most ``worker_threads`` connections are served at once; further connections wait
+      in the listen backlog instead of spawning unbounded threads.
+    - WebSocket upgrades (flask_sock) and event-stream requests on ``long_lived_paths`` give their
+      slot back as soon as they are seen, so long-lived sockets such as /ws/game never starve
+      regular HTTP requests.
+    - ``begin_drain`` stops accepting new connections; ``wait_for_drain`` lets in-flight
+      requests finish before the process shuts down.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        app: Callable,
+        *,
+        worker_threads: int = 32,
+        request_timeout: float = 30.0,
+        handler: Optional[type] = None,
+        long_lived_paths: Optional[Dict[str, str]] = None,
+    ):
+        self.worker_threads = max(2, int(worker_threads))
+        self.long_lived_paths = dict(LONG_LIVED_PATHS if long_lived_paths is None else long_lived_paths)
+        self.request_timeout = request_timeout or None
+        self._slots = threading.BoundedSemaphore(self.worker_threads)
+        self._slot_local = threading.local()
+        self._inflight = 0
+        self._inflight_cond = threading.Condition()
+        self._draining = threading.Event()
+        super().__init__(host, port, self._slot_aware_app(app), handler=handler)
+
+    # ------------------------------------------------------------------ #
+    # Slot bookkeeping
+    # ------------------------------------------------------------------ #
+
+    def _slot_aware_app(self, app: Callable) -> Callable:
+        def _wrapped(environ, start_response):
+            if self._is_long_lived(environ):
+                sock = environ.get("werkzeug.socket")
+                if sock is not None:
+                    try:
+                        # WebSocket frames / SSE events may be minutes apart; the request timeout must not apply.
+                        sock.settimeout(None)
+                    except OSError:
+                        pass
+                self._release_slot()
+            return app(environ, start_response)
+
+        return _wrapped
+
+    def _is_long_lived(self, environ: Dict[str, Any]) -> bool:
+        kind = self.long_lived_paths.get(environ.get("PATH_INFO", ""))
+        if kind is None or environ.get("REQUEST_METHOD") != "GET":
+            return False
+        if kind == "websocket":
+            # A real handshake, not just an Upgrade header on a plain request
+            return (
+                environ.get("HTTP_UPGRADE", "").lower() == "websocket"
+                and "upgrade" in environ.get("HTTP_CONNECTION", "").lower()
+                and bool(environ.get("HTTP_SEC_WEBSOCKET_KEY"))
+            )
+        return True
+
+    def _release_slot(self) -> None:
+        if getattr(self._slot_local, "holds_slot", False):
+            self._slot_local.holds_slot = False
+            self._slots.release()
+
+    def process_request(self, request, client_address):
+        # Block the accept loop (not a new thread) while all workers are busy.
+        while not self._slots.acquire(timeout=0.5):
+            if self._draining.is_set():
+                self.shutdown_request(request)
+                return
+        thread = threading.Thread(
+            target=self.process_request_thread,
+            args=(request, client_address),
+            name="yuuka-http-worker",
+            daemon=True,
+        )
+        thread.start()
+
+    def process_request_thread(self, request, client_address):
+        self._slot_local.holds_slot = True
+        with self._inflight_cond:
+            self._inflight += 1
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            self._release_slot()
+            with self._inflight_cond:
+                self._inflight -= 1
+                self._inflight_cond.notify_all()
+
+    # ------------------------------------------------------------------ #
+    # Drain & introspection
+    # ------------------------------------------------------------------ #
+
+    def begin_drain(self) -> None:
+        """Stop accepting connections. Safe to call from signal handlers."""
+        if self._draining.is_set():
+            return
+        self._draining.set()
+        # shutdown() blocks until serve_forever exits, so never call it on the serving thread.
+        threading.Thread(target=self.shutdown, name="yuuka-http-drain", daemon=True).start()
+
+    def wait_for_drain(self, timeout: float) -> bool:
+        deadline = time.time() + max(0.0, timeout)
+        with self._inflight_cond:
+            while self._inflight > 0:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self._inflight_cond.wait(remaining)
+        return True
+
+    @property
+    def is_draining(self) -> bool:
+        return self._draining.is_set()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._inflight_cond:
+            inflight = self._inflight
+        return {
+            "worker_threads": self.worker_threads,
+            "inflight_connections": inflight,
+            "draining": self.is_draining,
+        }
+
+
+# How often an idle keep-alive connection re-checks whether the server started draining.
+_IDLE_POLL_INTERVAL = 0.5
+
+
+def build_request_handler(
+    base_handler: type,
+    *,
+    keep_alive: bool,
+    request_timeout: float,
+    keep_alive_timeout: float = DEFAULT_SERVER_CONFIG["keep_alive_timeout"],
+) -> type:
+    """
+    Derive a request handler class with HTTP/1.1 keep-alive and a per-socket timeout.
+
+    ``request_timeout`` bounds reading/serving a request; an idle keep-alive connection waiting
+    for its next request is closed after ``keep_alive_timeout`` instead, or as soon as the server
+    starts draining, so idle browser sockets do not pin worker slots or hold up shutdown.
+    """
+    base_handler = base_handler or WSGIRequestHandler
+
+    def _wait_for_next_request(self) -> bool:
+        """True when the client sent (part of) its next request, False to hang up."""
+        connection = self.connection
+        deadline = time.time() + keep_alive_timeout
+        while True:
+            pending = getattr(connection, "pending", None)  # TLS records already decrypted
+            if callable(pending) and pending():
+                return True
+            remaining = deadline - time.time()
+            if remaining <= 0 or getattr(self.server, "is_draining", False):
+                return False
+            try:
+                readable, _, _ = select.select([connection], [], [], min(_IDLE_POLL_INTERVAL, remaining))
+            except (OSError, ValueError):
+                return False
+            if readable:
+                return True
+
+    def handle_one_request(self):
+        # Browsers do not pipeline, so between requests the read buffer is empty and waiting on the
+        # socket itself is enough to tell "idle" from "next request arriving".
+        if getattr(self, "_served_requests", 0) and not self._wait_for_next_request():
+            self.close_connection = True
+            return
+        base_handler.handle_one_request(self)
+        self._served_requests = getattr(self, "_served_requests", 0) + 1
+        # Once draining, finish the current request and hang up instead of waiting for the next one.
+        if getattr(self.server, "is_draining", False):
+            self.close_connection = True
+
+    attrs = {
+        "protocol_version": "HTTP/1.1" if keep_alive else "HTTP/1.0",
+        "timeout": request_timeout or None,
+        "handle_one_request": handle_one_request,
+        "_wait_for_next_request": _wait_for_next_request,
+    }
+    return type(f"Production{base_handler.__name__}", (base_handler,), attrs)
+
+
+def run_production_server(
+    app: Callable,
+    config: Dict[str, Any],
+    *,
+    handler: Optional[type] = None,
+    on_server_created: Optional[Callable[[PooledWSGIServer], Any]] = None,
+    on_drained: Optional[Callable[[bool], Any]] = None,
+) -> None:
+    """Serve ``app`` until drained, then invoke ``on_drained(clean)``."""
+    request_handler = build_request_handler(
+        handler,
+        keep_alive=config["keep_alive"],
+        request_timeout=config["request_timeout"],
+        keep_alive_timeout=config["keep_alive_timeout"],
+    )
+    server = PooledWSGIServer(
+        config["host"],
+        config["port"],
+        app,
+        worker_threads=config["worker_threads"],
+        request_timeout=config["request_timeout"],
+        handler=request_handler,
+    )
+    if on_server_created:
+        on_server_created(server)
+    print(
+        f"[Server] Production mode on {config['host']}:{config['port']} "
+        f"({config['worker_threads']} workers, keep-alive={'on' if config['keep_alive'] else 'off'}, "
+        f"timeout={config['request_timeout']}s, idle={config['keep_alive_timeout']}s)."
+    )
+    try:
+        server.serve_forever()
+    finally:
+        clean = server.wait_for_drain(config["drain_timeout"])
+        if not clean:
+            print(f"[Server] Drain timed out after {config['drain_timeout']}s; closing remaining connections.")
+        server.server_close()
+        if on_drained:
+            on_drained(clean)
@@ -0,0 +1,187 @@
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from importlib.abc import MetaPathFinder
+from typing import Any, Dict, List, Optional
+
+
+class _TimedLoader:
+    """Bọc loader thật để đo thời gian exec_module (gồm cả các import lồng bên trong)."""
+
+    def __init__(self, loader, tracker: "ImportTracker"):
+        self._loader = loader
+        self._tracker = tracker
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+    def create_module(self, spec):
+        create = getattr(self._loader, "create_module", None)
+        return create(spec) if create else None
+
+    def exec_module(self, module):
+        tracker = self._tracker
+        tracker._depth += 1
+        started = time.perf_counter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            elapsed = time.perf_counter() - started
+            tracker._depth -= 1
+            tracker._record(module.__name__, elapsed, tracker._depth)
+
+
+class ImportTracker(MetaPathFinder):
+    """
+    Theo dõi import kiểu `-X importtime` trong một khoảng (ví dụ lúc load một plugin):
+    ghi lại module mới được import, thời gian cumulative và độ sâu lồng nhau.
+    """
+
+    def __init__(self):
+        self._depth = 0
+        self._records: List[Dict[str, Any]] = []
+        self._in_find = threading.local()
+
+    def find_spec(self, fullname, path=None, target=None):
+        if getattr(self._in_find, "active", False):
+            return None
+        self._in_find.active = True
+        try:
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, "find_spec"):
+                    continue
+                spec = finder.find_spec(fullname, path, target)
+                if spec is not None:
+                    if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                        spec.loader = _TimedLoader(spec.loader, self)
+                    return spec
+            return None
+        finally:
+            self._in_find.active = False
+
+    def _record(self, name: str, elapsed: float, depth: int) -> None:
+        self._records.append({"module": name, "cumulative_ms": round(elapsed * 1000, 3), "depth": depth})
+
+    def __enter__(self):
+        sys.meta_path.insert(0, self)
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            sys.meta_path.remove(self)
+        except ValueError:
+            pass
+        return False
+
+    def top_level_imports(self, limit: int = 10) -> List[Dict[str, Any]]:
+        """Các import gốc (depth 0) tốn thời gian nhất."""
+        roots = [r for r in self._records if r["depth"] == 0]
+        return sorted(roots, key=lambda r: r["cumulative_ms"], reverse=True)[:limit]
+
+    @property
+    def module_count(self) -> int:
+        return len(self._records)
+
+
+class StartupProfiler:
+    """
+    Yuuka: startup profiler v1.0 - Đo thời gian từng pha khởi động (dependency check, template,
+    load_core_data, từng plugin...) và xuất báo cáo cho console + /api/server/startup_profile.
+    """
+
+    def __init__(self):
+        self.process_started_at = time.time()
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self._phases: List[Dict[str, Any]] = []
+        self._plugins: Dict[str, Dict[str, Any]] = {}
+        self._stack = threading.local()
+        self.ready_at: Optional[float] = None
+        self.track_imports = os.environ.get("YUUKA_PROFILE_IMPORTS", "").strip().lower() in ("1", "true", "yes", "on")
+
+    @contextmanager
+    def phase(self, name: str, **meta):
+        stack = getattr(self._stack, "names", None)
+        if stack is None:
+            stack = self._stack.names = []
+        parent = stack[-1] if stack else None
+        stack.append(name)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            stack.pop()
+            entry = {
+                "name": name,
+                "parent": parent,
+                "start_ms": round((started - self._origin) * 1000, 3),
+                "duration_ms": round(elapsed * 1000, 3),
+            }
+            if meta:
+                entry.update(meta)
+            with self._lock:
+                self._phases.append(entry)
+
+    @contextmanager
+    def plugin(self, plugin_id: str):
+        """Đo tổng thời gian load một plugin; bật theo dõi import nếu track_imports."""
+        record: Dict[str, Any] = {"plugin_id": plugin_id, "steps": {}}
+        tracker = ImportTracker() if self.track_imports else None
+        started = time.perf_counter()
+        try:
+            if tracker:
+                with tracker:
+                    yield record
+            else:
+                yield record
+        finally:
+            record["total_ms"] = round((time.perf_counter() - started) * 1000, 3)
+            if tracker:
+                record["imports"] = {
+                    "modules": tracker.module_count,
+                    "slowest": tracker.top_level_imports(),
+                }
+            with self._lock:
+                self._plugins[plugin_id] = record
+
+    @contextmanager
+    def step(self, record: Dict[str, Any], name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            record["steps"][name] = round((time.perf_counter() - started) * 1000, 3)
+
+    def mark_ready(self) -> None:
+        self.ready_at = time.perf_counter()
+
+    def get_report(self) -> Dict[str, Any]:
+        with self._lock:
+            phases = [dict(p) for p in self._phases]
+            plugins = sorted((dict(p) for p in self._plugins.values()), key=lambda p: p.get("total_ms", 0), reverse=True)
+        return {
+            "process_started_at": self.process_started_at,
+            "ready_ms": round((self.ready_at - self._origin) * 1000, 3) if self.ready_at else None,
+            "import_tracking": self.track_imports,
+            "phases": sorted(phases, key=lambda p: p["start_ms"]),
+            "plugins": plugins,
+        }
+
+    def print_summary(self, top_plugins: int = 5) -> None:
+        report = self.get_report()
+        print("[Startup] Boot profile:")
+        for phase in report["phases"]:
+            indent = "    " if phase["parent"] else "  "
+            print(f"{indent}- {phase['name']}: {phase['duration_ms']:.1f} ms")
+        for plugin in report["plugins"][:top_plugins]:
+            steps = ", ".join(f"{k} {v:.1f}" for k, v in plugin["steps"].items())
+            print(f"  - plugin '{plugin['plugin_id']}': {plugin['total_ms']:.1f} ms ({steps})")
+        if report["ready_ms"] is not None:
+            print(f"  = ready after {report['ready_ms']:.1f} ms")
+
+
+# Một profiler dùng chung cho cả tiến trình
+startup_profiler = StartupProfiler()
@@ -0,0 +1,141 @@
+import bisect
+import heapq
+import threading
+from array import array
+from typing import Dict, Iterable, List, Optional, Set
+
+
+def normalize_tag_query(value: object) -> str:
+    """Chuẩn hoá tag/query: chữ thường, '_' thành khoảng trắng, gộp khoảng trắng."""
+    return " ".join(str(value or "").replace("_", " ").lower().split())
+
+
+class TagSuggestionEngine:
+    """
+    Yuuka: tag suggest v1.0 - Gợi ý tag phía server, dựng một lần từ danh sách tag đã sắp theo độ phổ biến.
+
+    - Prefix: mảng key đã sort + bisect cho ra dải khớp, rồi lấy top-k theo rank (rank 0 = phổ biến nhất).
+      Các prefix 1-2 ký tự (dải rất rộng) được tính sẵn top-k.
+    - Infix fallback: chỉ mục trigram (array('I') theo rank tăng dần), dựng lazy ở lần đầu cần dùng.
+    """
+
+    PRECOMPUTED_PREFIX_LENGTH = 2
+    PRECOMPUTED_TOP_K = 50
+
+    def __init__(self, tags_by_popularity: Iterable[str]):
+        self._tags: List[str] = []
+        self._keys: List[str] = []
+        seen: Set[str] = set()
+        for tag in tags_by_popularity or []:
+            key = normalize_tag_query(tag)
+            if not key or key in seen:
+                continue
+            seen.add(key)
+            self._tags.append(tag)
+            self._keys.append(key)
+
+        order = sorted(range(len(self._keys)), key=self._keys.__getitem__)
+        self._sorted_keys: List[str] = [self._keys[i] for i in order]
+        self._sorted_ranks = array('I', order)
+
+        self._short_prefix_top: Dict[str, List[int]] = {}
+        for rank, key in enumerate(self._keys):
+            for length in range(1, self.PRECOMPUTED_PREFIX_LENGTH + 1):
+                if len(key) < length:
+                    break
+                bucket = self._short_prefix_top.setdefault(key[:length], [])
+                if len(bucket) < self.PRECOMPUTED_TOP_K:
+                    bucket.append(rank)
+
+        self._trigrams: Optional[Dict[str, array]] = None
+        self._trigram_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._tags)
+
+    # ------------------------------------------------------------------ #
+    # Index helpers
+    # ------------------------------------------------------------------ #
+
+    @staticmethod
+    def _iter_trigrams(key: str) -> Set[str]:
+        return {key[i:i + 3] for i in range(len(key) - 2)}
+
+    def _ensure_trigrams(self) -> Dict[str, array]:
+        if self._trigrams is not None:
+            return self._trigrams
+        with self._trigram_lock:
+            if self._trigrams is None:
+                index: Dict[str, array] = {}
+                for rank, key in enumerate(self._keys):
+                    for gram in self._iter_trigrams(key):
+                        posting = index.get(gram)
+                        if posting is None:
+                            posting = index[gram] = array('I')
+                        posting.append(rank)
+                self._trigrams = index
+        return self._trigrams
+
+    def _prefix_ranks(self, query: str, limit: int) -> List[int]:
+        if len(query) <= self.PRECOMPUTED_PREFIX_LENGTH and limit <= self.PRECOMPUTED_TOP_K:
+            return self._short_prefix_top.get(query, [])[:limit]
+        lo = bisect.bisect_left(self._sorted_keys, query)
+        hi = bisect.bisect_left(self._sorted_keys, query + "\U0010ffff", lo)
+        if hi - lo <= limit:
+            return sorted(self._sorted_ranks[lo:hi])
+        return heapq.nsmallest(limit, self._sorted_ranks[lo:hi])
+
+    def _infix_ranks(self, query: str, limit: int, skip: Set[int]) -> List[int]:
+        grams = self._iter_trigrams(query)
+        if not grams:
+            return []
+        index = self._ensure_trigrams()
+        postings = []
+        for gram in grams:
+            posting = index.get(gram)
+            if posting is None:
+                return []
+            postings.append(posting)
+        # Posting ngắn nhất đã theo thứ tự rank, chỉ cần xác minh substring.
+        shortest = min(postings, key=len)
+        found: List[int] = []
+        for rank in shortest:
+            if rank in skip or query not in self._keys[rank]:
+                continue
+            found.append(rank)
+            if len(found) >= limit:
+                break
+        return found
+
+    # ------------------------------------------------------------------ #
+    # Public API
+    # ------------------------------------------------------------------ #
+
+    def suggest(self, query: object, limit: int = 20, *, infix: bool = True, exclude: Iterable[str] = ()) -> List[str]:
+        """
+        Trả về tối đa `limit` tag: khớp prefix trước (theo độ phổ biến), sau đó khớp infix.
+        `exclude` là các tag (dạng bất kỳ) cần bỏ qua, ví dụ các tag đã nhập trước đó.
+        """
+        limit = max(0, int(limit))
+        if not limit or not self._tags:
+            return []
+        excluded = {normalize_tag_query(item) for item in exclude or ()}
+        excluded.discard("")
+        normalized = normalize_tag_query(query)
+        fetch = limit + len(excluded)
+
+        if not normalized:
+            ranks = list(range(min(fetch, len(self._tags))))
+        else:
+            ranks = self._prefix_ranks(normalized, fetch)
+            if infix and len(ranks) < fetch:
+                ranks = ranks + self._infix_ranks(normalized, fetch - len(ranks), set(ranks))
+
+        results: List[str] = []
+        for rank in ranks:
+            if self._keys[rank] in excluded:
+                continue
+            results.append(self._tags[rank])
+            if len(results) >= limit:
+                break
+        return results
@@ -23,6 +23,7 @@ class ManagedThreadTask:
         auto_restart: bool = False,
         restart_delay: float = 5.0,
         daemon: bool = True,
+        progress_provider: Optional[Callable[[], Any]] = None,
     ):
         self.plugin_id = plugin_id
         self.name = name
@@ -34,6 +35,7 @@ class ManagedThreadTask:
         self._auto_restart = auto_restart
         self._restart_delay = max(0.5, restart_delay)
         self._daemon = daemon
+        self._progress_provider = progress_provider
 
         self._thread: Optional[threading.Thread] = None
         self._stop_event = threading.Event()
@@ -128,9 +130,17 @@ class ManagedThreadTask:
             self._thread = None
             self.last_stopped_at = time.time()
 
+    def get_progress(self) -> Optional[Any]:
+        if not self._progress_provider:
+            return None
+        try:
+            return self._progress_provider()
+        except Exception as exc:
+            return {"error": str(exc)}
+
     def to_dict(self) -> Dict[str, Any]:
         with self._lock:
-            return {
+            info = {
                 "plugin_id": self.plugin_id,
                 "name": self.name,
                 "status": self.status,
@@ -140,6 +150,10 @@ class ManagedThreadTask:
                 "restart_count": self.restart_count,
                 "is_running": bool(self._thread and self._thread.is_alive()),
             }
+        progress = self.get_progress()
+        if progress is not None:
+            info["progress"] = progress
+        return info
 
 
 class BackgroundTaskService:
@@ -170,6 +184,7 @@ class BackgroundTaskService:
         auto_restart: bool = False,
         restart_delay: float = 5.0,
         daemon: bool = True,
+        progress_provider: Optional[Callable[[], Any]] = None,
     ) -> ManagedThreadTask:
         if not plugin_id:
             raise ValueError("plugin_id is required to register a background task.")
@@ -187,6 +202,7 @@ class BackgroundTaskService:
             auto_restart=auto_restart,
             restart_delay=restart_delay,
             daemon=daemon,
+            progress_provider=progress_provider,
         )
 
         with self._lock:
@@ -6,6 +6,8 @@ from typing import List, Dict, Any, Optional
 
 import requests
 
+from integrations.comfy_catalog_cache import ComfyCatalogCache
+
 def get_all_nodes_info_sync(server_address: str) -> Optional[Dict[str, Any]]:
     """
     Yuuka: Hàm mới hiệu quả hơn, lấy tất cả object_info một lần.
@@ -64,19 +66,15 @@ def _extract_choices_from_info(
         print(f"[API Client] Lỗi khi trích xuất '{param_name}' từ node '{node_class}': {e}")
         return []
 
-def get_full_object_info(server_address: str) -> Dict[str, List[str]]:
+def _fetch_object_info_choices(server_address: str) -> Optional[Dict[str, List[str]]]:
     """
-    Yuuka: Sửa lại hàm chính để sử dụng logic mới.
-    Lấy tất cả các danh sách lựa chọn cần thiết (LoRA, checkpoints, samplers, etc.)
-    từ ComfyUI API để điền vào các dropdown trong giao diện.
+    Yuuka: object_info catalog v1.0 - Tải /object_info và chỉ giữ lại các danh sách lựa chọn cần cho UI.
+    Trả về None khi không kết nối được để cache phân biệt "lỗi" với "server không có LoRA nào".
     """
     all_nodes_info = get_all_nodes_info_sync(server_address)
 
     if not all_nodes_info:
-        # Trả về danh sách trống mà không in thêm log để tránh trùng lặp thông báo.
-        return {
-            "loras": [], "checkpoints": [], "samplers": [], "schedulers": []
-        }
+        return None
 
     info = {
         "loras": _extract_choices_from_info(all_nodes_info, "LoraLoader", "lora_name"),
@@ -93,6 +91,27 @@ def get_full_object_info(server_address: str) -> Dict[str, List[str]]:
     #print(f"[API Client] Lấy thông tin thành công: {len(info['loras'])} LoRAs, {len(info['checkpoints'])} Checkpoints...")
     return info
 
+# Yuuka: object_info catalog v1.0 - Dùng chung cho mọi plugin; TTL chỉnh qua server_config "comfy_catalog"
+object_info_cache = ComfyCatalogCache(_fetch_object_info_choices)
+
+def get_full_object_info(server_address: str, force_refresh: bool = False) -> Dict[str, List[str]]:
+    """
+    Yuuka: Sửa lại hàm chính để sử dụng logic mới.
+    Lấy tất cả các danh sách lựa chọn cần thiết (LoRA, checkpoints, samplers, etc.)
+    từ ComfyUI API để điền vào các dropdown trong giao diện.
+    Kết quả được cache theo server (xem ComfyCatalogCache); `force_refresh` bỏ qua cache và chờ bản mới.
+    """
+    # Trả về danh sách trống khi server lỗi mà không in thêm log để tránh trùng lặp thông báo.
+    empty = {"loras": [], "checkpoints": [], "samplers": [], "schedulers": []}
+    return object_info_cache.get(server_address, empty, force_refresh=force_refresh)
+
+def invalidate_object_info(server_address: Optional[str] = None) -> None:
+    """Báo catalog đã đổi (vd. vừa tải / xoá LoRA) để lần đọc sau lấy danh sách mới."""
+    object_info_cache.invalidate(server_address)
+
+def get_object_info_cache_stats() -> Dict[str, Any]:
+    return object_info_cache.get_stats()
+
 def queue_prompt(prompt_workflow: dict, client_id: str, server_address: str) -> dict:
     p = {"prompt": prompt_workflow, "client_id": client_id}
     headers = {'Content-Type': 'application/json'}
@@ -150,15 +169,25 @@ def get_image(filename: str, subfolder: str, folder_type: str, server_address: s
     except urllib.error.URLError as e:
         raise ConnectionError(f"Could not connect to ComfyUI API for image viewing. ({e.reason})") from e
 
+def get_queue(server_address: str, timeout: float = 5) -> dict:
+    """GET /queue; khác get_queue_details_sync ở chỗ báo lỗi thay vì trả {} để phân biệt "không hỏi được"."""
+    try:
+        with urllib.request.urlopen(f"http://{server_address}/queue", timeout=timeout) as response:
+            if response.status != 200:
+                raise ConnectionError(f"ComfyUI API Error ({response.status}) getting queue.")
+            return json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        raise ConnectionError(f"Could not get queue ({e.code} {e.reason}).") from e
+    except urllib.error.URLError as e:
+        raise ConnectionError(f"Could not connect to ComfyUI API for queue. ({e.reason})") from e
+    except OSError as e:
+        raise ConnectionError(f"Could not read queue from ComfyUI API. ({e})") from e
+    except json.JSONDecodeError as e:
+        raise ValueError("Invalid JSON for queue.") from e
+
 def get_queue_details_sync(server_address: str) -> dict:
     try:
-        req = urllib.request.Request(f"http://{server_address}/queue")
-        with urllib.request.urlopen(req, timeout=5) as response:
-            if response.status == 200:
-                return json.loads(response.read())
-            else:
-                print(f"Error getting queue details: {response.status}")
-                return {}
+        return get_queue(server_address)
     except Exception as e:
         print(f"Exception getting queue details: {e}")
         return {}
@@ -0,0 +1,149 @@
+import copy
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+
+class _CatalogEntry:
+    __slots__ = ("choices", "fetched_at", "ok", "invalidated", "generation", "refreshing", "done")
+
+    def __init__(self):
+        self.choices: Optional[Dict[str, Any]] = None
+        self.fetched_at = 0.0
+        self.ok = False
+        self.invalidated = False
+        # Tăng mỗi lần invalidate; lần tải bắt đầu trước đó không được xoá cờ invalidated
+        self.generation = 0
+        self.refreshing = False
+        # Set khi không có lần tải nào đang chạy; caller cần dữ liệu mới thì chờ trên event này
+        self.done = threading.Event()
+        self.done.set()
+
+
+class ComfyCatalogCache:
+    """
+    Yuuka: object_info catalog v1.0 - Cache danh sách lựa chọn (LoRA, checkpoint, sampler, scheduler,
+    upscale model...) trích từ /object_info, theo từng ComfyUI server.
+
+    - Còn trong `ttl`: trả ngay từ cache.
+    - Quá `ttl` nhưng chưa quá `max_stale`: vẫn trả bản cũ ngay, đồng thời tải lại ở background.
+    - Chưa có / quá cũ / vừa bị `invalidate()`: tải đồng bộ. Nhiều request cùng lúc chỉ tải một lần.
+    - Tải lỗi: giữ bản cũ nếu có; nếu không thì nhớ kết quả rỗng trong `error_ttl` giây để không dội
+      request vào server đang tắt.
+    Chỉ giữ phần đã trích (vài KB), không giữ cả document /object_info.
+    """
+
+    def __init__(self, fetch: Callable[[str], Optional[Dict[str, Any]]], ttl: float = 300.0,
+                 max_stale: float = 24 * 3600, error_ttl: float = 10.0):
+        self._fetch = fetch
+        self.configure(ttl, max_stale, error_ttl)
+        self._lock = threading.Lock()
+        self._entries: Dict[str, _CatalogEntry] = {}
+        self._hits = 0
+        self._stale_hits = 0
+        self._misses = 0
+        self._fetches = 0
+        self._fetch_errors = 0
+        self._invalidations = 0
+
+    def configure(self, ttl: float = 300.0, max_stale: float = 24 * 3600, error_ttl: float = 10.0) -> None:
+        self.ttl = max(0.0, float(ttl))
+        self.max_stale = max(self.ttl, float(max_stale))
+        self.error_ttl = max(0.0, float(error_ttl))
+
+    def get(self, server_address: str, empty: Dict[str, Any], force_refresh: bool = False) -> Dict[str, Any]:
+        """Bản copy của catalog (caller được phép sửa). `empty` là giá trị trả về khi chưa tải được lần nào."""
+        key = (server_address or "").strip()
+        with self._lock:
+            entry = self._entries.setdefault(key, _CatalogEntry())
+            age = time.monotonic() - entry.fetched_at
+            usable = entry.fetched_at > 0 and not entry.invalidated and not force_refresh
+            if usable and age < (self.ttl if entry.ok else self.error_ttl):
+                self._hits += 1
+                return copy.deepcopy(entry.choices if entry.ok else empty)
+            if usable and entry.ok and age < self.max_stale:
+                self._stale_hits += 1
+                self._start_refresh_locked(key, entry)
+                return copy.deepcopy(entry.choices)
+            self._misses += 1
+            self._start_refresh_locked(key, entry)
+        # Chờ lần tải đang chạy (do mình hoặc request khác khởi động) rồi đọc kết quả
+        entry.done.wait(timeout=30)
+        with self._lock:
+            return copy.deepcopy(entry.choices if entry.ok else empty)
+
+    def invalidate(self, server_address: Optional[str] = None) -> None:
+        """
+        Đánh dấu catalog của một server (None = mọi server) là hết hạn và tải lại ngay ở background,
+        để lần mở modal kế tiếp thường đã có dữ liệu mới mà không phải chờ.
+        """
+        with self._lock:
+            if server_address is None:
+                targets = list(self._entries.items())
+            else:
+                key = server_address.strip()
+                targets = [(key, self._entries[key])] if key in self._entries else []
+            for key, entry in targets:
+                entry.invalidated = True
+                entry.generation += 1
+                self._invalidations += 1
+                self._start_refresh_locked(key, entry)
+
+    def _start_refresh_locked(self, key: str, entry: _CatalogEntry) -> None:
+        if entry.refreshing:
+            return
+        entry.refreshing = True
+        entry.done.clear()
+        threading.Thread(
+            target=self._refresh, args=(key, entry, entry.generation), name="ComfyCatalogRefresh", daemon=True
+        ).start()
+
+    def _refresh(self, key: str, entry: _CatalogEntry, generation: int) -> None:
+        try:
+            choices = self._fetch(key)
+        except Exception as e:
+            print(f"[ComfyCatalog] Refresh failed for {key}: {e}")
+            choices = None
+        with self._lock:
+            self._fetches += 1
+            entry.refreshing = False
+            now = time.monotonic()
+            if choices is not None:
+                entry.choices, entry.ok = choices, True
+                entry.fetched_at = now
+            else:
+                self._fetch_errors += 1
+                # Giữ bản cũ (nếu có) và chỉ thử lại sau error_ttl giây
+                entry.fetched_at = now - max(0.0, self.ttl - self.error_ttl) if entry.ok else now
+            if entry.generation != generation:
+                # Bị invalidate trong lúc đang tải: kết quả có thể đã cũ, tải thêm lần nữa
+                self._start_refresh_locked(key, entry)
+                return
+            entry.invalidated = False
+            entry.done.set()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            now = time.monotonic()
+            servers = {
+                key: {
+                    "cached": entry.choices is not None,
+                    "ok": entry.ok,
+                    "age_s": round(now - entry.fetched_at, 1) if entry.fetched_at else None,
+                    "refreshing": entry.refreshing,
+                    "loras": len((entry.choices or {}).get("loras") or []),
+                    "checkpoints": len((entry.choices or {}).get("checkpoints") or []),
+                }
+                for key, entry in self._entries.items()
+            }
+            return {
+                "ttl": self.ttl,
+                "max_stale": self.max_stale,
+                "hits": self._hits,
+                "stale_hits": self._stale_hits,
+                "misses": self._misses,
+                "fetches": self._fetches,
+                "fetch_errors": self._fetch_errors,
+                "invalidations": self._invalidations,
+                "servers": servers,
+            }
@@ -0,0 +1,350 @@
+# --- NEW FILE: integrations/comfy_event_hub.py ---
+import json
+import queue
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import websocket
+
+from integrations import comfy_api_client
+
+# Sự kiện gắn với một prompt cụ thể mà hub chuyển tiếp cho subscriber
+PROMPT_EVENT_TYPES = {
+    "execution_start", "execution_cached", "executing", "progress", "executed",
+    "execution_success", "execution_error", "execution_interrupted",
+}
+# Sự kiện do hub tự sinh ra (không đến từ ComfyUI)
+HUB_EVENT_QUEUE_POSITION = "queue_position"
+HUB_EVENT_RECONNECTED = "hub_reconnected"
+HUB_EVENT_DISCONNECTED = "hub_disconnected"
+
+
+class PromptSubscription:
+    """Hàng đợi sự kiện của một prompt; `get()` trả về dict {"type", "data"} hoặc None khi hết timeout."""
+
+    def __init__(self, hub: "ComfyEventHub", server_address: str, prompt_id: str):
+        self.hub = hub
+        self.server_address = server_address
+        self.prompt_id = prompt_id
+        self.started = False
+        self._events: "queue.Queue[Dict[str, Any]]" = queue.Queue()
+
+    def push(self, event: Dict[str, Any]) -> None:
+        if event.get("type") in ("execution_start", "executing", "progress"):
+            self.started = True
+        self._events.put(event)
+
+    def get(self, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        try:
+            return self._events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self) -> None:
+        self.hub.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+class _ServerConnection:
+    """Một websocket bền vững tới một ComfyUI server, tự kết nối lại với backoff."""
+
+    RECV_TIMEOUT = 1.0
+    QUEUE_REFRESH_MIN_INTERVAL = 0.5
+    ORPHAN_PROMPTS = 64
+    ORPHAN_EVENTS_PER_PROMPT = 256
+
+    def __init__(self, hub: "ComfyEventHub", server_address: str):
+        self.hub = hub
+        self.server_address = server_address
+        self.lock = threading.Lock()
+        self.subscriptions: Dict[str, List[PromptSubscription]] = {}
+        # Sự kiện của prompt chưa có ai subscribe (vừa queue xong, chưa kịp subscribe)
+        self.orphans: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+        self.connected = threading.Event()
+        self.stop_event = threading.Event()
+        self.hub_closed = False
+        self.current_prompt: Optional[str] = None
+        self.queue_remaining: Optional[int] = None
+        self.queue_dirty = False
+        self.last_queue_refresh = 0.0
+        self.last_active = time.monotonic()
+        self.reconnects = 0
+        self.messages = 0
+        self.last_error: Optional[str] = None
+        self.thread = threading.Thread(
+            target=self._run, name=f"ComfyEventHub-{server_address}", daemon=True
+        )
+
+    # ------------------------------------------------------------------ #
+    # Subscription bookkeeping
+    # ------------------------------------------------------------------ #
+
+    def add(self, subscription: PromptSubscription) -> None:
+        with self.lock:
+            self.subscriptions.setdefault(subscription.prompt_id, []).append(subscription)
+            backlog = self.orphans.pop(subscription.prompt_id, [])
+            self.queue_dirty = True
+            self.last_active = time.monotonic()
+        for event in backlog:
+            subscription.push(event)
+
+    def remove(self, subscription: PromptSubscription) -> None:
+        with self.lock:
+            subs = self.subscriptions.get(subscription.prompt_id)
+            if subs and subscription in subs:
+                subs.remove(subscription)
+                if not subs:
+                    self.subscriptions.pop(subscription.prompt_id, None)
+            self.last_active = time.monotonic()
+
+    def _all_subscriptions(self) -> List[PromptSubscription]:
+        with self.lock:
+            return [sub for subs in self.subscriptions.values() for sub in subs]
+
+    def _dispatch(self, prompt_id: str, event: Dict[str, Any]) -> None:
+        with self.lock:
+            targets = list(self.subscriptions.get(prompt_id, ()))
+            if not targets:
+                backlog = self.orphans.get(prompt_id)
+                if backlog is None:
+                    backlog = self.orphans[prompt_id] = []
+                    while len(self.orphans) > self.ORPHAN_PROMPTS:
+                        self.orphans.popitem(last=False)
+                if len(backlog) < self.ORPHAN_EVENTS_PER_PROMPT:
+                    backlog.append(event)
+                return
+        for sub in targets:
+            sub.push(event)
+
+    def _broadcast(self, event: Dict[str, Any]) -> None:
+        for sub in self._all_subscriptions():
+            sub.push(event)
+
+    # ------------------------------------------------------------------ #
+    # Message handling
+    # ------------------------------------------------------------------ #
+
+    def _handle_message(self, raw: str) -> None:
+        try:
+            message = json.loads(raw)
+        except (TypeError, ValueError):
+            return
+        if not isinstance(message, dict):
+            return
+        self.messages += 1
+        msg_type = message.get("type")
+        data = message.get("data") or {}
+        if not isinstance(data, dict):
+            data = {}
+
+        if msg_type == "status":
+            exec_info = (data.get("status") or {}).get("exec_info") or {}
+            remaining = exec_info.get("queue_remaining")
+            if isinstance(remaining, int) and remaining != self.queue_remaining:
+                self.queue_remaining = remaining
+                self.queue_dirty = True
+            return
+        if msg_type not in PROMPT_EVENT_TYPES:
+            return
+
+        prompt_id = data.get("prompt_id")
+        if msg_type == "execution_start" and prompt_id:
+            self.current_prompt = prompt_id
+            self.queue_dirty = True
+        elif not prompt_id:
+            # ComfyUI bản cũ không gửi prompt_id trong 'progress' -> gán cho prompt đang chạy
+            prompt_id = self.current_prompt
+        if not prompt_id:
+            return
+        if msg_type in ("execution_success", "execution_error", "execution_interrupted") or (
+            msg_type == "executing" and data.get("node") is None
+        ):
+            if self.current_prompt == prompt_id:
+                self.current_prompt = None
+        self._dispatch(prompt_id, {"type": msg_type, "data": data})
+
+    def _refresh_queue_positions(self) -> None:
+        """Một lần GET /queue cho mọi subscriber đang chờ (thay cho mỗi task tự poll mỗi giây)."""
+        waiting = [sub for sub in self._all_subscriptions() if not sub.started]
+        self.queue_dirty = False
+        if not waiting:
+            return
+        self.last_queue_refresh = time.monotonic()
+        details = comfy_api_client.get_queue_details_sync(self.server_address) or {}
+        running = [entry[1] for entry in details.get("queue_running", []) if len(entry) > 1]
+        pending_entries = [entry for entry in details.get("queue_pending", []) if len(entry) > 1]
+        # /queue trả về pending theo thứ tự heap, sắp lại theo số thứ tự của ComfyUI
+        pending = [entry[1] for entry in sorted(pending_entries, key=lambda entry: entry[0])]
+        positions = {pid: idx for idx, pid in enumerate(pending)}
+        for sub in waiting:
+            if sub.prompt_id in running:
+                data = {"position": 0, "running": True}
+            elif sub.prompt_id in positions:
+                data = {"position": len(running) + positions[sub.prompt_id], "running": False}
+            else:
+                # Không còn trong hàng đợi: đã xong (hoặc lỗi) trước khi kịp nhận sự kiện
+                data = {"position": None, "running": False}
+            sub.push({"type": HUB_EVENT_QUEUE_POSITION, "data": data})
+
+    # ------------------------------------------------------------------ #
+    # Connection loop
+    # ------------------------------------------------------------------ #
+
+    def _run(self) -> None:
+        backoff = self.hub.reconnect_min
+        had_connection = False
+        while not self.stop_event.is_set():
+            ws = None
+            try:
+                ws = websocket.WebSocket()
+                ws.connect(f"ws://{self.server_address}/ws?clientId={self.hub.client_id}", timeout=10)
+                ws.settimeout(self.RECV_TIMEOUT)
+                self.connected.set()
+                self.last_error = None
+                backoff = self.hub.reconnect_min
+                if had_connection:
+                    self.reconnects += 1
+                    print(f"[ComfyEventHub] Reconnected to {self.server_address}.")
+                    # Có thể đã lỡ sự kiện trong lúc mất kết nối -> subscriber tự kiểm tra history
+                    self._broadcast({"type": HUB_EVENT_RECONNECTED, "data": {}})
+                had_connection = True
+                self.queue_dirty = True
+
+                while not self.stop_event.is_set():
+                    try:
+                        raw = ws.recv()
+                        if isinstance(raw, str):
+                            self._handle_message(raw)
+                    except websocket.WebSocketTimeoutException:
+                        pass
+                    if self.queue_dirty and time.monotonic() - self.last_queue_refresh >= self.QUEUE_REFRESH_MIN_INTERVAL:
+                        self._refresh_queue_positions()
+                    if self._is_idle():
+                        print(f"[ComfyEventHub] Closing idle connection to {self.server_address}.")
+                        self.stop_event.set()
+            except Exception as e:
+                self.last_error = str(e)
+            finally:
+                if self.connected.is_set():
+                    self.connected.clear()
+                    self._broadcast({"type": HUB_EVENT_DISCONNECTED, "data": {"error": self.last_error}})
+                if ws is not None:
+                    try:
+                        ws.close()
+                    except Exception:
+                        pass
+
+            if self.stop_event.is_set() or self._is_idle():
+                break
+            # Exponential backoff có jitter để nhiều server lỗi không reconnect cùng lúc
+            delay = min(self.hub.reconnect_max, backoff) * random.uniform(0.8, 1.2)
+            backoff = min(self.hub.reconnect_max, backoff * 2)
+            self.stop_event.wait(delay)
+        self.hub._connection_finished(self)
+
+    def _is_idle(self) -> bool:
+        with self.lock:
+            if self.subscriptions:
+                return False
+        return (time.monotonic() - self.last_active) > self.hub.idle_timeout
+
+
+class ComfyEventHub:
+    """
+    Yuuka: comfy event hub v1.0 - Một websocket dùng chung cho mỗi ComfyUI server.
+
+    Mọi prompt được queue với cùng `client_id` của hub (ComfyUI chỉ gửi sự kiện thực thi cho client đã
+    queue prompt), hub định tuyến sự kiện theo `prompt_id` tới các `PromptSubscription`, theo dõi
+    `status` để cập nhật vị trí hàng đợi và tự kết nối lại với backoff. Kết nối tự đóng khi không còn
+    subscriber trong `idle_timeout` giây.
+    """
+
+    def __init__(self, client_id: Optional[str] = None, reconnect_min: float = 1.0,
+                 reconnect_max: float = 30.0, idle_timeout: float = 600.0):
+        self.client_id = client_id or str(uuid.uuid4())
+        self.reconnect_min = reconnect_min
+        self.reconnect_max = reconnect_max
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        self._connections: Dict[str, _ServerConnection] = {}
+
+    def _get_connection(self, server_address: str) -> _ServerConnection:
+        with self._lock:
+            conn = self._connections.get(server_address)
+            if conn is None or conn.stop_event.is_set():
+                conn = _ServerConnection(self, server_address)
+                self._connections[server_address] = conn
+                conn.thread.start()
+            conn.last_active = time.monotonic()
+            return conn
+
+    def _connection_finished(self, conn: _ServerConnection) -> None:
+        with self._lock:
+            if self._connections.get(conn.server_address) is conn:
+                self._connections.pop(conn.server_address, None)
+        # Subscriber thêm vào đúng lúc kết nối đóng -> mở lại kết nối mới cho họ
+        leftovers = conn._all_subscriptions()
+        if leftovers and not conn.hub_closed:
+            new_conn = self._get_connection(conn.server_address)
+            for sub in leftovers:
+                new_conn.add(sub)
+
+    def ensure_connected(self, server_address: str, timeout: float = 5.0) -> bool:
+        """Mở (nếu cần) và chờ websocket tới server; nên gọi trước khi queue prompt để không lỡ sự kiện."""
+        return self._get_connection(server_address).connected.wait(timeout)
+
+    def is_connected(self, server_address: str) -> bool:
+        conn = self._connections.get(server_address)
+        return bool(conn and conn.connected.is_set())
+
+    def subscribe(self, server_address: str, prompt_id: str) -> PromptSubscription:
+        subscription = PromptSubscription(self, server_address, prompt_id)
+        self._get_connection(server_address).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: PromptSubscription) -> None:
+        conn = self._connections.get(subscription.server_address)
+        if conn is not None:
+            conn.remove(subscription)
+
+    def get_queue_remaining(self, server_address: str) -> Optional[int]:
+        conn = self._connections.get(server_address)
+        return conn.queue_remaining if conn else None
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            connections = list(self._connections.values())
+        servers = {}
+        for conn in connections:
+            with conn.lock:
+                subscribers = sum(len(subs) for subs in conn.subscriptions.values())
+            servers[conn.server_address] = {
+                "connected": conn.connected.is_set(),
+                "subscribers": subscribers,
+                "queue_remaining": conn.queue_remaining,
+                "current_prompt": conn.current_prompt,
+                "reconnects": conn.reconnects,
+                "messages": conn.messages,
+                "last_error": conn.last_error,
+            }
+        return {"client_id": self.client_id, "servers": servers}
+
+    def shutdown(self, timeout: float = 2.0) -> None:
+        with self._lock:
+            connections = list(self._connections.values())
+            self._connections.clear()
+        for conn in connections:
+            conn.hub_closed = True
+            conn.stop_event.set()
+        for conn in connections:
+            conn.thread.join(timeout=timeout)
@@ -2,8 +2,11 @@
 import os
 import json
 import uuid
+import hashlib
+import threading
+from collections import OrderedDict
 from copy import deepcopy
-from typing import Any, Dict, Tuple, List
+from typing import Any, Dict, Tuple, List, Optional
 
 # Yuuka: Định nghĩa các hằng số và đường dẫn trực tiếp trong file.
 # Đường dẫn được xây dựng tương đối với vị trí của file này.
@@ -54,6 +57,14 @@ HIRESFIX_ESRGAN_INPUT_IMAGE_LORA_WORKFLOW_NAME = os.path.basename(HIRESFIX_ESRGA
 
 COMBINED_TEXT_PROMPT_KEY = "combined_text_prompt"
 
+# Yuuka: stable node ids v1.0 - ID cố định cho các node builder tự chèn thêm vào template.
+# ComfyUI chỉ bỏ qua (execution_cached) node có cùng id và cùng input với prompt trước, nên id không
+# được phụ thuộc vào kích thước graph (max_id + 1 đổi theo số LoRA / có RMBG hay không).
+# Các dải này nằm ngoài id của mọi template trong workflows/.
+LORA_CHAIN_NODE_ID_BASE = 1000   # LoRA thứ i trong chuỗi -> "1000 + i"
+RMBG_NODE_ID = "2000"
+FALLBACK_OUTPUT_NODE_ID = "2001"
+
 DEFAULT_CONFIG = {
     "server_address": "127.0.0.1:8888",
     "ckpt_name": "waiNSFWIllustrious_v140.safetensors",
@@ -152,17 +163,277 @@ def build_full_prompt_from_cfg(cfg_data: Dict[str, Any]) -> str:
     return full_prompt
 
 
+# ===========================
+# Yuuka: workflow classifier v1.0 - Suy ra loại workflow / nhãn từ config ở một chỗ duy nhất.
+# WorkflowBuilder tính một lần mỗi lần build và gắn vào cfg["_workflow_info"]; GenerationService
+# (nhãn console) và ImageService (workflow_type trong metadata) đọc lại thay vì tự phân tích LoRA.
+# ===========================
+WORKFLOW_INFO_KEY = "_workflow_info"
+
+
+def _lora_entry_name(item: Any) -> str:
+    if isinstance(item, dict):
+        item = item.get('name') or item.get('lora_name')
+    if not isinstance(item, str):
+        return ""
+    name = item.strip()
+    return "" if name.lower() == "none" else name
+
+
+def count_loras(cfg_data: Dict[str, Any]) -> int:
+    """Số LoRA được yêu cầu: lora_chain, nếu không có thì lora_names (list hoặc CSV), rồi lora_name."""
+    if not isinstance(cfg_data, dict):
+        return 0
+    chain = cfg_data.get('lora_chain')
+    if isinstance(chain, list):
+        count = sum(1 for item in chain if _lora_entry_name(item))
+        if count:
+            return count
+    names = cfg_data.get('lora_names')
+    if isinstance(names, str):
+        names = names.split(',')
+    if isinstance(names, list):
+        count = sum(1 for item in names if _lora_entry_name(item))
+        if count:
+            return count
+    return 1 if _lora_entry_name(cfg_data.get('lora_name')) else 0
+
+
+def _truthy(value: Any) -> bool:
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    if isinstance(value, (int, float)):
+        return value != 0
+    return False
+
+
+def classify_workflow(cfg_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Trả về {"workflow_type", "workflow_template", "hires", "lora_count", "label"}.
+    workflow_type: giá trị có sẵn trong config, nếu không thì suy từ template đã dùng
+    (standard / sdxl_lora / hires / hires_lora / hires_input_image / hires_input_image_lora).
+    """
+    cfg_data = cfg_data if isinstance(cfg_data, dict) else {}
+    template = cfg_data.get("_workflow_template")
+    template = str(template).strip() if template is not None else ""
+    template_lower = template.lower()
+    lora_count = count_loras(cfg_data)
+    has_lora = lora_count > 0
+    hires = (
+        cfg_data.get("_workflow_type") == "hires_input_image"
+        or _truthy(cfg_data.get("hires_enabled"))
+        or "hiresfix" in template_lower
+    )
+
+    explicit = cfg_data.get("workflow_type")
+    workflow_type = explicit.strip().lower() if isinstance(explicit, str) else ""
+    if not workflow_type:
+        if template_lower:
+            if "hiresfix" in template_lower and "input_image" in template_lower:
+                workflow_type = "hires_input_image_lora" if ("lora" in template_lower or has_lora) else "hires_input_image"
+            elif "hiresfix" in template_lower:
+                workflow_type = "hires_lora" if ("lora" in template_lower or has_lora) else "hires"
+            elif "lora" in template_lower:
+                workflow_type = "sdxl_lora"
+            else:
+                workflow_type = "standard"
+        elif hires:
+            workflow_type = "hires_lora" if has_lora else "hires"
+        elif has_lora:
+            workflow_type = "sdxl_lora"
+        else:
+            workflow_type = "standard"
+
+    base = (
+        cfg_data.get('workflow_template') or cfg_data.get('workflow_type')
+        or template or cfg_data.get('_workflow_type') or 'workflow'
+    )
+    base = str(base)
+    if base.endswith('.json'):
+        base = base[:-5]
+    if lora_count > 1:
+        label = f"{base} + {lora_count} LoRA"
+    elif lora_count == 1:
+        label = f"{base} + LoRA"
+    else:
+        label = base
+
+    return {
+        "workflow_type": workflow_type,
+        "workflow_template": template or None,
+        "hires": hires,
+        "lora_count": lora_count,
+        "label": label,
+    }
+
+
+def format_workflow_label(cfg_data: Dict[str, Any]) -> str:
+    """Nhãn ngắn cho log, ví dụ "standard", "standard + LoRA", "hiresfix_esrgan_input_image + 3 LoRA"."""
+    return classify_workflow(cfg_data)["label"]
+
+
+# ===========================
+# Yuuka: compiled templates v1.0 - Template được "biên dịch" một lần lúc nạp thành slot map
+# (node_id, input_name) -> tên giá trị. Slot "seed" được build memo gán lại cho từng request. Mỗi lần build chỉ copy nông các node rồi gán slot,
+# không deepcopy cả graph và không phải dò lại cấu trúc template.
+# ===========================
+_SAMPLER_SLOTS = ("seed", "steps", "cfg", "sampler_name", "scheduler")
+
+TEMPLATE_SLOT_MAPS: Dict[str, Dict[Tuple[str, str], str]] = {
+    "standard": {
+        **{("3", name): name for name in _SAMPLER_SLOTS},
+        ("6", "text"): "positive",
+        ("7", "text"): "negative",
+        ("11", "ckpt_name"): "ckpt_name",
+        ("12", "width"): "width",
+        ("12", "height"): "height",
+        ("12", "batch_size"): "batch_size",
+    },
+    "sdxl_lora": {
+        **{("3", name): name for name in _SAMPLER_SLOTS},
+        ("4", "ckpt_name"): "ckpt_name",
+        ("5", "width"): "width",
+        ("5", "height"): "height",
+        ("5", "batch_size"): "batch_size",
+        ("6", "text"): "positive",
+        ("7", "text"): "negative",
+    },
+    "hiresfix_esrgan": {
+        **{("3", name): name for name in _SAMPLER_SLOTS},
+        ("3", "denoise"): "denoise",
+        ("11", "seed"): "seed",
+        **{("11", name): f"stage2_{name}" for name in _SAMPLER_SLOTS[1:] + ("denoise",)},
+        ("5", "width"): "base_width",
+        ("5", "height"): "base_height",
+        ("5", "batch_size"): "batch_size",
+        ("6", "text"): "positive",
+        ("7", "text"): "negative",
+        ("23", "model_name"): "upscale_model",
+        ("24", "upscale_method"): "upscale_method",
+        ("24", "width"): "width",
+        ("24", "height"): "height",
+        ("25", "ckpt_name"): "ckpt_name",
+    },
+    "hiresfix_esrgan_input_image": {
+        ("11", "seed"): "seed",
+        **{("11", name): f"stage2_{name}" for name in _SAMPLER_SLOTS[1:] + ("denoise",)},
+        ("6", "text"): "positive",
+        ("7", "text"): "negative",
+        ("23", "model_name"): "upscale_model",
+        ("25", "ckpt_name"): "ckpt_name",
+        ("28", "image"): "input_image",
+        ("30", "upscale_method"): "upscale_method",
+        ("30", "width"): "width",
+        ("30", "height"): "height",
+    },
+}
+TEMPLATE_SLOT_MAPS["hiresfix_esrgan_lora"] = TEMPLATE_SLOT_MAPS["hiresfix_esrgan"]
+TEMPLATE_SLOT_MAPS["hiresfix_esrgan_input_image_lora"] = TEMPLATE_SLOT_MAPS["hiresfix_esrgan_input_image"]
+
+# Workflow tiêu chuẩn không có file JSON: graph cố định, các giá trị do slot gán lúc build
+STANDARD_WORKFLOW_TEMPLATE: Dict[str, Any] = {
+    "3": {
+        "inputs": {
+            "seed": 0, "steps": 0, "cfg": 0, "sampler_name": "", "scheduler": "", "denoise": 1,
+            "model": ["11", 0], "positive": ["6", 0], "negative": ["7", 0], "latent_image": ["12", 0],
+        },
+        "class_type": "KSampler",
+    },
+    "6": {"inputs": {"text": "", "clip": ["11", 1]}, "class_type": "CLIPTextEncode"},
+    "7": {"inputs": {"text": "", "clip": ["11", 1]}, "class_type": "CLIPTextEncode"},
+    "8": {"inputs": {"samples": ["3", 0], "vae": ["11", 2]}, "class_type": "VAEDecode"},
+    "11": {"inputs": {"ckpt_name": ""}, "class_type": "CheckpointLoaderSimple"},
+    "12": {"inputs": {"width": 0, "height": 0, "batch_size": 1}, "class_type": "EmptyLatentImage"},
+    "15": {"inputs": {"images": ["8", 0]}, "class_type": "ImageToBase64_Yuuka"},
+}
+
+
+def _copy_node(node: Any) -> Any:
+    """Copy đủ sâu để sửa inputs / nối lại dây mà không chạm vào template gốc."""
+    if not isinstance(node, dict):
+        return deepcopy(node)
+    copied = dict(node)
+    inputs = node.get("inputs")
+    if isinstance(inputs, dict):
+        copied["inputs"] = {k: (list(v) if isinstance(v, list) else v) for k, v in inputs.items()}
+    return copied
+
+
+class CompiledTemplate:
+    """Template chỉ đọc + slot map đã kiểm tra. `instantiate(values)` tạo workflow mới cho một request."""
+
+    __slots__ = ("name", "label", "nodes", "slots", "seed_slots")
+
+    def __init__(self, name: str, label: str, nodes: Dict[str, Any], slot_map: Dict[Tuple[str, str], str]):
+        self.name = name
+        self.label = label
+        self.nodes = nodes
+        self.slots: List[Tuple[str, str, str]] = []
+        for (node_id, input_name), value_key in slot_map.items():
+            if not isinstance(nodes.get(node_id), dict):
+                print(f"⚠️ [WorkflowBuilder] Template '{name}' has no node {node_id}; slot '{input_name}' ignored.")
+                continue
+            self.slots.append((node_id, input_name, value_key))
+        self.seed_slots = [(node_id, input_name) for node_id, input_name, key in self.slots if key == "seed"]
+
+    def instantiate(self, values: Dict[str, Any]) -> Dict[str, Any]:
+        workflow = {node_id: _copy_node(node) for node_id, node in self.nodes.items()}
+        for node_id, input_name, value_key in self.slots:
+            if value_key in values:
+                workflow[node_id].setdefault("inputs", {})[input_name] = values[value_key]
+        return workflow
+
+
 class WorkflowBuilderService:
     """
     Dịch vụ chuyên xây dựng các workflow API JSON để gửi cho ComfyUI.
     """
+    # Yuuka: build memo v1.0 - Số workflow đã build giữ lại theo fingerprint của config (LRU)
+    BUILD_MEMO_SIZE = 128
+    # Các khoá không ảnh hưởng tới graph (seed được gán lại qua seed slot khi lấy từ memo)
+    _MEMO_IGNORED_KEYS = ("seed", "server_address", "_workflow_template", WORKFLOW_INFO_KEY)
+
     def __init__(self):
         self.workflow_templates: Dict[str, Any] = {}
+        self.compiled_templates: Dict[str, CompiledTemplate] = {}
         self.rmbg_node_template: Dict[str, Any] = {}
+        self._build_memo: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._memo_lock = threading.Lock()
+        self._memo_hits = 0
+        self._memo_misses = 0
         self._load_all_templates()
+        self._compile_templates()
         self._load_rmbg_node_template()
+        self.templates_version = self._compute_templates_version()
         print("✅ WorkflowBuilderService Initialized and templates loaded.")
 
+    def _compute_templates_version(self) -> str:
+        """Yuuka: result cache v1.0 - Hash nội dung các template; đổi file workflow là đổi version."""
+        payload = json.dumps(
+            {"templates": self.workflow_templates, "standard": STANDARD_WORKFLOW_TEMPLATE, "rmbg": self.rmbg_node_template},
+            sort_keys=True, default=str,
+        )
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:12]
+
+    def _compile_templates(self):
+        """Biên dịch các template có slot map (xem TEMPLATE_SLOT_MAPS); template thiếu file thì bỏ qua."""
+        labels = {
+            "standard": "standard",
+            "sdxl_lora": SDXL_LORA_WORKFLOW_NAME,
+            "hiresfix_esrgan": HIRESFIX_ESRGAN_WORKFLOW_NAME,
+            "hiresfix_esrgan_lora": HIRESFIX_ESRGAN_LORA_WORKFLOW_NAME,
+            "hiresfix_esrgan_input_image": HIRESFIX_ESRGAN_INPUT_IMAGE_WORKFLOW_NAME,
+            "hiresfix_esrgan_input_image_lora": HIRESFIX_ESRGAN_INPUT_IMAGE_LORA_WORKFLOW_NAME,
+        }
+        sources = dict(self.workflow_templates, standard=STANDARD_WORKFLOW_TEMPLATE)
+        self.compiled_templates = {}
+        for name, slot_map in TEMPLATE_SLOT_MAPS.items():
+            nodes = sources.get(name)
+            if isinstance(nodes, dict) and nodes:
+                self.compiled_templates[name] = CompiledTemplate(name, labels[name], nodes, slot_map)
+
     def _load_all_templates(self):
         """Tải các file workflow JSON từ thư mục workflows."""
         workflow_paths = {
@@ -268,14 +539,8 @@ class WorkflowBuilderService:
         except Exception:
             pass
 
-        # Allocate new node id
-        max_id = 0
-        for k in workflow.keys():
-            try:
-                max_id = max(max_id, int(k))
-            except Exception:
-                continue
-        rmbg_id = str(max_id + 1)
+        # ID cố định để các prompt liên tiếp có cùng graph (xem RMBG_NODE_ID)
+        rmbg_id = RMBG_NODE_ID
 
         # Build RMBG node
         node = deepcopy(self.rmbg_node_template) if isinstance(self.rmbg_node_template, dict) and self.rmbg_node_template else {
@@ -407,15 +672,9 @@ class WorkflowBuilderService:
         except Exception:
             existing_loras.sort()
 
-        # ID mới tăng dần
-        def _next_id(start_from: int = None) -> str:
-            max_id = 0
-            for nid in workflow.keys():
-                try:
-                    max_id = max(max_id, int(nid))
-                except Exception:
-                    continue
-            return str(max_id + 1)
+        # ID theo vị trí trong chuỗi (không theo max_id) để cùng chuỗi LoRA luôn ra cùng graph
+        def _chain_node_id(position: int) -> str:
+            return str(LORA_CHAIN_NODE_ID_BASE + position)
 
         last_source_id = None
         # Nếu có sẵn LoraLoader, dùng node đầu làm LoRA[0]
@@ -438,7 +697,7 @@ class WorkflowBuilderService:
                     pass
         else:
             # Tạo node LoRA đầu tiên
-            first_lora_id = _next_id()
+            first_lora_id = _chain_node_id(0)
             workflow[first_lora_id] = {
                 "inputs": {
                     "lora_name": loras[0]['lora_name'],
@@ -452,8 +711,8 @@ class WorkflowBuilderService:
             last_source_id = first_lora_id
 
         # Tạo các node LoRA tiếp theo, nối dây từ node trước đó
-        for spec in loras[1:]:
-            new_id = _next_id()
+        for position, spec in enumerate(loras[1:], start=1):
+            new_id = _chain_node_id(position)
             workflow[new_id] = {
                 "inputs": {
                     "lora_name": spec['lora_name'],
@@ -482,10 +741,133 @@ class WorkflowBuilderService:
 
         return workflow, last_id
 
+    # Yuuka: save-node output v1.0 - Các node lưu ảnh chuẩn của ComfyUI dùng thay ImageToBase64_Yuuka
+    SAVE_NODE_CLASSES = ("PreviewImage", "SaveImage")
+
+    def convert_output_to_save_node(self, workflow: Dict[str, Any], output_node_id: str,
+                                    save_node_class: str = "PreviewImage") -> bool:
+        """
+        Đổi node output base64 thành node lưu ảnh chuẩn (giữ nguyên node id) để lấy ảnh qua /view
+        thay vì nhúng base64 trong history. PreviewImage ghi vào thư mục temp của ComfyUI,
+        SaveImage ghi vào output. Trả về False nếu output không phải ImageToBase64_Yuuka (vd video).
+        """
+        node = workflow.get(str(output_node_id)) if isinstance(workflow, dict) else None
+        if not isinstance(node, dict) or node.get("class_type") != "ImageToBase64_Yuuka":
+            return False
+        images = (node.get("inputs") or {}).get("images")
+        if not images:
+            return False
+        if save_node_class not in self.SAVE_NODE_CLASSES:
+            save_node_class = "PreviewImage"
+        inputs: Dict[str, Any] = {"images": images}
+        if save_node_class == "SaveImage":
+            inputs["filename_prefix"] = "Yuuka/gen"
+        workflow[str(output_node_id)] = {"inputs": inputs, "class_type": save_node_class}
+        return True
+
+    def model_signature(self, cfg_data: Dict[str, Any]) -> str:
+        """
+        Yuuka: sticky scheduling v1.0 - Checkpoint + chuỗi LoRA của một config. Các prompt cùng chữ ký
+        chạy liền nhau thì ComfyUI dùng lại model / LoRA / CLIP đã nạp (execution_cached).
+        """
+        if not isinstance(cfg_data, dict):
+            return ""
+        if cfg_data.get('_workflow_type') == 'dasiwa_wan2_i2v':
+            return 'dasiwa_wan2_i2v'
+        parts = [str(cfg_data.get("ckpt_name", DEFAULT_CONFIG["ckpt_name"]))]
+        parts.extend(
+            f"{spec['lora_name']}:{spec['strength_model']}:{spec['strength_clip']}"
+            for spec in self._parse_lora_chain(cfg_data)
+        )
+        return "|".join(parts)
+
+    @staticmethod
+    def _latent_batch_size(cfg_data: Dict[str, Any], fallback: Any = 1) -> int:
+        """Yuuka: batch generation v1.0 - `_batch_size` do GenerationService.start_batch đặt khi gộp seed."""
+        value = cfg_data.get("_batch_size") if isinstance(cfg_data, dict) else None
+        if value is None:
+            value = fallback
+        try:
+            return max(1, int(value))
+        except (TypeError, ValueError):
+            return 1
+
     def build_workflow(self, cfg_data: Dict[str, Any], seed: int) -> Tuple[Dict[str, Any], str]:
         """
         Hàm điều phối chính. Nó sẽ quyết định dùng builder nào dựa trên cfg_data.
+
+        Yuuka: build memo v1.0 - Config giống hệt nhau (trừ seed) dùng lại graph đã build: chỉ copy
+        nông các node và gán seed vào seed slot của template. Kết quả phân loại workflow được gắn vào
+        cfg_data["_workflow_info"] (xem classify_workflow).
         """
+        fingerprint = self._config_fingerprint(cfg_data)
+        entry = None
+        if fingerprint is not None:
+            with self._memo_lock:
+                entry = self._build_memo.get(fingerprint)
+                if entry is not None:
+                    self._build_memo.move_to_end(fingerprint)
+                    self._memo_hits += 1
+                else:
+                    self._memo_misses += 1
+        if entry is not None:
+            workflow = {node_id: _copy_node(node) for node_id, node in entry["workflow"].items()}
+            for node_id, input_name in entry["seed_slots"]:
+                workflow[node_id]["inputs"][input_name] = seed
+            cfg_data["_workflow_template"] = entry["template"]
+            cfg_data[WORKFLOW_INFO_KEY] = dict(entry["info"])
+            return workflow, entry["output_node_id"]
+
+        workflow, output_node_id = self._build_workflow_uncached(cfg_data, seed)
+        if isinstance(cfg_data, dict):
+            cfg_data[WORKFLOW_INFO_KEY] = classify_workflow(cfg_data)
+            compiled = self._compiled_by_label(cfg_data.get("_workflow_template"))
+            # Chỉ memo workflow dựng từ template đã biên dịch (biết chắc seed nằm ở đâu); video thì không
+            if fingerprint is not None and compiled is not None and isinstance(workflow, dict):
+                entry = {
+                    "workflow": {node_id: _copy_node(node) for node_id, node in workflow.items()},
+                    "output_node_id": output_node_id,
+                    "seed_slots": [slot for slot in compiled.seed_slots if slot[0] in workflow],
+                    "template": cfg_data.get("_workflow_template"),
+                    "info": dict(cfg_data[WORKFLOW_INFO_KEY]),
+                }
+                with self._memo_lock:
+                    self._build_memo[fingerprint] = entry
+                    while len(self._build_memo) > self.BUILD_MEMO_SIZE:
+                        self._build_memo.popitem(last=False)
+        return workflow, output_node_id
+
+    def _config_fingerprint(self, cfg_data: Dict[str, Any]) -> Optional[str]:
+        if not isinstance(cfg_data, dict):
+            return None
+        try:
+            payload = json.dumps(
+                {k: v for k, v in cfg_data.items() if k not in self._MEMO_IGNORED_KEYS},
+                sort_keys=True, default=str,
+            )
+        except (TypeError, ValueError):
+            return None
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+    def _compiled_by_label(self, label: Any) -> Optional[CompiledTemplate]:
+        for compiled in self.compiled_templates.values():
+            if compiled.label == label:
+                return compiled
+        return None
+
+    def get_build_stats(self) -> Dict[str, Any]:
+        with self._memo_lock:
+            lookups = self._memo_hits + self._memo_misses
+            return {
+                "compiled_templates": sorted(self.compiled_templates),
+                "memo_entries": len(self._build_memo),
+                "memo_size": self.BUILD_MEMO_SIZE,
+                "memo_hits": self._memo_hits,
+                "memo_misses": self._memo_misses,
+                "memo_hit_rate": round(self._memo_hits / lookups, 3) if lookups else 0.0,
+            }
+
+    def _build_workflow_uncached(self, cfg_data: Dict[str, Any], seed: int) -> Tuple[Dict[str, Any], str]:
         if isinstance(cfg_data, dict):
             cfg_data["_workflow_template"] = None
 
@@ -541,53 +923,21 @@ class WorkflowBuilderService:
 
         text_prompt = cfg_data.get(COMBINED_TEXT_PROMPT_KEY, build_full_prompt_from_cfg(cfg_data))
         negative_prompt = ", ".join(normalize_tag_list(str(cfg_data.get("negative", DEFAULT_CONFIG["negative"]))))
-        
-        workflow = {
-            "3": {
-                "inputs": {
-                    "seed": seed,
-                    "steps": cfg_data.get("steps", DEFAULT_CONFIG["steps"]),
-                    "cfg": cfg_data.get("cfg", DEFAULT_CONFIG["cfg"]),
-                    "sampler_name": cfg_data.get("sampler_name", DEFAULT_CONFIG["sampler_name"]),
-                    "scheduler": cfg_data.get("scheduler", DEFAULT_CONFIG["scheduler"]),
-                    "denoise": 1,
-                    "model": ["11", 0],
-                    "positive": ["6", 0],
-                    "negative": ["7", 0],
-                    "latent_image": ["12", 0]
-                },
-                "class_type": "KSampler"
-            },
-            "6": {
-                "inputs": {"text": text_prompt, "clip": ["11", 1]},
-                "class_type": "CLIPTextEncode"
-            },
-            "7": {
-                "inputs": {"text": negative_prompt, "clip": ["11", 1]},
-                "class_type": "CLIPTextEncode"
-            },
-            "8": {
-                "inputs": {"samples": ["3", 0], "vae": ["11", 2]},
-                "class_type": "VAEDecode"
-            },
-            "11": {
-                "inputs": {"ckpt_name": cfg_data.get("ckpt_name", DEFAULT_CONFIG["ckpt_name"])},
-                "class_type": "CheckpointLoaderSimple"
-            },
-            "12": {
-                "inputs": {
-                    "width": cfg_data.get("width", DEFAULT_CONFIG["width"]),
-                    "height": cfg_data.get("height", DEFAULT_CONFIG["height"]),
-                    "batch_size": 1
-                },
-                "class_type": "EmptyLatentImage"
-            },
-            "15": {
-                "inputs": {"images": ["8", 0]},
-                "class_type": "ImageToBase64_Yuuka"
-            }
-        }
-        
+
+        workflow = self.compiled_templates["standard"].instantiate({
+            "seed": seed,
+            "steps": cfg_data.get("steps", DEFAULT_CONFIG["steps"]),
+            "cfg": cfg_data.get("cfg", DEFAULT_CONFIG["cfg"]),
+            "sampler_name": cfg_data.get("sampler_name", DEFAULT_CONFIG["sampler_name"]),
+            "scheduler": cfg_data.get("scheduler", DEFAULT_CONFIG["scheduler"]),
+            "positive": text_prompt,
+            "negative": negative_prompt,
+            "ckpt_name": cfg_data.get("ckpt_name", DEFAULT_CONFIG["ckpt_name"]),
+            "width": cfg_data.get("width", DEFAULT_CONFIG["width"]),
+            "height": cfg_data.get("height", DEFAULT_CONFIG["height"]),
+            "batch_size": self._latent_batch_size(cfg_data),
+        })
+
         # Yuuka: Trả về workflow và ID của node output base64
         return workflow, "15"
 
@@ -602,11 +952,11 @@ class WorkflowBuilderService:
         use_lora = len(lora_specs) > 0
 
         template_key = "hiresfix_esrgan_input_image_lora" if use_lora else "hiresfix_esrgan_input_image"
-        template = self.workflow_templates.get(template_key)
+        template = self.compiled_templates.get(template_key)
 
         if not template and use_lora:
             print("[WorkflowBuilder] hiresfix_esrgan_input_image_lora template missing. Falling back to non-LoRA variant.")
-            template = self.workflow_templates.get("hiresfix_esrgan_input_image")
+            template = self.compiled_templates.get("hiresfix_esrgan_input_image")
             use_lora = False
 
         if not template:
@@ -616,8 +966,6 @@ class WorkflowBuilderService:
         if isinstance(cfg_data, dict):
             cfg_data["_workflow_template"] = HIRESFIX_ESRGAN_INPUT_IMAGE_LORA_WORKFLOW_NAME if use_lora else HIRESFIX_ESRGAN_INPUT_IMAGE_WORKFLOW_NAME
 
-        workflow = deepcopy(template)
-
         def _safe_int(value, fallback):
             try:
                 parsed = int(value)
@@ -631,47 +979,25 @@ class WorkflowBuilderService:
             except (TypeError, ValueError):
                 return fallback
 
-        text_prompt = cfg_data.get(COMBINED_TEXT_PROMPT_KEY, build_full_prompt_from_cfg(cfg_data))
-        negative_prompt = ", ".join(normalize_tag_list(str(cfg_data.get("negative", DEFAULT_CONFIG["negative"]))))
-
         base_width = _safe_int(cfg_data.get("hires_base_width") or cfg_data.get("_input_image_width"), DEFAULT_CONFIG["width"])
         base_height = _safe_int(cfg_data.get("hires_base_height") or cfg_data.get("_input_image_height"), DEFAULT_CONFIG["height"])
-        target_width = _safe_int(cfg_data.get("width"), base_width * 2)
-        target_height = _safe_int(cfg_data.get("height"), base_height * 2)
-
-        stage2_steps = _safe_int(cfg_data.get("hires_stage2_steps"), DEFAULT_CONFIG["hires_stage2_steps"])
-        stage2_cfg = _safe_float(cfg_data.get("hires_stage2_cfg"), DEFAULT_CONFIG["hires_stage2_cfg"])
-        stage2_sampler = cfg_data.get("hires_stage2_sampler_name", DEFAULT_CONFIG["hires_stage2_sampler_name"])
-        stage2_scheduler = cfg_data.get("hires_stage2_scheduler", DEFAULT_CONFIG["hires_stage2_scheduler"])
-        stage2_denoise = _safe_float(cfg_data.get("hires_stage2_denoise"), DEFAULT_CONFIG["hires_stage2_denoise"])
 
-        workflow.setdefault("6", {}).setdefault("inputs", {})["text"] = text_prompt
-        workflow.setdefault("7", {}).setdefault("inputs", {})["text"] = negative_prompt
-
-        workflow.setdefault("23", {}).setdefault("inputs", {})["model_name"] = cfg_data.get(
-            "hires_upscale_model", DEFAULT_CONFIG["hires_upscale_model"]
-        )
-
-        workflow.setdefault("30", {}).setdefault("inputs", {})
-        workflow["30"]["inputs"]["upscale_method"] = cfg_data.get(
-            "hires_upscale_method", DEFAULT_CONFIG["hires_upscale_method"]
-        )
-        workflow["30"]["inputs"]["width"] = target_width
-        workflow["30"]["inputs"]["height"] = target_height
-
-        workflow.setdefault("11", {}).setdefault("inputs", {})
-        workflow["11"]["inputs"]["seed"] = seed
-        workflow["11"]["inputs"]["steps"] = stage2_steps
-        workflow["11"]["inputs"]["cfg"] = stage2_cfg
-        workflow["11"]["inputs"]["sampler_name"] = stage2_sampler
-        workflow["11"]["inputs"]["scheduler"] = stage2_scheduler
-        workflow["11"]["inputs"]["denoise"] = stage2_denoise
-
-        workflow.setdefault("25", {}).setdefault("inputs", {})["ckpt_name"] = cfg_data.get(
-            "ckpt_name", DEFAULT_CONFIG["ckpt_name"]
-        )
-
-        workflow.setdefault("28", {}).setdefault("inputs", {})["image"] = uploaded_name
+        workflow = template.instantiate({
+            "positive": cfg_data.get(COMBINED_TEXT_PROMPT_KEY, build_full_prompt_from_cfg(cfg_data)),
+            "negative": ", ".join(normalize_tag_list(str(cfg_data.get("negative", DEFAULT_CONFIG["negative"])))),
+            "upscale_model": cfg_data.get("hires_upscale_model", DEFAULT_CONFIG["hires_upscale_model"]),
+            "upscale_method": cfg_data.get("hires_upscale_method", DEFAULT_CONFIG["hires_upscale_method"]),
+            "width": _safe_int(cfg_data.get("width"), base_width * 2),
+            "height": _safe_int(cfg_data.get("height"), base_height * 2),
+            "seed": seed,
+            "stage2_steps": _safe_int(cfg_data.get("hires_stage2_steps"), DEFAULT_CONFIG["hires_stage2_steps"]),
+            "stage2_cfg": _safe_float(cfg_data.get("hires_stage2_cfg"), DEFAULT_CONFIG["hires_stage2_cfg"]),
+            "stage2_sampler_name": cfg_data.get("hires_stage2_sampler_name", DEFAULT_CONFIG["hires_stage2_sampler_name"]),
+            "stage2_scheduler": cfg_data.get("hires_stage2_scheduler", DEFAULT_CONFIG["hires_stage2_scheduler"]),
+            "stage2_denoise": _safe_float(cfg_data.get("hires_stage2_denoise"), DEFAULT_CONFIG["hires_stage2_denoise"]),
+            "ckpt_name": cfg_data.get("ckpt_name", DEFAULT_CONFIG["ckpt_name"]),
+            "input_image": uploaded_name,
+        })
 
         if use_lora:
             workflow, last_lora_id = self._inject_lora_chain(workflow, lora_specs)
@@ -689,11 +1015,11 @@ class WorkflowBuilderService:
         use_lora = len(lora_specs) > 0
 
         template_key = "hiresfix_esrgan_lora" if use_lora else "hiresfix_esrgan"
-        template = self.workflow_templates.get(template_key)
+        template = self.compiled_templates.get(template_key)
 
         if not template and use_lora:
             print("[WorkflowBuilder] hiresfix_esrgan_lora template missing. Falling back to hiresfix_esrgan.")
-            template = self.workflow_templates.get("hiresfix_esrgan")
+            template = self.compiled_templates.get("hiresfix_esrgan")
             use_lora = False
 
         if not template:
@@ -703,7 +1029,6 @@ class WorkflowBuilderService:
         if isinstance(cfg_data, dict):
             cfg_data["_workflow_template"] = HIRESFIX_ESRGAN_LORA_WORKFLOW_NAME if use_lora else HIRESFIX_ESRGAN_WORKFLOW_NAME
 
-        workflow = deepcopy(template)
         text_prompt = cfg_data.get(COMBINED_TEXT_PROMPT_KEY, build_full_prompt_from_cfg(cfg_data))
         negative_prompt = ", ".join(normalize_tag_list(str(cfg_data.get("negative", DEFAULT_CONFIG["negative"]))))
 
@@ -741,36 +1066,31 @@ class WorkflowBuilderService:
         stage2_scheduler = cfg_data.get("hires_stage2_scheduler", DEFAULT_CONFIG["hires_stage2_scheduler"]) or DEFAULT_CONFIG["hires_stage2_scheduler"]
         stage2_denoise = _safe_float(cfg_data.get("hires_stage2_denoise"), DEFAULT_CONFIG["hires_stage2_denoise"])
 
-        workflow.setdefault("5", {}).setdefault("inputs", {})
-        workflow["5"]["inputs"]["width"] = base_width
-        workflow["5"]["inputs"]["height"] = base_height
-        workflow["5"]["inputs"]["batch_size"] = _safe_int(cfg_data.get("batch_size"), DEFAULT_CONFIG["batch_size"])
-
-        workflow.setdefault("3", {}).setdefault("inputs", {})
-        workflow["3"]["inputs"]["seed"] = seed
-        workflow["3"]["inputs"]["steps"] = stage1_steps
-        workflow["3"]["inputs"]["cfg"] = stage1_cfg
-        workflow["3"]["inputs"]["sampler_name"] = stage1_sampler
-        workflow["3"]["inputs"]["scheduler"] = stage1_scheduler
-        workflow["3"]["inputs"]["denoise"] = stage1_denoise
-
-        workflow.setdefault("6", {}).setdefault("inputs", {})["text"] = text_prompt
-        workflow.setdefault("7", {}).setdefault("inputs", {})["text"] = negative_prompt
-
-        workflow.setdefault("23", {}).setdefault("inputs", {})["model_name"] = cfg_data.get("hires_upscale_model", DEFAULT_CONFIG["hires_upscale_model"])
-        workflow.setdefault("24", {}).setdefault("inputs", {})["upscale_method"] = cfg_data.get("hires_upscale_method", DEFAULT_CONFIG["hires_upscale_method"])
-        workflow["24"]["inputs"]["width"] = final_width
-        workflow["24"]["inputs"]["height"] = final_height
-
-        workflow.setdefault("11", {}).setdefault("inputs", {})
-        workflow["11"]["inputs"]["seed"] = seed
-        workflow["11"]["inputs"]["steps"] = stage2_steps
-        workflow["11"]["inputs"]["cfg"] = stage2_cfg
-        workflow["11"]["inputs"]["sampler_name"] = stage2_sampler
-        workflow["11"]["inputs"]["scheduler"] = stage2_scheduler
-        workflow["11"]["inputs"]["denoise"] = stage2_denoise
-
-        workflow.setdefault("25", {}).setdefault("inputs", {})["ckpt_name"] = cfg_data.get("ckpt_name", DEFAULT_CONFIG["ckpt_name"])
+        workflow = template.instantiate({
+            "base_width": base_width,
+            "base_height": base_height,
+            "batch_size": self._latent_batch_size(
+                cfg_data, _safe_int(cfg_data.get("batch_size"), DEFAULT_CONFIG["batch_size"])
+            ),
+            "seed": seed,
+            "steps": stage1_steps,
+            "cfg": stage1_cfg,
+            "sampler_name": stage1_sampler,
+            "scheduler": stage1_scheduler,
+            "denoise": stage1_denoise,
+            "positive": text_prompt,
+            "negative": negative_prompt,
+            "upscale_model": cfg_data.get("hires_upscale_model", DEFAULT_CONFIG["hires_upscale_model"]),
+            "upscale_method": cfg_data.get("hires_upscale_method", DEFAULT_CONFIG["hires_upscale_method"]),
+            "width": final_width,
+            "height": final_height,
+            "stage2_steps": stage2_steps,
+            "stage2_cfg": stage2_cfg,
+            "stage2_sampler_name": stage2_sampler,
+            "stage2_scheduler": stage2_scheduler,
+            "stage2_denoise": stage2_denoise,
+            "ckpt_name": cfg_data.get("ckpt_name", DEFAULT_CONFIG["ckpt_name"]),
+        })
 
         if use_lora:
             workflow, last_lora_id = self._inject_lora_chain(workflow, lora_specs)
@@ -793,37 +1113,26 @@ class WorkflowBuilderService:
         if isinstance(cfg_data, dict):
             cfg_data["_workflow_template"] = SDXL_LORA_WORKFLOW_NAME
 
-        template = self.workflow_templates.get("sdxl_lora")
-        template = template or self.workflow_templates.get("sdxl") or self.workflow_templates.get("standard")
+        template = self.compiled_templates.get("sdxl_lora")
         if not template:
             # Không có template phù hợp => fallback standard
             print("⚠️ SDXL LoRA workflow template not found. Falling back to standard workflow.")
             return self._build_standard_workflow(cfg_data, seed)
 
-        workflow = deepcopy(template)
-
         # Prompt & sampler params
-        workflow.setdefault("4", {}).setdefault("inputs", {})["ckpt_name"] = cfg_data.get("ckpt_name", DEFAULT_CONFIG["ckpt_name"])
-        if "6" in workflow:
-            workflow["6"].setdefault("inputs", {})["text"] = cfg_data.get(COMBINED_TEXT_PROMPT_KEY, build_full_prompt_from_cfg(cfg_data))
-        if "7" in workflow:
-            workflow["7"].setdefault("inputs", {})["text"] = ", ".join(
-                normalize_tag_list(
-                    str(cfg_data.get("negative", DEFAULT_CONFIG["negative"]))
-                )
-            )
-
-        if "5" in workflow:
-            workflow["5"].setdefault("inputs", {})["width"] = cfg_data.get("width", DEFAULT_CONFIG["width"])
-            workflow["5"].setdefault("inputs", {})["height"] = cfg_data.get("height", DEFAULT_CONFIG["height"])
-            workflow["5"].setdefault("inputs", {})["batch_size"] = 1
-
-        if "3" in workflow:
-            workflow["3"].setdefault("inputs", {})["seed"] = seed
-            workflow["3"].setdefault("inputs", {})["steps"] = cfg_data.get("steps", DEFAULT_CONFIG["steps"])
-            workflow["3"].setdefault("inputs", {})["cfg"] = cfg_data.get("cfg", DEFAULT_CONFIG["cfg"])
-            workflow["3"].setdefault("inputs", {})["sampler_name"] = cfg_data.get("sampler_name", DEFAULT_CONFIG["sampler_name"])
-            workflow["3"].setdefault("inputs", {})["scheduler"] = cfg_data.get("scheduler", DEFAULT_CONFIG["scheduler"])
+        workflow = template.instantiate({
+            "ckpt_name": cfg_data.get("ckpt_name", DEFAULT_CONFIG["ckpt_name"]),
+            "positive": cfg_data.get(COMBINED_TEXT_PROMPT_KEY, build_full_prompt_from_cfg(cfg_data)),
+            "negative": ", ".join(normalize_tag_list(str(cfg_data.get("negative", DEFAULT_CONFIG["negative"])))),
+            "width": cfg_data.get("width", DEFAULT_CONFIG["width"]),
+            "height": cfg_data.get("height", DEFAULT_CONFIG["height"]),
+            "batch_size": self._latent_batch_size(cfg_data),
+            "seed": seed,
+            "steps": cfg_data.get("steps", DEFAULT_CONFIG["steps"]),
+            "cfg": cfg_data.get("cfg", DEFAULT_CONFIG["cfg"]),
+            "sampler_name": cfg_data.get("sampler_name", DEFAULT_CONFIG["sampler_name"]),
+            "scheduler": cfg_data.get("scheduler", DEFAULT_CONFIG["scheduler"]),
+        })
 
         # Inject multi-LoRA chain
         lora_specs = self._parse_lora_chain(cfg_data)
@@ -850,14 +1159,7 @@ class WorkflowBuilderService:
                     vae_decode_id = nid
                     break
             if vae_decode_id is not None:
-                # Tìm ID mới
-                max_id = 0
-                for k in workflow.keys():
-                    try:
-                        max_id = max(max_id, int(k))
-                    except Exception:
-                        continue
-                output_node_id = str(max_id + 1)
+                output_node_id = FALLBACK_OUTPUT_NODE_ID
                 workflow[output_node_id] = {
                     "inputs": {"images": [vae_decode_id, 0]},
                     "class_type": "ImageToBase64_Yuuka",
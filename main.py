@@ -7,6 +7,8 @@ import logging
 import update
 from werkzeug.serving import WSGIRequestHandler
 from core.dependencies import check_dependencies, install_dependencies # Yuuka: auto-install v1.0
+from core.server_runner import resolve_server_config, run_production_server # Yuuka: production server v1.0
+from core.startup_profiler import startup_profiler # Yuuka: startup profiler v1.0
 
 class No200RequestHandler(WSGIRequestHandler):
     def log_request(self, code='-', size='-'):
@@ -36,12 +38,28 @@ def restart_application():
 
 # Yuuka: auto-install v1.0 - Gỡ bỏ hàm run_install_and_exit()
 
+def run_production_mode(app, run_config):
+    """Chạy server với worker pool giới hạn, keep-alive và drain khi nhận SIGTERM."""
+    import app as app_module
+
+    def _on_drained(clean):
+        app_module._perform_graceful_shutdown('drain' if clean else 'drain-timeout')
+
+    run_production_server(
+        app,
+        run_config,
+        handler=No200RequestHandler,
+        on_server_created=app_module.register_active_server,
+        on_drained=_on_drained,
+    )
+
 def main():
     """Hàm chính, kiểm tra cập nhật trước khi khởi chạy server Flask."""
     print(f"[{time.strftime('%H:%M:%S')}] Yuuka: Gallery Server đang khởi động...")
     
     # Bước 1: Kiểm tra cập nhật code từ Git
-    status, message, dependencies_changed = update.check_for_updates()
+    with startup_profiler.phase("update_check"):
+        status, message, dependencies_changed = update.check_for_updates()
 
     if status == UPDATE_STATUS['ERROR']:
         print(f"Yuuka: Lỗi khi kiểm tra cập nhật: {message}")
@@ -60,7 +78,8 @@ def main():
 
     # Bước 2: Kiểm tra thư viện (quan trọng nhất)
     # Sẽ kiểm tra sau khi pull code hoặc khi khởi động bình thường.
-    missing_deps = check_dependencies() # Yuuka: auto-install v1.0
+    with startup_profiler.phase("dependency_check"):
+        missing_deps = check_dependencies() # Yuuka: auto-install v1.0
     if missing_deps:
         install_dependencies(missing_deps)
         # Sau khi cài đặt, cần khởi động lại để môi trường nhận thư viện mới
@@ -71,14 +90,22 @@ def main():
     print("Yuuka: Phiên bản và thư viện đã đầy đủ. Đang tải dữ liệu và khởi chạy server...")
     
     try:
-        from app import app, initialize_server # Yuuka: main.py compatibility v1.0
+        with startup_profiler.phase("import_app"):
+            from app import app, initialize_server, report_startup_profile, server_config # Yuuka: main.py compatibility v1.0
         
         # Tải dữ liệu và khởi tạo server
-        initialize_server() # Yuuka: main.py compatibility v1.0
+        with startup_profiler.phase("initialize_server"):
+            initialize_server() # Yuuka: main.py compatibility v1.0
+        report_startup_profile()
         
-        # Khởi chạy server Flask
-        #app.run(host='127.0.0.1', debug=False, port=5000, request_handler=No200RequestHandler)
-        app.run(host='0.0.0.0', debug=False, port=5000, request_handler=No200RequestHandler)
+        # Yuuka: production server v1.0 - Chọn chế độ chạy từ data_cache/server_config.json ("server": {"mode": ...})
+        run_config = resolve_server_config(server_config.get('server'))
+        if run_config['mode'] == 'production':
+            run_production_mode(app, run_config)
+        else:
+            # Khởi chạy server Flask
+            #app.run(host='127.0.0.1', debug=False, port=5000, request_handler=No200RequestHandler)
+            app.run(host=run_config['host'], debug=False, port=run_config['port'], request_handler=No200RequestHandler)
 
     except ImportError as e:
         print(f"LỖI NGHIÊM TRỌNG: Không thể import ứng dụng Flask. Lỗi: {e}")
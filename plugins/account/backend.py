@@ -134,13 +134,16 @@ class AccountPlugin:
                 if len(self.core_api._whitelist_users) <= 1:
                     return jsonify({"error": "Cannot revoke the last admin."}), 400
 
-                self.core_api._whitelist_users.remove(target_token)
+                reg_info = self.core_api._whitelist_users.pop(target_token, None) or {}
                 self.core_api.save_data(self.core_api._whitelist_users, "whitelist.json", obfuscated=True)
                 
                 # Chuyển về regular user list nếu chưa có
-                if target_token not in self.core_api._user_data.get("users", []):
-                    self.core_api._user_data.setdefault("users", []).append(target_token)
+                if target_token not in self.core_api._user_data.get("users", {}):
+                    self.core_api._user_data.setdefault("users", {})[target_token] = {
+                        "reg_time": reg_info.get("reg_time", int(time.time()))
+                    }
                     self.core_api.save_data(self.core_api._user_data, "user_data.json", obfuscated=True)
+                self.core_api.invalidate_auth_index()
                 
                 return jsonify({"status": "ok"})
             return jsonify({"error": "User is not an admin."}), 404
@@ -160,21 +163,23 @@ class AccountPlugin:
             if target_token in self.core_api._whitelist_users:
                 if len(self.core_api._whitelist_users) <= 1:
                     return jsonify({"error": "Cannot delete the last admin."}), 400
-                self.core_api._whitelist_users.remove(target_token)
+                self.core_api._whitelist_users.pop(target_token, None)
                 self.core_api.save_data(self.core_api._whitelist_users, "whitelist.json", obfuscated=True)
                 modified = True
 
             if target_token in self.core_api._waitlist_users:
-                self.core_api._waitlist_users.remove(target_token)
+                self.core_api._waitlist_users.pop(target_token, None)
                 self.core_api.save_data(self.core_api._waitlist_users, "waitlist.json", obfuscated=True)
                 modified = True
 
-            regular_users = self.core_api._user_data.get("users", [])
+            regular_users = self.core_api._user_data.get("users", {})
             if target_token in regular_users:
-                regular_users.remove(target_token)
+                regular_users.pop(target_token, None)
                 self.core_api.save_data(self.core_api._user_data, "user_data.json", obfuscated=True)
                 modified = True
 
+            if modified:
+                self.core_api.invalidate_auth_index()
             return jsonify({"status": "ok" if modified else "not_found"})
 
         @self.blueprint.route("/status", methods=["GET"])
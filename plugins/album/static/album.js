@@ -304,7 +304,13 @@ class AlbumComponent {
 
             if (this.state.viewMode === 'album' && this.state.selectedCharacter?.hash === imageData?.character_hash) {
                 const placeholder = document.getElementById(taskId);
-                if (placeholder) {
+                // Yuuka: result cache v1.0 - Kết quả lấy từ cache là ảnh đã có sẵn trong grid
+                const existingCard = eventData?.cached
+                    ? this.contentArea?.querySelector(`.plugin-album__image-card[data-id="${imageData?.id}"]`)
+                    : null;
+                if (placeholder && existingCard) {
+                    placeholder.remove();
+                } else if (placeholder) {
                     const newCard = this._createImageCard?.(imageData);
                     if (newCard) placeholder.replaceWith(newCard);
                 }
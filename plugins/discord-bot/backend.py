@@ -923,7 +923,8 @@ class DiscordBotPlugin:
         return " ".join(str(value or "").replace("_", " ").lower().split())
 
     @classmethod
-    def _build_image_gen_tag_autocomplete_choices(cls, values: list[object], raw_value: object, *, limit: int = 25) -> list[dict]:
+    def _split_image_gen_tag_query(cls, raw_value: object) -> tuple[str, str, set[str]]:
+        """Tách "a, b, ca" thành (phần đã nhập xong "a, b, ", từ đang gõ "ca", {tag đã nhập đã chuẩn hoá})."""
         raw = str(raw_value or "")
         last_comma_index = raw.rfind(",")
         prefix_for_value = raw[:last_comma_index + 1].strip() if last_comma_index != -1 else ""
@@ -934,9 +935,21 @@ class DiscordBotPlugin:
         completed_values = raw[:last_comma_index + 1] if last_comma_index != -1 else ""
         completed_terms = {
             cls._normalize_image_gen_search_term(part)
-            for part in str(completed_values or "").split(",")
+            for part in completed_values.split(",")
             if cls._normalize_image_gen_search_term(part)
         }
+        return prefix_for_value, current_term, completed_terms
+
+    @classmethod
+    def _format_image_gen_tag_choices(
+        cls,
+        values: list[object],
+        prefix_for_value: str,
+        completed_terms: set[str],
+        *,
+        current_term: str = "",
+        limit: int = 25,
+    ) -> list[dict]:
         normalized_current_term = cls._normalize_image_gen_search_term(current_term)
         seen_terms: set[str] = set()
         choices: list[dict] = []
@@ -959,6 +972,26 @@ class DiscordBotPlugin:
                 break
         return choices
 
+    @classmethod
+    def _build_image_gen_tag_autocomplete_choices(cls, values: list[object], raw_value: object, *, limit: int = 25) -> list[dict]:
+        prefix_for_value, current_term, completed_terms = cls._split_image_gen_tag_query(raw_value)
+        return cls._format_image_gen_tag_choices(
+            values, prefix_for_value, completed_terms, current_term=current_term, limit=limit
+        )
+
+    def _build_image_gen_tag_suggest_choices(self, raw_value: object, *, limit: int = 25) -> list[dict]:
+        suggest = getattr(self.core_api, "suggest_tags", None)
+        if not callable(suggest):
+            return self._build_image_gen_tag_autocomplete_choices(self.core_api.get_tag_predictions() or [], raw_value, limit=limit)
+        prefix_for_value, current_term, completed_terms = self._split_image_gen_tag_query(raw_value)
+        # Engine đã lọc tag trùng/đã nhập và sắp theo độ phổ biến, chỉ cần định dạng lại cho Discord.
+        return self._format_image_gen_tag_choices(
+            suggest(current_term, limit, exclude=completed_terms),
+            prefix_for_value,
+            completed_terms,
+            limit=limit,
+        )
+
     @classmethod
     def _build_image_gen_simple_autocomplete_choices(cls, values: list[object], raw_value: object, *, limit: int = 25) -> list[dict]:
         search_text = str(raw_value or "").strip()
@@ -999,11 +1032,9 @@ class DiscordBotPlugin:
     def _resolve_image_gen_character(self, bot_config: dict, explicit_character: object = None) -> tuple[str, str]:
         raw_value = str(explicit_character or "").strip()
         if raw_value:
-            target_key = self._character_lookup_key(raw_value)
-            for item in self.core_api.get_all_characters_list() or []:
-                name = str(item.get("name") or "").strip()
-                if name and self._character_lookup_key(name) == target_key:
-                    return str(item.get("hash") or "").strip(), name
+            item = self.core_api.find_character_by_name(raw_value)
+            if item:
+                return str(item.get("hash") or "").strip(), str(item.get("name") or "").strip()
             return f"custom-{hashlib.md5(raw_value.lower().encode('utf-8')).hexdigest()}", raw_value
 
         defaults = self._build_image_gen_defaults(bot_config)
@@ -1014,10 +1045,6 @@ class DiscordBotPlugin:
             return defaults["character_hash"], str(char_info.get("name") or defaults["character_name"] or defaults["character_hash"]).strip()
         return "", ""
 
-    @staticmethod
-    def _character_lookup_key(value: str) -> str:
-        return str(value or "").strip().lower().replace(":", "").replace("  ", " ")
-
     def _prepare_image_gen_request(self, bot_config: dict, options: dict) -> tuple[dict, str, str]:
         defaults = self._build_image_gen_defaults(bot_config)
         character_hash, character_name = self._resolve_image_gen_character(bot_config, options.get("character"))
@@ -1091,18 +1118,13 @@ class DiscordBotPlugin:
     ) -> list[dict]:
         normalized_field = str(field or "").strip().lower()
         if normalized_field in {"prompt", "outfits", "expression", "action", "context", "quality", "negative"}:
-            return self._build_image_gen_tag_autocomplete_choices(
-                self.core_api.get_tag_predictions() or [],
-                value,
-                limit=limit,
-            )
+            return self._build_image_gen_tag_suggest_choices(value, limit=limit)
 
         if normalized_field == "character":
-            characters = [
-                str((item or {}).get("name") or "").strip()
-                for item in (self.core_api.get_all_characters_list() or [])
-            ]
-            return self._build_image_gen_simple_autocomplete_choices(characters, value, limit=limit)
+            # Chỉ mục nhân vật của CoreAPI đã xếp hạng (exact/prefix/series/gần đúng), không lọc lại theo substring.
+            _, matches = self.core_api.search_characters(value, 0, limit)
+            characters = [str((item or {}).get("name") or "").strip() for item in matches]
+            return self._build_image_gen_simple_autocomplete_choices(characters, "", limit=limit)
 
         if normalized_field in {"lora", "ckpt", "sampler", "scheduler"}:
             defaults = self._build_image_gen_defaults(bot_config)
@@ -185,6 +185,8 @@ class LoraDownloaderPlugin:
             if not ok_remote:
                 return jsonify({"status": "failed", "message": f"Failed to delete on ComfyUI: {err_detail}"}), 502
 
+            self.core_api.comfy_api_client.invalidate_object_info(server_address)
+
             # 2) Remove local metadata entries that reference this filename
             removed_keys = self._delete_local_lora_metadata_by_filename(safe_name)
 
@@ -442,6 +444,9 @@ class LoraDownloaderPlugin:
         if self._tasks.get(task_id, {}).get("status") == "error":
             return
 
+        # Yuuka: object_info catalog v1.0 - File LoRA mới đã nằm trên server, làm mới dropdown LoRA
+        self.core_api.comfy_api_client.invalidate_object_info(server_address)
+
         if model_payload:
             stored = self._store_model_data(model_payload, civitai_url, filename, was_cached)
             if stored and filename:
@@ -116,7 +116,8 @@ class ScenePlugin:
             with self.scene_run_lock:
                 self.scene_run_state['cancel_requested'] = True
             
-            all_status = self.core_api.generation_service.get_user_status(user_hash)
+            # Yuuka: generation event stream v1.0 - peek để không lấy mất event/task của UI
+            all_status = self.core_api.generation_service.peek_user_status(user_hash)
             scene_tasks = {
                 tid: tdata for tid, tdata in all_status.get("tasks", {}).items()
                 if tdata.get("context", {}).get("source") == "scene" and tdata.get("prompt_id")
@@ -307,11 +308,7 @@ class ScenePlugin:
                     last_completed_stage_id = stage['id']
                     continue
 
-                char_info = next(
-                    (c for c in self.core_api.get_all_characters_list()
-                     if str(c['name']).replace(':', '').replace('  ', ' ').strip() == clean_name),
-                    None
-                )
+                char_info = self.core_api.find_character_by_name(clean_name)
 
                 if char_info:
                     char_hash = char_info['hash']
@@ -340,22 +337,7 @@ class ScenePlugin:
                         stage_task_ids.append(task_id)
 
                 if stage_task_ids:
-                    while True:
-                        with self.scene_run_lock:
-                            if self.scene_run_state['cancel_requested']:
-                                for task_id in stage_task_ids:
-                                    self.core_api.generation_service.request_cancellation(user_hash, task_id)
-                                raise InterruptedError("Scene run cancelled during stage wait.")
-                        
-                        current_status = self.core_api.generation_service.get_user_status(user_hash)
-                        running_tasks = current_status.get("tasks", {})
-                        
-                        stage_still_running = any(task_id in running_tasks for task_id in stage_task_ids)
-                        
-                        if not stage_still_running:
-                            break 
-                        
-                        time.sleep(2) 
+                    self._wait_for_stage_tasks(user_hash, stage_task_ids)
 
                 # 5. Cập nhật con trỏ
                 last_completed_stage_id = stage['id']
@@ -369,5 +351,36 @@ class ScenePlugin:
                 self.scene_run_state.update({"is_running": False, "cancel_requested": False})
 
 
+    def _wait_for_stage_tasks(self, user_hash, stage_task_ids):
+        # Yuuka: generation event stream v1.0 - Chờ qua event stream thay vì poll get_user_status mỗi 2s
+        # (get_user_status xoá event/task đã xong nên từng làm UI mất IMAGE_SAVED).
+        generation_service = self.core_api.generation_service
+        pending = set(stage_task_ids)
+        with generation_service.subscribe_events(user_hash) as subscription:
+            while True:
+                with self.scene_run_lock:
+                    if self.scene_run_state['cancel_requested']:
+                        for task_id in stage_task_ids:
+                            generation_service.request_cancellation(user_hash, task_id)
+                        raise InterruptedError("Scene run cancelled during stage wait.")
+
+                tasks = generation_service.peek_user_status(user_hash).get("tasks", {})
+                pending = {tid for tid in pending if tasks.get(tid, {}).get("is_running")}
+                if not pending:
+                    return
+
+                # Chỉ kiểm tra lại khi một task của stage đổi trạng thái chạy (hoặc sau timeout để xét cờ huỷ)
+                deadline = time.time() + 2.0
+                while time.time() < deadline:
+                    event = subscription.get(timeout=max(0.05, deadline - time.time()))
+                    if event is None:
+                        break
+                    data = event.get("data") or {}
+                    if event.get("type") == "task_removed" and data.get("task_id") in pending:
+                        break
+                    if event.get("type") == "task" and data.get("task_id") in pending \
+                            and "is_running" in (data.get("changes") or {}):
+                        break
+
     def get_blueprint(self):
         return self.blueprint, "/api/plugin/scene"
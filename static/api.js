@@ -59,7 +59,18 @@ const api = (() => {
                 });
                 return promise;
             },
+            // Yuuka: batch generation v1.0 - options: { variants: [...], seeds: N | [...], matrix: { field: [...] } }
+            startBatch: (character_hash, generation_config, options = {}, context = {}) => {
+                const promise = _request('/api/core/generate/batch', { method: 'POST', body: { character_hash, generation_config, context, ...options } });
+                promise.then(response => {
+                    Yuuka.events.emit('generation:task_created_locally', response);
+                });
+                return promise;
+            },
+            getBatch: (batch_id) => _request(`/api/core/generate/batch/${batch_id}`),
+            cancelBatch: (batch_id) => _request(`/api/core/generate/batch/${batch_id}/cancel`, { method: 'POST' }),
             getStatus: () => _request('/api/core/generate/status'),
+            getStreamTicket: () => _request('/api/core/generate/stream/ticket', { method: 'POST' }),
             cancel: (task_id) => _request('/api/core/generate/cancel', { method: 'POST', body: { task_id } }),
         },
         images: {
@@ -300,6 +300,9 @@ const state = {
     generationStatus: {
         interval: null,
         knownTasks: new Set(),
+        stream: null, // Yuuka: generation event stream v1.0
+        streamTasks: new Map(),
+        streamFailed: false,
     },
 };
 
@@ -371,62 +374,7 @@ async function switchTab(tabName) {
 async function checkGlobalGenerationStatus() {
     try {
         const status = await api.generation.getStatus();
-        // YUUKA'S FIX: Lấy keys từ `status.tasks` thay vì `status`
-        const serverTaskIds = new Set(Object.keys(status.tasks || {}));
-
-        // Yuuka: ComfyUI connection error handling v1.0
-        Object.values(status.tasks || {}).forEach(task => {
-            if (!task.is_running && task.error_message && state.generationStatus.knownTasks.has(task.task_id)) {
-                let friendlyMessage = "Tạo ảnh thất bại. Lỗi không xác định.";
-                const rawError = task.error_message.startsWith('Lỗi: ') ? task.error_message.substring(5) : task.error_message;
-
-                if (rawError.includes("10061") || rawError.toLowerCase().includes("connection refused")) {
-                    friendlyMessage = "Lỗi tạo ảnh: Không thể kết nối tới ComfyUI.";
-                } else {
-                    friendlyMessage = `Tạo ảnh thất bại: ${rawError.substring(0, 100)}${rawError.length > 100 ? '...' : ''}`;
-                }
-                showError(friendlyMessage);
-                // The task will be removed from knownTasks by the logic below, preventing repeated errors.
-            }
-        });
-
-        // Event cho các task mới bắt đầu
-        serverTaskIds.forEach(taskId => {
-            if (!state.generationStatus.knownTasks.has(taskId)) {
-                state.generationStatus.knownTasks.add(taskId);
-                Yuuka.events.emit('generation:started', status.tasks[taskId]);
-            }
-        });
-
-        // Event cho các task đã hoàn thành hoặc lỗi
-        state.generationStatus.knownTasks.forEach(taskId => {
-            if (!serverTaskIds.has(taskId)) {
-                // Task này đã kết thúc, nhưng chúng ta không có data cuối cùng ở đây.
-                // Plugin sẽ tự dọn dẹp placeholder khi nhận được `image:added` hoặc lỗi
-                state.generationStatus.knownTasks.delete(taskId);
-                Yuuka.events.emit('generation:task_ended', { taskId });
-            }
-        });
-
-        // Phát event update cho tất cả các task đang chạy
-        Yuuka.events.emit('generation:update', status.tasks || {});
-
-        // Xử lý các sự kiện từ backend
-        if (status.events && status.events.length > 0) {
-            status.events.forEach(event => {
-                const { type, data } = event;
-                switch (type) {
-                    case 'IMAGE_SAVED':
-                    case 'VIDEO_SAVED':
-                        Yuuka.events.emit('image:added', data); // Gửi toàn bộ data
-                        break;
-                    case 'IMAGE_DELETED': // Yuuka: event bus v1.0
-                        Yuuka.events.emit('image:deleted', data);
-                        break;
-                    // Các event khác có thể được thêm vào đây
-                }
-            });
-        }
+        const serverTaskIds = processGenerationStatus(status);
 
         // Tự động dừng polling nếu không có task nào
         if (serverTaskIds.size === 0 && state.generationStatus.interval) {
@@ -445,7 +393,162 @@ async function checkGlobalGenerationStatus() {
     }
 }
 
+// Phát các event Yuuka.* từ một trạng thái {tasks, events} (dùng chung cho poller và event stream)
+function processGenerationStatus(status) {
+    // YUUKA'S FIX: Lấy keys từ `status.tasks` thay vì `status`
+    const serverTaskIds = new Set(Object.keys(status.tasks || {}));
+
+    // Yuuka: ComfyUI connection error handling v1.0
+    Object.values(status.tasks || {}).forEach(task => {
+        if (!task.is_running && task.error_message && state.generationStatus.knownTasks.has(task.task_id)) {
+            let friendlyMessage = "Tạo ảnh thất bại. Lỗi không xác định.";
+            const rawError = task.error_message.startsWith('Lỗi: ') ? task.error_message.substring(5) : task.error_message;
+
+            if (rawError.includes("10061") || rawError.toLowerCase().includes("connection refused")) {
+                friendlyMessage = "Lỗi tạo ảnh: Không thể kết nối tới ComfyUI.";
+            } else {
+                friendlyMessage = `Tạo ảnh thất bại: ${rawError.substring(0, 100)}${rawError.length > 100 ? '...' : ''}`;
+            }
+            showError(friendlyMessage);
+            // The task will be removed from knownTasks by the logic below, preventing repeated errors.
+        }
+    });
+
+    // Event cho các task mới bắt đầu
+    serverTaskIds.forEach(taskId => {
+        if (!state.generationStatus.knownTasks.has(taskId)) {
+            state.generationStatus.knownTasks.add(taskId);
+            Yuuka.events.emit('generation:started', status.tasks[taskId]);
+        }
+    });
+
+    // Event cho các task đã hoàn thành hoặc lỗi
+    state.generationStatus.knownTasks.forEach(taskId => {
+        if (!serverTaskIds.has(taskId)) {
+            // Task này đã kết thúc, nhưng chúng ta không có data cuối cùng ở đây.
+            // Plugin sẽ tự dọn dẹp placeholder khi nhận được `image:added` hoặc lỗi
+            state.generationStatus.knownTasks.delete(taskId);
+            Yuuka.events.emit('generation:task_ended', { taskId });
+        }
+    });
+
+    // Phát event update cho tất cả các task đang chạy
+    Yuuka.events.emit('generation:update', status.tasks || {});
+
+    // Xử lý các sự kiện từ backend
+    if (status.events && status.events.length > 0) {
+        status.events.forEach(event => {
+            const { type, data } = event;
+            switch (type) {
+                case 'IMAGE_SAVED':
+                case 'VIDEO_SAVED':
+                    Yuuka.events.emit('image:added', data); // Gửi toàn bộ data
+                    break;
+                case 'IMAGE_DELETED': // Yuuka: event bus v1.0
+                    Yuuka.events.emit('image:deleted', data);
+                    break;
+                // Các event khác có thể được thêm vào đây
+            }
+        });
+    }
+
+    return serverTaskIds;
+}
+
+// Yuuka: generation event stream v1.0 - Nhận trạng thái qua Server-Sent Events, chỉ gửi khi có thay đổi.
+// EventSource không gửi được header nên mỗi lần mở luồng xin một vé dùng một lần (POST có Authorization),
+// token thật không nằm trong URL. Lỗi xác thực / không hỗ trợ thì quay về polling.
+function startGenerationStream() {
+    if (state.generationStatus.stream || typeof EventSource === 'undefined') return false;
+    // Giữ chỗ trong lúc xin vé để không mở hai luồng song song
+    state.generationStatus.stream = { close() {} };
+    openGenerationStream(null);
+    return true;
+}
+
+function stopGenerationStream() {
+    console.warn('[Core Stream] Generation event stream closed. Falling back to polling.');
+    state.generationStatus.stream = null;
+    state.generationStatus.streamFailed = true;
+    startGlobalPolling();
+}
+
+async function openGenerationStream(since) {
+    let ticket;
+    try {
+        ({ ticket } = await api.generation.getStreamTicket());
+    } catch (e) {
+        stopGenerationStream();
+        return;
+    }
+    const params = new URLSearchParams({ ticket });
+    if (since) params.set('since', since);
+    const source = new EventSource(`/api/core/generate/stream?${params}`);
+    const tasks = state.generationStatus.streamTasks;
+    state.generationStatus.stream = source;
+    let lastEventId = since;
+    let received = false;
+
+    const flush = (events = []) => {
+        processGenerationStatus({ tasks: Object.fromEntries(tasks), events });
+        // Task đã kết thúc chỉ cần hiển thị một lần (giống /status xoá task sau khi trả về)
+        tasks.forEach((task, taskId) => {
+            if (task.is_running) return;
+            tasks.delete(taskId);
+            if (state.generationStatus.knownTasks.delete(taskId)) {
+                Yuuka.events.emit('generation:task_ended', { taskId });
+            }
+        });
+    };
+    const parse = (event) => {
+        received = true;
+        if (event.lastEventId) lastEventId = event.lastEventId;
+        try { return JSON.parse(event.data); } catch (e) { return null; }
+    };
+
+    source.addEventListener('snapshot', (event) => {
+        const data = parse(event);
+        if (!data) return;
+        tasks.clear();
+        Object.values(data.tasks || {}).forEach(task => tasks.set(task.task_id, task));
+        flush();
+    });
+    source.addEventListener('task', (event) => {
+        const data = parse(event);
+        if (!data) return;
+        const current = tasks.get(data.task_id);
+        if (!current && !data.created) return; // Task đã hiển thị xong trước đó
+        tasks.set(data.task_id, { ...(current || {}), ...(data.changes || {}) });
+        flush();
+    });
+    source.addEventListener('task_removed', (event) => {
+        const data = parse(event);
+        if (data && tasks.delete(data.task_id)) flush();
+    });
+    ['IMAGE_SAVED', 'VIDEO_SAVED'].forEach(type => {
+        source.addEventListener(type, (event) => {
+            const data = parse(event);
+            if (data) flush([{ type, data }]);
+        });
+    });
+    source.onerror = () => {
+        // Vé đã dùng nên không để trình duyệt tự nối lại bằng URL cũ: xin vé mới và nối tiếp từ seq cuối.
+        // Chưa nhận được gì (vé bị từ chối, server không hỗ trợ) -> quay về polling thay vì thử mãi.
+        source.close();
+        if (state.generationStatus.stream !== source) return;
+        if (!received) {
+            stopGenerationStream();
+            return;
+        }
+        state.generationStatus.stream = { close() {} };
+        setTimeout(() => openGenerationStream(lastEventId), 1000);
+    };
+    console.log('[Core Stream] Listening for generation events...');
+}
+
 function startGlobalPolling() {
+    if (state.generationStatus.stream) return;
+    if (!state.generationStatus.streamFailed && startGenerationStream()) return;
     if (state.generationStatus.interval) return;
     console.log('[Core Poller] Starting global generation status polling...');
     state.generationStatus.interval = setInterval(checkGlobalGenerationStatus, 1500);
@@ -463,8 +566,8 @@ async function initializeAppUI() {
 
     // YUUKA: Bắt đầu polling nếu có bất kỳ plugin nào yêu cầu thông qua cờ trong manifest.
     if (activePluginsUI.some(p => p.ui?.needs_generation_poller)) { // Yuuka: architecture-fix v1.0
-        await checkGlobalGenerationStatus(); // Chạy lần đầu ngay lập tức
-        startGlobalPolling();
+        startGlobalPolling(); // Ưu tiên event stream (snapshot đầu tiên thay cho lần poll ngay lập tức)
+        if (!state.generationStatus.stream) await checkGlobalGenerationStatus();
     }
     // Lắng nghe event để bắt đầu polling nếu một task mới được tạo ra
     Yuuka.events.on('generation:started', startGlobalPolling);
@@ -0,0 +1,68 @@
+"""
+Micro-benchmark chi phí xác thực token mỗi request.
+
+    python tools/bench_auth.py --users 2000 --iterations 200000
+
+So sánh cách cũ (duyệt list + SHA-256 mỗi request) với AuthIndex (một lần tra dict).
+"""
+import argparse
+import hashlib
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from core.auth_index import AuthIndex, ROLE_ADMIN, ROLE_USER, normalize_token_collection
+
+
+def legacy_verify(token, whitelist, users):
+    if token in whitelist or token in users:
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()
+    raise Exception("Invalid token.")
+
+
+def indexed_verify(token, index):
+    entry = index.lookup(token)
+    if entry is not None and entry[0] & (ROLE_ADMIN | ROLE_USER):
+        return entry[1]
+    raise Exception("Invalid token.")
+
+
+def _time_per_call(func, tokens, iterations):
+    count = len(tokens)
+    started = time.perf_counter()
+    for i in range(iterations):
+        func(tokens[i % count])
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Yuuka auth overhead benchmark")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--admins", type=int, default=3)
+    parser.add_argument("--iterations", type=int, default=200000)
+    args = parser.parse_args()
+
+    whitelist_list = [str(uuid.uuid4()) for _ in range(args.admins)]
+    users_list = [str(uuid.uuid4()) for _ in range(args.users)]
+    # Token ở cuối list là trường hợp xấu nhất cho định dạng list cũ
+    probe_tokens = users_list[-100:] + whitelist_list
+
+    legacy_us = _time_per_call(lambda t: legacy_verify(t, whitelist_list, users_list), probe_tokens, args.iterations)
+
+    whitelist = normalize_token_collection(whitelist_list)
+    users = normalize_token_collection(users_list)
+    index = AuthIndex(lambda: (whitelist, {}, users))
+    indexed_verify(probe_tokens[0], index)  # dựng index trước khi đo
+    indexed_us = _time_per_call(lambda t: indexed_verify(t, index), probe_tokens, args.iterations)
+
+    print(f"users={args.users} admins={args.admins} iterations={args.iterations}")
+    print(f"  legacy list + sha256 : {legacy_us:8.3f} us/request")
+    print(f"  AuthIndex lookup     : {indexed_us:8.3f} us/request ({legacy_us / indexed_us:.1f}x)")
+    print(f"  index stats          : {index.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+Load test nhỏ cho chế độ server development vs production.
+
+    python tools/load_test_server.py                       # so sánh 2 chế độ với app mẫu
+    python tools/load_test_server.py --url http://127.0.0.1:5000/api/tags --token <TOKEN>
+
+Không cần thư viện ngoài; dùng http.client với keep-alive cho mỗi client.
+"""
+import argparse
+import http.client
+import os
+import sys
+import threading
+import time
+from urllib.parse import urlparse
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+
+def _client_loop(host, port, path, headers, deadline, keep_alive, results, lock):
+    ok = errors = 0
+    latencies = []
+    conn = None
+    while time.time() < deadline:
+        try:
+            if conn is None:
+                conn = http.client.HTTPConnection(host, port, timeout=10)
+            started = time.perf_counter()
+            conn.request("GET", path, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            latencies.append(time.perf_counter() - started)
+            if response.status < 400:
+                ok += 1
+            else:
+                errors += 1
+            if not keep_alive or response.will_close:
+                conn.close()
+                conn = None
+        except Exception:
+            errors += 1
+            if conn is not None:
+                conn.close()
+            conn = None
+    if conn is not None:
+        conn.close()
+    with lock:
+        results["ok"] += ok
+        results["errors"] += errors
+        results["latencies"].extend(latencies)
+
+
+def run_load(url, *, clients, duration, token=None, keep_alive=True):
+    parsed = urlparse(url)
+    path = parsed.path or "/"
+    if parsed.query:
+        path += "?" + parsed.query
+    headers = {"Accept-Encoding": "gzip"}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    results = {"ok": 0, "errors": 0, "latencies": []}
+    lock = threading.Lock()
+    deadline = time.time() + duration
+    threads = [
+        threading.Thread(
+            target=_client_loop,
+            args=(parsed.hostname, parsed.port or 80, path, headers, deadline, keep_alive, results, lock),
+            daemon=True,
+        )
+        for _ in range(clients)
+    ]
+    started = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = max(time.time() - started, 1e-6)
+    latencies = sorted(results["latencies"])
+
+    def _pct(p):
+        if not latencies:
+            return None
+        return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 2)
+
+    return {
+        "requests": results["ok"],
+        "errors": results["errors"],
+        "req_per_sec": round(results["ok"] / elapsed, 1),
+        "p50_ms": _pct(0.50),
+        "p95_ms": _pct(0.95),
+    }
+
+
+def _sample_app():
+    import json
+    from flask import Flask, Response
+
+    app = Flask("load_test_sample")
+    payload = json.dumps([{"id": i, "name": f"character_{i}", "tags": ["a", "b", "c"]} for i in range(500)])
+
+    @app.route("/sample")
+    def sample():
+        time.sleep(0.005)  # giả lập I/O nhỏ (đọc file JSON, gọi ComfyUI ...)
+        return Response(payload, mimetype="application/json")
+
+    return app
+
+
+def _serve_in_background(mode, app, port, workers):
+    from werkzeug.serving import make_server, WSGIRequestHandler
+    from core.server_runner import PooledWSGIServer, build_request_handler
+
+    if mode == "production":
+        handler = build_request_handler(WSGIRequestHandler, keep_alive=True, request_timeout=30)
+        handler.log_request = lambda *a, **k: None
+        server = PooledWSGIServer("127.0.0.1", port, app, worker_threads=workers, handler=handler)
+    else:
+        handler = type("QuietHandler", (WSGIRequestHandler,), {"log_request": lambda *a, **k: None})
+        server = make_server("127.0.0.1", port, app, threaded=True, request_handler=handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Yuuka server load test")
+    parser.add_argument("--url", help="Target URL; nếu bỏ trống sẽ so sánh development vs production với app mẫu.")
+    parser.add_argument("--token", help="Bearer token cho các API cần xác thực.")
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--workers", type=int, default=32, help="worker_threads cho chế độ production (app mẫu).")
+    parser.add_argument("--no-keep-alive", action="store_true")
+    args = parser.parse_args()
+    keep_alive = not args.no_keep_alive
+
+    if args.url:
+        print(run_load(args.url, clients=args.clients, duration=args.duration, token=args.token, keep_alive=keep_alive))
+        return
+
+    app = _sample_app()
+    for index, mode in enumerate(("development", "production")):
+        port = 5810 + index
+        server = _serve_in_background(mode, app, port, args.workers)
+        try:
+            # Dev server nói HTTP/1.0 nên keep-alive chỉ có tác dụng ở production.
+            stats = run_load(
+                f"http://127.0.0.1:{port}/sample",
+                clients=args.clients,
+                duration=args.duration,
+                keep_alive=keep_alive,
+            )
+        finally:
+            server.shutdown()
+            server.server_close()
+        print(f"[{mode:>11}] {stats}")
+
+
+if __name__ == "__main__":
+    main()